@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Load benchmark that drives every route in server.py with realistic filter mixes.
+
+Start the server against a generated dataset first (see generate_data.py):
+
+    DATABASE_URL=postgresql://postgres@localhost/nyc_bench python server.py --threaded
+    python bench_routes.py --duration 60 --concurrency 16
+
+Throughput and latency percentiles per route are written to
+bench_results/<label>.json (label defaults to the current git commit), so two
+runs can be compared with --compare.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+
+from generate_data import AGE_GROUPS, BOROUGHS, CRIME_TYPES, GENDERS, JURISDICTIONS, RACES, Weighted
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+
+ALL_ZIPS = [z for _, _, zips in BOROUGHS.values() for z in zips]
+WINDOWS = Weighted([("90d", 10), ("1y", 25), ("5y", 20), ("10y", 15), ("all", 30)])
+
+
+def _maybe(rng, p, value):
+    return value if rng.random() < p else None
+
+
+def _query(path, params):
+    items = [(k, v) for k, v in params if v not in (None, "")]
+    return path + ("?" + urlencode(items) if items else "")
+
+
+# ------------------------------------------------------------
+# Request builders: each returns (method, path, body)
+# ------------------------------------------------------------
+def list_filters(rng):
+    params = [
+        ("lawcategory", _maybe(rng, 0.2, rng.choice(["Felony", "Misdemeanor", "Violation"]))),
+        ("status", _maybe(rng, 0.2, rng.choice(["Open", "Closed"]))),
+        ("severity", _maybe(rng, 0.15, rng.choice(["low", "medium", "high"]))),
+        ("crime_type", _maybe(rng, 0.1, rng.choice(["assault", "larceny", "robbery", "burglary"]))),
+        ("postal_code", _maybe(rng, 0.15, rng.choice(ALL_ZIPS))),
+        ("victim_gender", _maybe(rng, 0.1, rng.choice(["Male", "Female"]))),
+        ("victim_age_grp", _maybe(rng, 0.08, rng.choice([a for a, _ in AGE_GROUPS]))),
+        ("victim_ethnicity", _maybe(rng, 0.08, rng.choice([r for r, _ in RACES]))),
+    ]
+    if rng.random() < 0.35:
+        params += [("borough", b) for b in rng.sample(list(BOROUGHS), rng.randint(1, 2))]
+    if rng.random() < 0.25:
+        year = rng.randint(2008, 2025)
+        params += [("date_start", f"{year}-01-01"), ("date_end", f"{year}-12-31")]
+    # most users stay on the first pages
+    params.append(("page", rng.choice([1] * 8 + [2, 3, rng.randint(4, 200)])))
+    return params
+
+
+def incidents_list(rng, ctx):
+    return "GET", _query("/incidents", list_filters(rng)), None
+
+
+def admin_list(rng, ctx):
+    return "GET", _query("/admin", list_filters(rng)), None
+
+
+def incident_detail(rng, ctx):
+    return "GET", f"/incident/{rng.randint(1, ctx['max_incident_id'])}", None
+
+
+def admin_detail(rng, ctx):
+    return "GET", f"/admin/{rng.randint(1, ctx['max_incident_id'])}", None
+
+
+def analysis(rng, ctx):
+    # the page loads each section from its own URL with only that section's filters
+    section = rng.choice(["top10", "custom", "trend"])
+    if section == "top10":
+        params = [("window", WINDOWS.pick(rng)),
+                  ("borough", _maybe(rng, 0.3, rng.choice(list(BOROUGHS)))),
+                  ("postal_code", _maybe(rng, 0.1, rng.choice(ALL_ZIPS)))]
+    elif section == "custom" and rng.random() < 0.4:
+        params = [("custom_postal_code", _maybe(rng, 0.7, rng.choice(ALL_ZIPS))),
+                  ("custom_gender", _maybe(rng, 0.6, rng.choice([g for g, _ in GENDERS]))),
+                  ("custom_age_group", _maybe(rng, 0.5, rng.choice([a for a, _ in AGE_GROUPS]))),
+                  ("custom_ethnicity", _maybe(rng, 0.4, rng.choice([r for r, _ in RACES])))]
+    elif section == "trend" and rng.random() < 0.4:
+        y0 = rng.randint(1995, 2020)
+        params = [("year_from", y0), ("year_to", rng.randint(y0, 2025)),
+                  ("crime_type_id", _maybe(rng, 0.6, rng.randint(1, len(CRIME_TYPES)))),
+                  ("trend_borough", _maybe(rng, 0.5, rng.choice(list(BOROUGHS))))]
+    else:
+        params = []
+    return "GET", _query(f"/incidents/analysis/{section}", params), None
+
+
+def recommendations(rng, ctx):
+    params = [("postal_code", _maybe(rng, 0.5, rng.choice(ALL_ZIPS))),
+              ("gender", _maybe(rng, 0.7, rng.choice([g for g, _ in GENDERS]))),
+              ("age_grp", _maybe(rng, 0.6, rng.choice([a for a, _ in AGE_GROUPS]))),
+              ("race", _maybe(rng, 0.5, rng.choice([r for r, _ in RACES])))]
+    return "GET", _query("/recommendations", params), None
+
+
+def admin_new_form(rng, ctx):
+    return "GET", "/admin/new", None
+
+
+def admin_system_form(rng, ctx):
+    return "GET", "/admin/system", None
+
+
+def admin_new_submit(rng, ctx):
+    borough = rng.choice(list(BOROUGHS))
+    lat, lon = BOROUGHS[borough][1]
+    form = {
+        "occurred_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "status": "Open",
+        "jur_id": str(rng.choice(JURISDICTIONS)[0]),
+        "crime_type_id": str(rng.randint(1, len(CRIME_TYPES))),
+        "borough": borough,
+        "postal_code": rng.choice(BOROUGHS[borough][2]),
+        "latitude": f"{lat + rng.gauss(0, 0.02):.6f}",
+        "longitude": f"{lon + rng.gauss(0, 0.02):.6f}",
+        "suspect1_gender": "Male", "suspect1_age_grp": "25-44",
+        "victim1_gender": rng.choice(["Male", "Female"]), "victim1_age_grp": "25-44",
+        "victim1_injury": "None",
+    }
+    return "POST", "/admin/new", urlencode(form)
+
+
+# (name, weight, builder) -- read traffic dominates, as in production
+ROUTES = [
+    ("incidents", 35, incidents_list),
+    ("incident_detail", 20, incident_detail),
+    ("incidents_analysis", 12, analysis),
+    ("recommendations", 10, recommendations),
+    ("admin", 10, admin_list),
+    ("admin_detail", 8, admin_detail),
+    ("admin_new", 2, admin_new_form),
+    ("admin_system", 1, admin_system_form),
+]
+WRITE_ROUTES = [("admin_new_submit", 2, admin_new_submit)]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, errors, elapsed):
+    lat = sorted(latencies)
+    return {
+        "count": len(lat),
+        "errors": errors,
+        "rps": round(len(lat) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(lat) / len(lat) * 1000, 2) if lat else None,
+        **{f"p{p}_ms": round(percentile(lat, p) * 1000, 2) if lat else None for p in (50, 90, 95, 99)},
+        "max_ms": round(lat[-1] * 1000, 2) if lat else None,
+    }
+
+
+class Worker(threading.Thread):
+    def __init__(self, idx, args, routes, ctx, deadline, warmup_until):
+        super().__init__(daemon=True)
+        self.rng = random.Random(args.seed * 1000 + idx)
+        self.args, self.routes, self.ctx = args, routes, ctx
+        self.deadline, self.warmup_until = deadline, warmup_until
+        self.results = {}  # route -> {"lat": [...], "errors": n}, merged after join
+        url = urlsplit(args.base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.conn = None
+
+    def _request(self, method, path, body):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.args.timeout)
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            resp.read()
+            return resp.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            return None
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            name, builder = self.routes.pick(self.rng)
+            method, path, body = builder(self.rng, self.ctx)
+            t0 = time.perf_counter()
+            status = self._request(method, path, body)
+            dt = time.perf_counter() - t0
+            if time.monotonic() < self.warmup_until:
+                continue
+            bucket = self.results.setdefault(name, {"lat": [], "errors": 0})
+            # 404 on a random detail id is a valid (deleted/missing) outcome; redirects follow a POST
+            if status is None or status >= 500:
+                bucket["errors"] += 1
+            else:
+                bucket["lat"].append(dt)
+
+
+def git_label():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_table(report, baseline=None):
+    header = f"{'route':<22}{'count':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}"
+    if baseline:
+        header += f"{'p50 Δ%':>9}{'rps Δ%':>9}"
+    print(header)
+    rows = list(report["routes"].items()) + [("TOTAL", report["overall"])]
+    for name, s in rows:
+        line = (f"{name:<22}{s['count']:>8}{s['errors']:>6}{s['rps'] or 0:>9.1f}"
+                f"{s['p50_ms'] or 0:>9.1f}{s['p90_ms'] or 0:>9.1f}{s['p99_ms'] or 0:>9.1f}")
+        if baseline:
+            b = baseline["overall"] if name == "TOTAL" else baseline["routes"].get(name)
+            if b and b.get("p50_ms") and b.get("rps") and s.get("p50_ms"):
+                line += f"{100 * (s['p50_ms'] / b['p50_ms'] - 1):>+9.1f}{100 * (s['rps'] / b['rps'] - 1):>+9.1f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route load benchmark for server.py")
+    parser.add_argument("--base-url", default="http://localhost:8111")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=4111)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--max-incident-id", type=int, default=1_000_000,
+                        help="detail pages pick ids in [1, N]; match generate_data.py --incidents")
+    parser.add_argument("--include-writes", action="store_true", help="also POST new incidents")
+    parser.add_argument("--only", help="comma-separated route names to drive")
+    parser.add_argument("--label", default=None, help="results file name (default: git commit)")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    routes = ROUTES + (WRITE_ROUTES if args.include_writes else [])
+    if args.only:
+        wanted = set(args.only.split(","))
+        routes = [r for r in routes if r[0] in wanted]
+    picker = Weighted([((name, builder), w) for name, w, builder in routes])
+    results = {name: {"lat": [], "errors": 0} for name, _, _ in routes}
+    ctx = {"max_incident_id": args.max_incident_id}
+
+    start = time.monotonic()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    workers = [Worker(i, args, picker, ctx, deadline, warmup_until) for i in range(args.concurrency)]
+    print(f"Driving {args.base_url} with {args.concurrency} clients for {args.duration:g}s "
+          f"(+{args.warmup:g}s warmup) ...")
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+        for name, r in w.results.items():
+            results[name]["lat"].extend(r["lat"])
+            results[name]["errors"] += r["errors"]
+
+    all_lat = [x for r in results.values() for x in r["lat"]]
+    report = {
+        "label": args.label or git_label(),
+        "commit": git_label(),
+        "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "label")},
+        "overall": summarize(all_lat, sum(r["errors"] for r in results.values()), args.duration),
+        "routes": {name: summarize(r["lat"], r["errors"], args.duration) for name, r in results.items()},
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, f"{report['label']}.json")
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(report, baseline)
+    print(f"\nresults written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
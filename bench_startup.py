@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for server.py.
+
+Starts fresh Python processes and times each startup step: importing
+server, create_app(), boot() (template precompilation, plus pool and
+reference-data warm-up with --warm), and the first request to a few routes
+through the Flask test client. Each run is repeated with an empty template
+bytecode cache ("cold") and with the cache left by a previous start
+("cached"), which is what a new instance sees after a deploy vs. a restart.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 5 --warm --max-ready-ms 800   # exit 1 if slower
+
+Medians are written to bench_results/startup-<label>.json (label defaults to
+the current git commit) and can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_routes import RESULTS_DIR, git_label
+
+DEFAULT_BENCH_URI = os.environ.get("BENCH_DATABASE_URL", "postgresql://postgres@localhost/nyc_bench")
+DEFAULT_PATHS = ["/incident/1", "/admin/new", "/admin/system", "/incidents?status=Open"]
+
+
+def probe(paths, warm):
+    """Runs inside the measured process; prints one JSON line of timings (ms)."""
+    result = {}
+    t0 = time.perf_counter()
+    import server
+    result["import_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    app = server.create_app()
+    result["create_app_ms"] = (time.perf_counter() - t0) * 1000
+    result.update(server.boot(warm=warm))
+    result["ready_ms"] = sum(result[k] for k in ("import_ms", "create_app_ms", "templates_ms", "warm_up_ms")
+                             if k in result)
+
+    client = app.test_client()
+    for path in paths:
+        t0 = time.perf_counter()
+        response = client.get(path)
+        result[f"first {path}"] = (time.perf_counter() - t0) * 1000
+        if response.status_code >= 500:
+            result.setdefault("errors", []).append(f"{path}: HTTP {response.status_code}")
+    print(json.dumps(result))
+
+
+def run_once(database_url, cache_dir, paths, warm):
+    env = dict(os.environ, DATABASE_URL=database_url, JINJA_CACHE_DIR=cache_dir)
+    cmd = [sys.executable, os.path.abspath(__file__), "--probe", *(["--warm"] if warm else [])]
+    for path in paths:
+        cmd += ["--path", path]
+    t0 = time.perf_counter()
+    out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    # interpreter start-up and shutdown included
+    result["process_ms"] = (time.perf_counter() - t0) * 1000
+    return result
+
+
+def median_of(runs):
+    keys = [k for k in runs[0] if k != "errors"]
+    summary = {k: round(statistics.median(r[k] for r in runs), 1) for k in keys}
+    errors = sorted({e for r in runs for e in r.get("errors", [])})
+    if errors:
+        summary["errors"] = errors
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start benchmark for server.py")
+    parser.add_argument("--database-url", default=DEFAULT_BENCH_URI)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", action="append", dest="paths", help="route to request once (repeatable)")
+    parser.add_argument("--warm", action="store_true", help="boot with pool and reference-data warm-up")
+    parser.add_argument("--max-ready-ms", type=float,
+                        help="fail when the median cached-start ready_ms exceeds this budget")
+    parser.add_argument("--label", default=None, help="results file name (default: git commit)")
+    parser.add_argument("--compare", help="previous bench_results/startup-*.json to diff against")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    paths = args.paths or DEFAULT_PATHS
+
+    if args.probe:
+        probe(paths, args.warm)
+        return 0
+
+    report = {"label": args.label or git_label(), "commit": git_label(), "warm": args.warm,
+              "runs": args.runs, "paths": paths}
+    scratch = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        cold, cached = [], []
+        cached_dir = os.path.join(scratch, "cached")
+        run_once(args.database_url, cached_dir, paths, args.warm)  # fills the shared cache
+        for i in range(args.runs):
+            cold.append(run_once(args.database_url, os.path.join(scratch, f"cold{i}"), paths, args.warm))
+            cached.append(run_once(args.database_url, cached_dir, paths, args.warm))
+        report["cold"] = median_of(cold)
+        report["cached"] = median_of(cached)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(f"{'step (median ms)':32s} {'cold':>9s} {'cached':>9s}" + (f" {'Δ cached':>9s}" if baseline else ""))
+    for key in report["cached"]:
+        if key == "errors":
+            continue
+        line = f"{key:32s} {report['cold'].get(key, 0):9.1f} {report['cached'][key]:9.1f}"
+        if baseline and baseline.get("cached", {}).get(key):
+            line += f" {report['cached'][key] / baseline['cached'][key] - 1:+9.0%}"
+        print(line)
+    for error in report["cached"].get("errors", []):
+        print(f"error: {error}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, f"startup-{report['label']}.json")
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {out_path}")
+
+    if args.max_ready_ms is not None and report["cached"]["ready_ms"] > args.max_ready_ms:
+        print(f"FAIL: ready_ms {report['cached']['ready_ms']:.0f} > budget {args.max_ready_ms:.0f}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
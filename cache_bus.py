@@ -0,0 +1,271 @@
+"""
+Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+
+The data_version triggers (migrations/005_cache_invalidation_notify.sql)
+publish one compact event per changing statement on the channel
+cache_invalidation: the new data version, the table, and the touched
+incidents as (incident_id, borough, postal_code). Every server process runs
+one CacheBus: a daemon thread holding its own LISTEN connection that
+
+  * keeps the process's copy of the data version (global and per incident)
+    current, so conditional GETs are answered without a query, and
+  * hands each event to the subscribed callbacks, which evict whatever
+    their caches hold for that table / incident / borough / postal code.
+
+Events carry consecutive version numbers. A jump means events were missed
+and every subscriber is flushed instead, as after a reconnect: while the
+connection is down nothing is trusted (live is False, callers go to the
+database) and on reconnect the current version is read back. If it moved
+while we were away, everything is flushed. A heartbeat query on an idle
+connection catches dead sockets and lost events the same way.
+
+Configuration (environment, read by server.load_config):
+    CACHE_BUS                 1 (default) to run the listener, 0 to disable
+    CACHE_BUS_HEARTBEAT       seconds of silence before a heartbeat query (default 30)
+    CACHE_BUS_INCIDENTS       per-incident versions kept in memory (default 10000)
+"""
+import json
+import logging
+import select
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+CHANNEL = "cache_invalidation"
+RECONNECT_DELAYS = (0.5, 1, 2, 5, 10, 30)
+
+log = logging.getLogger("cache_bus")
+
+# table: changed table, or "*" (everything); rows: ((incident_id, borough, postal_code), ...)
+# or None when the statement touched too many incidents to list (or the table has none)
+ChangeEvent = namedtuple("ChangeEvent", "version changed_at table rows")
+
+INCIDENT_TABLES = frozenset(("incident", "victim", "suspect", "classified_as", "suspect_clue"))
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(float(epoch), timezone.utc)
+
+
+class CacheBus:
+    def __init__(self, database_url, heartbeat=30.0, max_incidents=10000):
+        self.database_url = database_url
+        self.heartbeat = heartbeat
+        self.max_incidents = max_incidents
+
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._version = None               # (version, changed_at) while live, else None
+        self._seen = None                  # last version seen, kept across reconnects
+        self._incidents = OrderedDict()    # incident_id -> (version, changed_at), LRU
+        self._cleared_at = 0               # version of the last clear of _incidents
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {"events": 0, "flushes": 0, "reconnects": 0, "gaps": 0}
+
+    # ---------- subscribers ----------
+    def subscribe(self, callback):
+        """callback(event) for each change; callback(None) means "flush everything"."""
+        self._subscribers.append(callback)
+        return callback
+
+    def _publish(self, event):
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception:
+                log.exception("cache invalidation callback %r failed", callback)
+
+    def flush(self, reason, version):
+        """Clear everything as of data version version and tell the subscribers."""
+        with self._lock:
+            self._incidents.clear()
+            self._cleared_at = max(self._cleared_at, version)
+        self.stats["flushes"] += 1
+        log.info("flushing all caches (%s)", reason)
+        self._publish(None)
+
+    # ---------- local data version ----------
+    @property
+    def live(self):
+        return self._version is not None
+
+    def data_version(self):
+        """(version, changed_at) as last published, or None when not listening."""
+        return self._version
+
+    def incident_version(self, incident_id):
+        """(version, changed_at) of one incident, or None when unknown or not listening."""
+        if self._version is None:
+            return None
+        with self._lock:
+            hit = self._incidents.get(incident_id)
+            if hit is not None:
+                self._incidents.move_to_end(incident_id)
+            return hit
+
+    def remember_incident(self, incident_id, version, changed_at, read_at):
+        """Store a version read from the database; never moves an incident backwards.
+
+        read_at is the data version the read saw. A read from before the last
+        clear may miss a write the clear stood for (a statement too big to
+        list its incidents), so it is not stored.
+        """
+        if self._version is None:
+            return
+        with self._lock:
+            if read_at < self._cleared_at:
+                return
+            hit = self._incidents.get(incident_id)
+            if hit is None or hit[0] < version:
+                self._incidents[incident_id] = (version, changed_at)
+                self._incidents.move_to_end(incident_id)
+                while len(self._incidents) > self.max_incidents:
+                    self._incidents.popitem(last=False)
+
+    # ---------- listener ----------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _connect(self):
+        # A dedicated connection outside the request pool; the engine only
+        # translates DATABASE_URL into driver connect arguments.
+        engine = create_engine(self.database_url, poolclass=NullPool)
+        cargs, cparams = engine.dialect.create_connect_args(engine.url)
+        conn = engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _read_version(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT version, changed_at FROM data_version")
+            return cur.fetchone()
+
+    def _run(self):
+        attempt = 0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                # LISTEN first, then read the version: anything committed after
+                # this read arrives as an event.
+                version, changed_at = self._read_version(conn)
+                if self._seen is not None and version != self._seen:
+                    self.flush("reconnected at version %d, last event %d" % (version, self._seen), version)
+                self._set_version(version, changed_at)
+                if attempt:
+                    self.stats["reconnects"] += 1
+                    log.info("listening again on %s at version %d", CHANNEL, version)
+                attempt = 0
+                self._drain(conn)
+                self._listen(conn)
+            except Exception as e:
+                self._version = None  # stop trusting local versions until reconnected
+                if "data_version" in str(e) and "does not exist" in str(e):
+                    log.warning("cache bus disabled: migrations 004/005 are not applied")
+                    return
+                delay = RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)]
+                log.warning("cache bus connection lost (%s); retrying in %ss", e, delay)
+                attempt += 1
+                self._stop.wait(delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+        self._version = None
+
+    def _set_version(self, version, changed_at):
+        self._seen = version
+        self._version = (version, changed_at)
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([conn], [], [], self.heartbeat)
+            if ready:
+                conn.poll()
+                self._drain(conn)
+                continue
+            # Quiet for a while: make sure the socket is alive and that no
+            # event went missing (the read also delivers pending notifies).
+            version, changed_at = self._read_version(conn)
+            self._drain(conn)
+            if version != self._seen:
+                self.stats["gaps"] += 1
+                self.flush("heartbeat saw version %d, last event %d" % (version, self._seen), version)
+                self._set_version(version, changed_at)
+
+    def _drain(self, conn):
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+                rows = payload.get("rows")
+                event = ChangeEvent(int(payload["v"]), _timestamp(payload["at"]), payload["table"],
+                                    tuple(tuple(r) for r in rows) if rows is not None else None)
+            except (ValueError, KeyError, TypeError):
+                log.warning("ignoring malformed %s payload %r", CHANNEL, notify.payload)
+                continue
+            self._apply(event)
+
+    def _apply(self, event):
+        self.stats["events"] += 1
+        seen = self._seen
+        if event.version <= seen:
+            return  # already covered by the version read at (re)connect
+        if event.version != seen + 1:
+            self.stats["gaps"] += 1
+            self._set_version(event.version, event.changed_at)
+            self.flush("missed versions %d..%d" % (seen + 1, event.version - 1), event.version)
+            return
+        if event.table == "*":
+            self._set_version(event.version, event.changed_at)
+            self.flush("data version reset", event.version)
+            return
+        if event.table in INCIDENT_TABLES:
+            with self._lock:
+                if event.rows is None:
+                    self._incidents.clear()
+                    self._cleared_at = event.version
+                else:
+                    for incident_id, _, _ in event.rows:
+                        self._incidents[incident_id] = (event.version, event.changed_at)
+                        self._incidents.move_to_end(incident_id)
+                    while len(self._incidents) > self.max_incidents:
+                        self._incidents.popitem(last=False)
+        self._set_version(event.version, event.changed_at)
+        self._publish(event)
+
+
+def touches(event, borough=None, postal_code=None, incident_id=None):
+    """True if event may have changed data for this borough / postal code / incident.
+
+    None arguments match anything; a flush (event None) and events without
+    row details match everything.
+    """
+    if event is None or event.rows is None or event.table == "*":
+        return True
+    for row_id, row_borough, row_postal in event.rows:
+        if incident_id is not None and row_id != incident_id:
+            continue
+        if row_borough is None:  # the incident is gone; where it was is unknown
+            return True
+        if borough is not None and row_borough != borough:
+            continue
+        if postal_code is not None and row_postal != postal_code:
+            continue
+        return True
+    return False
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Query plan regression suite for every route query.
+
+Enumerates the SQL each route builds (route_queries.py) across its filter
+combinations, runs EXPLAIN against a scaled local dataset (generate_data.py)
+and compares each query shape with the baseline stored in query_plans/:
+
+  * FAIL when a plan starts using a sequential scan on a GUARDED_TABLES
+    table (incident, victim, address, incident_flat and the counter
+    tables) that the baseline plan did not have;
+  * FAIL when the estimated total cost grows past baseline * (1 + tolerance);
+  * FAIL when the shape's SQL is no longer the SQL the baseline explained.
+
+    python check_query_plans.py --database-url postgresql://postgres@localhost/nyc_bench
+    python check_query_plans.py --update        # accept current plans as the new baseline
+
+Exit status is 1 when any shape regressed, so this can gate CI.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import date
+from itertools import combinations
+
+from sqlalchemy import create_engine, text
+from werkzeug.datastructures import MultiDict
+
+import route_queries as rq
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plans")
+DEFAULT_BENCH_URI = os.environ.get("BENCH_DATABASE_URL", "postgresql://postgres@localhost/nyc_bench")
+GUARDED_TABLES = {
+    "incident", "victim", "address",
+    # the denormalized list table (007) and the counters read instead of scanning it (012-014)
+    "incident_flat", "workload_counter", "demographic_crosstab", "incident_trend_day", "incident_trend_month",
+}
+MIN_INCIDENTS = 100_000
+# Relative windows are resolved against a fixed day so the SQL of a shape never changes.
+PLAN_TODAY = date(2025, 12, 31)
+
+# one representative value per filter (values exist in the generated dataset)
+LIST_SAMPLE_ARGS = {
+    "lawcategory": "Felony",
+    "status": "Open",
+    "borough": ["BROOKLYN", "QUEENS"],
+    "severity": "high",
+    "crime_type": "assault",
+    "postal_code": "10027",
+    "date_start": "2024-01-01",
+    "date_end": "2024-12-31",
+    "victim_gender": "Female",
+    "victim_age_grp": "25-44",
+    "victim_ethnicity": "BLACK",
+}
+ANALYSIS_TOP10_ARGS = {"window": "1y", "borough": "BRONX", "postal_code": "10453"}
+ANALYSIS_CUSTOM_ARGS = {"custom_postal_code": "10453", "custom_gender": "Female",
+                        "custom_age_group": "25-44", "custom_ethnicity": "BLACK"}
+ANALYSIS_TREND_ARGS = {"year_from": "2015", "year_to": "2024", "crime_type_id": "9", "trend_borough": "BRONX"}
+TREND_RANGE = {"start": date(2016, 1, 1), "stop": date(2026, 1, 1)}  # ten years
+TREND_FILTERS = {"crime_type_ids": [3, 9], "boroughs": ["BRONX", "QUEENS"]}
+DEMOGRAPHIC_ARGS = {"gender": "Female", "age_grp": "25-44", "race": "BLACK"}
+CROSSTAB_CUT = {"borough": "BRONX", "crime_type_id": 9}
+CROSSTAB_CELL = {"victim": "gender", "suspect": "race", "victim_value": "Female", "suspect_value": "BLACK"}
+
+
+def _combos(names, max_filters):
+    """Every subset up to max_filters names, plus the all-filters set."""
+    seen = []
+    for k in range(0, min(max_filters, len(names)) + 1):
+        seen.extend(combinations(names, k))
+    if len(names) > max_filters:
+        seen.append(tuple(names))
+    return seen
+
+
+def _args(sample, names):
+    md = MultiDict()
+    for name in names:
+        value = sample[name]
+        for v in value if isinstance(value, list) else [value]:
+            md.add(name, v)
+    return md
+
+
+def _key(kind, names):
+    return f"{kind}[{'+'.join(names)}]"
+
+
+def enumerate_shapes(max_filters):
+    """Yield (group, shape_key, sql, params) for every route query shape."""
+    # /incidents and /admin share filters; facet counts (with the total) and page per combination
+    for names in _combos(list(LIST_SAMPLE_ARGS), max_filters):
+        where_clause, params = rq.incident_list_filter(_args(LIST_SAMPLE_ARGS, names))
+        yield "incident_list", _key("facets", names), rq.incident_facets_sql(where_clause), params
+        yield "incident_list", _key("page", names), rq.incident_page_sql(where_clause), rq.page_params(params, 1)
+    where_clause, params = rq.incident_list_filter(MultiDict())
+    yield "incident_list", "page[]@50", rq.incident_page_sql(where_clause), rq.page_params(params, 50)
+
+    # detail pages
+    detail = {"incident_id": 4242}
+    yield "incident_detail", "incident", rq.INCIDENT_DETAIL_SQL, detail
+    yield "incident_detail", "suspects", rq.ADMIN_INCIDENT_SUSPECTS_SQL, detail
+    yield "incident_detail", "victims", rq.INCIDENT_VICTIMS_SQL, detail
+    yield "incident_detail", "clues", rq.INCIDENT_CLUES_SQL, detail
+
+    # /incidents/analysis
+    for names in _combos(list(ANALYSIS_TOP10_ARGS), 3):
+        sql, params = rq.analysis_top10_query(_args(ANALYSIS_TOP10_ARGS, names), today=PLAN_TODAY)
+        yield "incidents_analysis", _key("top10", names), sql, params
+    for names in _combos(list(ANALYSIS_CUSTOM_ARGS), 4):
+        sql, params = rq.analysis_custom_query(_args(ANALYSIS_CUSTOM_ARGS, names))
+        yield "incidents_analysis", _key("custom", names), sql, params
+    for names in _combos(list(ANALYSIS_TREND_ARGS), 4):
+        sql, params = rq.analysis_trend_query(_args(ANALYSIS_TREND_ARGS, names))
+        yield "incidents_analysis", _key("trend", names), sql, params
+    yield "incidents_analysis", "crime_types", rq.CRIME_TYPES_SQL, {}
+
+    # /incidents/trend: every grain, one series or one per borough / crime type, unfiltered or filtered
+    for grain in rq.TREND_GRAINS:
+        for by in rq.TREND_BY:
+            for names in ((), tuple(TREND_FILTERS)):
+                sql = rq.trend_series_sql(grain, by, "crime_type_ids" in names, "boroughs" in names)
+                params = {**TREND_RANGE, "crime_type_ids": [], "boroughs": [],
+                          **{name: TREND_FILTERS[name] for name in names}}
+                yield "incidents_trend", _key(f"{grain}.{by or 'all'}", names), sql, params
+
+    # /admin/workload: the counters per dimension
+    for dimension in rq.WORKLOAD_DIMENSIONS:
+        yield "admin_workload", dimension, rq.workload_sql(dimension), {}
+
+    # /incidents/crosstab: a matrix and its drill-downs, all of NYC or one cut
+    for names in _combos(list(CROSSTAB_CUT), 2):
+        cut = {name: CROSSTAB_CUT.get(name) if name in names else None for name in CROSSTAB_CUT}
+        params = {**CROSSTAB_CELL, **cut}
+        yield "incidents_crosstab", _key("matrix", names), rq.crosstab_matrix_sql(**cut), params
+        for dimension in rq.CROSSTAB_BREAKDOWNS:
+            yield ("incidents_crosstab", _key(f"breakdown.{dimension}", names),
+                   rq.crosstab_breakdown_sql(dimension, **cut), params)
+
+    # /recommendations
+    for names in _combos(list(DEMOGRAPHIC_ARGS), 3):
+        params = rq.recommendation_params(_args(DEMOGRAPHIC_ARGS, names))
+        yield "recommendations", _key("top10", names), rq.RECOMMENDATIONS_TOP10_SQL, params
+        yield "recommendations", _key("zip", names), rq.RECOMMENDATIONS_ZIP_SQL, {"zip": "10453", **params}
+
+
+def _walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def explain(conn, sql, params):
+    plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql.strip().rstrip(";")), params).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    nodes = list(_walk(root))
+    return {
+        "total_cost": root["Total Cost"],
+        "seq_scans": sorted({n["Relation Name"] for n in nodes
+                             if n["Node Type"] == "Seq Scan" and n.get("Relation Name") in GUARDED_TABLES}),
+        "scans": sorted({f"{n['Node Type']}:{n.get('Index Name') or n.get('Relation Name')}"
+                         for n in nodes if "Relation Name" in n}),
+    }
+
+
+def sql_hash(sql):
+    return hashlib.sha1(" ".join(sql.split()).encode()).hexdigest()[:12]
+
+
+def load_baseline(group):
+    path = os.path.join(BASELINE_DIR, f"{group}.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current, baseline, tolerance):
+    """Return a list of human readable regression reasons (empty = OK)."""
+    if baseline is None:
+        return ["no baseline for this shape (run with --update to record it)"]
+    if baseline.get("sql_hash") and baseline["sql_hash"] != current["sql_hash"]:
+        # a different query: its cost and scans say nothing about this one
+        return ["SQL changed since baseline (re-run with --update)"]
+    problems = []
+    new_seq = sorted(set(current["seq_scans"]) - set(baseline.get("seq_scans", [])))
+    if new_seq:
+        problems.append(f"new sequential scan on {', '.join(new_seq)}")
+    limit = baseline["total_cost"] * (1 + tolerance)
+    if current["total_cost"] > limit:
+        problems.append(f"estimated cost {current['total_cost']:.0f} > baseline "
+                        f"{baseline['total_cost']:.0f} (+{tolerance:.0%} allowed)")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN-based plan regression suite")
+    parser.add_argument("--database-url", default=DEFAULT_BENCH_URI)
+    parser.add_argument("--update", action="store_true", help="write current plans as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative cost growth")
+    parser.add_argument("--max-filters", type=int, default=2,
+                        help="largest list-page filter combination to enumerate (plus all filters)")
+    parser.add_argument("--only", help="only check groups/shapes containing this substring")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    with engine.connect() as conn:
+        n_incidents = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'incident'")).scalar()
+        if (n_incidents or 0) < MIN_INCIDENTS:
+            sys.exit(f"incident has ~{n_incidents} rows; plans are only meaningful on a scaled dataset "
+                     f"(>= {MIN_INCIDENTS:,}). See generate_data.py.")
+
+        results = {}
+        for group, key, sql, params in enumerate_shapes(args.max_filters):
+            if args.only and args.only not in f"{group}.{key}":
+                continue
+            plan = explain(conn, sql, params)
+            plan["sql_hash"] = sql_hash(sql)
+            results.setdefault(group, {})[key] = plan
+
+    failures = 0
+    for group, shapes in results.items():
+        baseline = load_baseline(group)
+        for key, plan in shapes.items():
+            base = baseline.get("shapes", {}).get(key)
+            problems = [] if args.update else compare(plan, base, args.tolerance)
+            failures += bool(problems)
+            if problems or args.verbose:
+                status = "FAIL" if problems else "ok  "
+                print(f"{status} {group}.{key}  cost={plan['total_cost']:.0f}  "
+                      f"seq={','.join(plan['seq_scans']) or '-'}")
+                for p in problems:
+                    print(f"       - {p}")
+
+        if args.update:
+            merged = baseline.get("shapes", {}) if args.only else {}
+            merged.update(shapes)
+            os.makedirs(BASELINE_DIR, exist_ok=True)
+            with open(os.path.join(BASELINE_DIR, f"{group}.json"), "w") as f:
+                json.dump({"dataset_incidents": n_incidents, "shapes": dict(sorted(merged.items()))},
+                          f, indent=1, sort_keys=True)
+                f.write("\n")
+        elif baseline.get("dataset_incidents") and \
+                abs(n_incidents / baseline["dataset_incidents"] - 1) > 0.2:
+            print(f"warning: {group} baseline was recorded on ~{baseline['dataset_incidents']:,} incidents, "
+                  f"this database has ~{n_incidents:,}; costs are not comparable")
+
+    total = sum(len(s) for s in results.values())
+    if args.update:
+        print(f"Recorded {total} query shapes in {BASELINE_DIR}")
+        return 0
+    print(f"{total - failures}/{total} query shapes OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Per-process counters in the Prometheus text format, served at /admin/metrics.
+
+    from metrics import counter
+    QUERY_TIMEOUTS = counter("query_timeouts_total", "Aggregate queries cancelled by statement_timeout",
+                             ("route", "shape"))
+    QUERY_TIMEOUTS.inc(route="recommendations", shape="recommendations.top10[gender]")
+
+Other components' own stats (single_flight, cache_bus) are exported by
+registering a collector: a callable returning (name, help, {labels: value}).
+Every worker process counts on its own; scrape each worker (or sum them in
+the monitoring system).
+"""
+import threading
+
+from flask import Response
+
+_registry = {}      # name -> Counter
+_collectors = []
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return {tuple(zip(self.labelnames, key)): value for key, value in self._values.items()}
+
+
+def counter(name, help_text, labelnames=()):
+    """The counter registered under name, created on first use."""
+    if name not in _registry:
+        _registry[name] = Counter(name, help_text, labelnames)
+    return _registry[name]
+
+
+def register_collector(collect):
+    _collectors.append(collect)
+    return collect
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(name, help_text, kind, samples):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in sorted(samples.items()):
+        label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def render():
+    lines = []
+    for c in _registry.values():
+        lines += _format(c.name, c.help, "counter", c.samples())
+    for collect in _collectors:
+        for name, help_text, samples in collect():
+            lines += _format(name, help_text, "counter", samples)
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    @app.route("/admin/metrics")
+    def metrics_index():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -5,6 +5,9 @@
 -- 1. Full-text suspect clues table with GIN index
 -- 2. Weapons array on suspects with GIN index
 -- 3. Trigger for automatic FTS maintenance
+--
+-- clue_tsv for rows that predate the trigger is filled in by
+-- 003_backfill_suspect_clue_tsv.sql in keyed batches.
 -- ============================================================
 
 -- ============================================================
@@ -67,11 +70,3 @@ CREATE TRIGGER trigger_suspect_clue_update_tsv
     FOR EACH ROW
     WHEN (OLD.clue_text IS DISTINCT FROM NEW.clue_text)
     EXECUTE FUNCTION update_suspect_clue_tsv();
-
--- ============================================================
--- Optional: Update existing rows (if any) to populate clue_tsv
--- ============================================================
-UPDATE suspect_clue 
-SET clue_tsv = to_tsvector('english', COALESCE(clue_text, ''))
-WHERE clue_tsv IS NULL;
-
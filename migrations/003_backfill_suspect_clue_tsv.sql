@@ -0,0 +1,13 @@
+-- migrate:backfill table=suspect_clue key=clue_id batch_size=5000 sleep_ms=50
+-- ============================================================
+-- Migration 003: populate clue_tsv for clues that predate the trigger
+-- ============================================================
+-- The BEFORE INSERT/UPDATE triggers from 001 keep clue_tsv current for new
+-- and edited clues. Older rows are filled in here by run_migrations.py,
+-- one clue_id range per transaction, so only batch_size rows are locked at
+-- a time and live writes to suspect_clue are not blocked.
+-- ============================================================
+UPDATE suspect_clue
+SET clue_tsv = to_tsvector('english', COALESCE(clue_text, ''))
+WHERE clue_id >= :batch_start AND clue_id < :batch_end
+  AND clue_tsv IS NULL;
@@ -0,0 +1,139 @@
+-- ============================================================
+-- Migration 004: data version for conditional GET
+-- ============================================================
+-- server.py answers If-None-Match / If-Modified-Since on
+-- /incidents/analysis, /recommendations and /incident/<id> with 304 before
+-- running any of the page's queries. The validators come from here:
+--
+--   * data_version: one row with a global counter, bumped once per
+--     statement that changes incident, victim, suspect, classified_as or
+--     suspect_clue (and crimetype / jurisdiction, which feed the dropdowns).
+--     The analysis and recommendation ETags use it.
+--   * incident_version: the global counter value at the last change to one
+--     incident's rows. The /incident/<id> ETag uses it. Incidents without a row here have
+--     not changed since the last bulk load and use data_version.epoch.
+--
+-- The triggers are statement-level with transition tables, so a COPY or a
+-- bulk UPDATE costs one counter bump plus one set-based upsert, not a
+-- trigger call per row. Bumping the counter locks the data_version row until
+-- commit, so writers to these tables commit one at a time. The data changes
+-- a few times an hour, so that is fine.
+--
+-- TRUNCATE incident (generate_data.py --truncate) and bulk loads with
+-- triggers disabled call reset_data_version(), which starts a new epoch:
+-- every page gets a new ETag.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS data_version (
+    singleton  BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    version    BIGINT NOT NULL DEFAULT 1,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    epoch      BIGINT NOT NULL DEFAULT 1,
+    epoch_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO data_version DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- No foreign key: the row outlives a deleted incident, so its id never
+-- goes back to an older version.
+CREATE TABLE IF NOT EXISTS incident_version (
+    incident_id INTEGER PRIMARY KEY,
+    version     BIGINT NOT NULL,
+    changed_at  TIMESTAMPTZ NOT NULL
+);
+
+-- ------------------------------------------------------------
+-- Per-statement bump for the incident tables
+-- ------------------------------------------------------------
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+    v   BIGINT;
+    ts  TIMESTAMPTZ;
+BEGIN
+    -- Only the transition tables of the firing event exist.
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT incident_id) INTO ids FROM new_rows WHERE incident_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT incident_id) INTO ids FROM old_rows WHERE incident_id IS NOT NULL;
+    ELSE
+        SELECT array_agg(DISTINCT incident_id) INTO ids
+        FROM (SELECT incident_id FROM new_rows UNION SELECT incident_id FROM old_rows) changed
+        WHERE incident_id IS NOT NULL;
+    END IF;
+
+    IF ids IS NULL THEN
+        RETURN NULL;  -- the statement changed no rows
+    END IF;
+
+    UPDATE data_version
+    SET version = version + 1, changed_at = clock_timestamp()
+    RETURNING version, changed_at INTO v, ts;
+
+    INSERT INTO incident_version (incident_id, version, changed_at)
+    SELECT unnest(ids), v, ts
+    ON CONFLICT (incident_id) DO UPDATE
+        SET version = EXCLUDED.version, changed_at = EXCLUDED.changed_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reference tables: the global counter only.
+CREATE OR REPLACE FUNCTION bump_data_version_global()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE data_version SET version = version + 1, changed_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION reset_data_version()
+RETURNS BIGINT AS $$
+    DELETE FROM incident_version;
+    UPDATE data_version
+    SET version = version + 1, changed_at = clock_timestamp(),
+        epoch = version + 1, epoch_at = clock_timestamp()
+    RETURNING version;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION data_version_truncated()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM reset_data_version();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- Triggers (one per event: a transition table belongs to one event list)
+-- ------------------------------------------------------------
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['incident', 'victim', 'suspect', 'classified_as', 'suspect_clue'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_version_insert', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', t || '_version_insert', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_version_update', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', t || '_version_update', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_version_delete', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', t || '_version_delete', t);
+    END LOOP;
+
+    FOREACH t IN ARRAY ARRAY['crimetype', 'jurisdiction'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_version', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version_global()', t || '_version', t);
+    END LOOP;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS incident_version_truncate ON incident;
+CREATE TRIGGER incident_version_truncate
+    AFTER TRUNCATE ON incident
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION data_version_truncated();
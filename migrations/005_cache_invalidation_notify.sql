@@ -0,0 +1,112 @@
+-- ============================================================
+-- Migration 005: publish data changes for cache invalidation
+-- ============================================================
+-- Every data_version bump from 004 now also sends one NOTIFY on channel
+-- cache_invalidation, so each server process (cache_bus.py) can evict what
+-- a write made stale, whichever process or host handled it. Payload (JSON,
+-- well under the 8000-byte NOTIFY limit):
+--
+--   {"v": 42, "at": 1760880000.12, "table": "victim",
+--    "rows": [[7, "BROOKLYN", "11201"], ...]}
+--
+--   v      data_version.version after the change; consecutive events
+--          differ by exactly 1, so a listener that sees a jump knows it
+--          missed something and flushes everything
+--   at     data_version.changed_at (epoch seconds)
+--   table  the changed table, or "*" after reset_data_version()
+--   rows   [incident_id, borough, postal_code] of each touched incident,
+--          or null when the statement touched more than 100 incidents or
+--          the table has none (crimetype, jurisdiction). borough and
+--          postal_code are null for an incident that no longer exists
+--          (the incident's own DELETE event carries them).
+--
+-- Notifications are delivered at commit, in commit order, and only for
+-- committed transactions; the data_version row lock makes commit order the
+-- version order.
+-- ============================================================
+
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    ids     INTEGER[];
+    v       BIGINT;
+    ts      TIMESTAMPTZ;
+    touched JSON;
+BEGIN
+    -- Only the transition tables of the firing event exist.
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT incident_id) INTO ids FROM new_rows WHERE incident_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT incident_id) INTO ids FROM old_rows WHERE incident_id IS NOT NULL;
+    ELSE
+        SELECT array_agg(DISTINCT incident_id) INTO ids
+        FROM (SELECT incident_id FROM new_rows UNION SELECT incident_id FROM old_rows) changed
+        WHERE incident_id IS NOT NULL;
+    END IF;
+
+    IF ids IS NULL THEN
+        RETURN NULL;  -- the statement changed no rows
+    END IF;
+
+    UPDATE data_version
+    SET version = version + 1, changed_at = clock_timestamp()
+    RETURNING version, changed_at INTO v, ts;
+
+    INSERT INTO incident_version (incident_id, version, changed_at)
+    SELECT unnest(ids), v, ts
+    ON CONFLICT (incident_id) DO UPDATE
+        SET version = EXCLUDED.version, changed_at = EXCLUDED.changed_at;
+
+    IF cardinality(ids) <= 100 THEN
+        IF TG_TABLE_NAME = 'incident' AND TG_OP = 'DELETE' THEN
+            SELECT json_agg(json_build_array(o.incident_id, a.borough, a.postal_code)) INTO touched
+            FROM old_rows o
+            LEFT JOIN address a ON a.address_id = o.address_id;
+        ELSE
+            SELECT json_agg(json_build_array(u.incident_id, a.borough, a.postal_code)) INTO touched
+            FROM unnest(ids) AS u(incident_id)
+            LEFT JOIN incident i ON i.incident_id = u.incident_id
+            LEFT JOIN address a ON a.address_id = i.address_id;
+        END IF;
+    END IF;
+
+    PERFORM pg_notify('cache_invalidation', json_build_object(
+        'v', v, 'at', extract(epoch FROM ts), 'table', TG_TABLE_NAME, 'rows', touched)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_data_version_global()
+RETURNS TRIGGER AS $$
+DECLARE
+    v  BIGINT;
+    ts TIMESTAMPTZ;
+BEGIN
+    UPDATE data_version
+    SET version = version + 1, changed_at = clock_timestamp()
+    RETURNING version, changed_at INTO v, ts;
+
+    PERFORM pg_notify('cache_invalidation', json_build_object(
+        'v', v, 'at', extract(epoch FROM ts), 'table', TG_TABLE_NAME, 'rows', NULL)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Was LANGUAGE sql in 004; same signature, so this replaces it in place.
+CREATE OR REPLACE FUNCTION reset_data_version()
+RETURNS BIGINT AS $$
+DECLARE
+    v  BIGINT;
+    ts TIMESTAMPTZ;
+BEGIN
+    DELETE FROM incident_version;
+    UPDATE data_version
+    SET version = version + 1, changed_at = clock_timestamp(),
+        epoch = version + 1, epoch_at = clock_timestamp()
+    RETURNING version, changed_at INTO v, ts;
+
+    PERFORM pg_notify('cache_invalidation', json_build_object(
+        'v', v, 'at', extract(epoch FROM ts), 'table', '*', 'rows', NULL)::text);
+    RETURN v;
+END;
+$$ LANGUAGE plpgsql;
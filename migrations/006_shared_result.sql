@@ -0,0 +1,23 @@
+-- ============================================================
+-- Migration 006: results handed between processes by single_flight.py
+-- ============================================================
+-- When several processes run the same aggregate with the same parameters,
+-- one of them (the holder of a transaction-level advisory lock) executes it
+-- and writes the pickled result here in the transaction that releases the
+-- lock; the others wait on the lock and read the row instead of running
+-- the query themselves. A row is only used by requests that arrived while
+-- it was being computed (finished_at >= their arrival), so this is a
+-- hand-off, not a cache.
+--
+-- UNLOGGED: nothing here has to survive a crash, and skipping WAL keeps
+-- the write cheap.
+-- ============================================================
+
+CREATE UNLOGGED TABLE IF NOT EXISTS shared_result (
+    key         TEXT PRIMARY KEY,       -- sha1 of the SQL text and its parameters
+    finished_at TIMESTAMPTZ NOT NULL,
+    result      BYTEA NOT NULL          -- pickled sqlalchemy FrozenResult
+);
+
+CREATE INDEX IF NOT EXISTS idx_shared_result_finished_at
+    ON shared_result (finished_at);
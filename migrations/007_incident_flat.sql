@@ -0,0 +1,225 @@
+-- ============================================================
+-- Migration 007: incident_flat, the list pages' denormalized table
+-- ============================================================
+-- index() and admin_index() filter, count and page over the join of
+-- incident, address, jurisdiction, classified_as, crimetype and
+-- lawcategory. incident_flat holds that join's result, one row per
+-- (incident, crime type), with the filter columns side by side. The list
+-- queries (route_queries.LIST_FROM) then read a single table, and each
+-- filter has a (column, occurred_date DESC) index that returns a page in
+-- list order.
+--
+-- Rows exist exactly where the inner join has them: an incident without a
+-- classification, address or jurisdiction is not listed, as before.
+--
+-- Triggers keep it in sync inside the writing transaction:
+--
+--   * incident, classified_as: statement-level with transition tables.
+--     The touched incidents' rows are deleted and rebuilt from the join
+--     (refresh_incident_flat). An incident UPDATE that only changes
+--     incident_details (the admin description edit) is skipped; a status
+--     edit rebuilds that incident's rows.
+--   * address, jurisdiction, crimetype, lawcategory: an UPDATE of a
+--     listed column is copied to the rows that use it. Their deletes are
+--     blocked by foreign keys while incidents refer to them, and their
+--     inserts are not referenced yet, so neither needs a trigger.
+--   * TRUNCATE incident empties incident_flat.
+--
+-- This migration only creates the table, the functions and the triggers,
+-- so the transaction that takes locks on the six tables is short. Existing
+-- incidents are copied in by 015_incident_flat_backfill (batches of
+-- incident ids, each its own transaction) and the list indexes are built
+-- CONCURRENTLY by 016_incident_flat_indexes, both without blocking writes.
+--
+-- generate_data.py loads with triggers off (session_replication_role =
+-- replica) and calls rebuild_incident_flat() afterwards. The same function
+-- repairs the table if it ever drifts.
+--
+-- Two concurrent transactions can still race: one renaming a crime type
+-- while another classifies a new incident under it. Each reads the other's
+-- change from its old snapshot. Reference data changes are rare admin
+-- actions; rebuild_incident_flat() repairs any drift.
+--
+-- Measured on generate_data.py --incidents 1000000 --seed 4111 (Postgres 16,
+-- median of 3), six-table join -> incident_flat:
+--
+--   incident_list.count[]                      2009.3 ms ->   82.1 ms
+--   incident_list.count[status]                 583.0 ms ->   10.5 ms
+--   incident_list.count[borough]                712.5 ms ->   26.8 ms
+--   incident_list.count[severity]               725.3 ms ->   23.5 ms
+--   incident_list.count[postal_code]            283.5 ms ->    3.6 ms
+--   incident_list.count[borough+severity]       759.6 ms ->  211.3 ms
+--   incident_list.page[lawcategory]            3922.4 ms ->    0.3 ms
+--   incident_list.page[]                          5.4 ms ->    0.4 ms
+--
+-- The crime_type substring filter (ILIKE '%...%') and the victim EXISTS
+-- filters cost about the same as before (~930 ms / ~125 ms counts).
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS incident_flat (
+    incident_id   INTEGER NOT NULL,
+    crime_type_id INTEGER NOT NULL,
+    occurred_date DATE NOT NULL,
+    status        TEXT,
+    crime_type    TEXT NOT NULL,
+    category      TEXT NOT NULL,
+    severity      TEXT,
+    jurisdiction  TEXT NOT NULL,
+    borough       TEXT,
+    postal_code   TEXT,
+    -- keys used to copy reference data changes
+    address_id    INTEGER NOT NULL,
+    jur_id        DOUBLE PRECISION NOT NULL,
+    law_cat_id    CHARACTER(1) NOT NULL,
+    PRIMARY KEY (incident_id, crime_type_id)
+);
+
+-- ------------------------------------------------------------
+-- Rebuilding rows from the source tables
+-- ------------------------------------------------------------
+CREATE OR REPLACE FUNCTION refresh_incident_flat(ids INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM incident_flat WHERE incident_id = ANY(ids);
+    INSERT INTO incident_flat (incident_id, crime_type_id, occurred_date, status,
+                               crime_type, category, severity, jurisdiction,
+                               borough, postal_code, address_id, jur_id, law_cat_id)
+    SELECT i.incident_id, ca.crime_type_id, i.occurred_date, i.status,
+           ct.crime_type, lc.category, ct.severity, j.description,
+           a.borough, a.postal_code, a.address_id, j.jur_id, lc.law_cat_id
+    FROM incident i
+    JOIN address a        ON i.address_id = a.address_id
+    JOIN jurisdiction j   ON i.jur_id = j.jur_id
+    JOIN classified_as ca ON i.incident_id = ca.incident_id
+    JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
+    JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
+    WHERE i.incident_id = ANY(ids);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_incident_flat()
+RETURNS BIGINT AS $$
+DECLARE
+    n BIGINT;
+BEGIN
+    TRUNCATE incident_flat;
+    INSERT INTO incident_flat (incident_id, crime_type_id, occurred_date, status,
+                               crime_type, category, severity, jurisdiction,
+                               borough, postal_code, address_id, jur_id, law_cat_id)
+    SELECT i.incident_id, ca.crime_type_id, i.occurred_date, i.status,
+           ct.crime_type, lc.category, ct.severity, j.description,
+           a.borough, a.postal_code, a.address_id, j.jur_id, lc.law_cat_id
+    FROM incident i
+    JOIN address a        ON i.address_id = a.address_id
+    JOIN jurisdiction j   ON i.jur_id = j.jur_id
+    JOIN classified_as ca ON i.incident_id = ca.incident_id
+    JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
+    JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    ANALYZE incident_flat;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- incident / classified_as: rebuild the touched incidents
+-- ------------------------------------------------------------
+CREATE OR REPLACE FUNCTION incident_flat_sync()
+RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT incident_id) INTO ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT incident_id) INTO ids FROM old_rows;
+    ELSIF TG_TABLE_NAME = 'incident' THEN
+        -- only the listed columns; a description edit leaves the list alone
+        SELECT array_agg(DISTINCT incident_id) INTO ids
+        FROM (SELECT incident_id, occurred_date, status, address_id, jur_id FROM new_rows
+              EXCEPT
+              SELECT incident_id, occurred_date, status, address_id, jur_id FROM old_rows) changed;
+    ELSE
+        SELECT array_agg(DISTINCT incident_id) INTO ids
+        FROM (SELECT incident_id FROM new_rows UNION SELECT incident_id FROM old_rows) changed;
+    END IF;
+
+    IF ids IS NOT NULL THEN
+        PERFORM refresh_incident_flat(ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- Reference tables: copy renamed values to the rows using them
+-- ------------------------------------------------------------
+CREATE OR REPLACE FUNCTION incident_flat_reference_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'address' THEN
+        UPDATE incident_flat f
+        SET borough = n.borough, postal_code = n.postal_code
+        FROM new_rows n JOIN old_rows o ON o.address_id = n.address_id
+        WHERE f.address_id = n.address_id
+          AND (n.borough, n.postal_code) IS DISTINCT FROM (o.borough, o.postal_code);
+    ELSIF TG_TABLE_NAME = 'jurisdiction' THEN
+        UPDATE incident_flat f
+        SET jurisdiction = n.description
+        FROM new_rows n JOIN old_rows o ON o.jur_id = n.jur_id
+        WHERE f.jur_id = n.jur_id AND n.description IS DISTINCT FROM o.description;
+    ELSIF TG_TABLE_NAME = 'crimetype' THEN
+        UPDATE incident_flat f
+        SET crime_type = n.crime_type, severity = n.severity,
+            law_cat_id = n.law_cat_id, category = lc.category
+        FROM new_rows n
+        JOIN old_rows o     ON o.crime_type_id = n.crime_type_id
+        JOIN lawcategory lc ON lc.law_cat_id = n.law_cat_id
+        WHERE f.crime_type_id = n.crime_type_id
+          AND (n.crime_type, n.severity, n.law_cat_id) IS DISTINCT FROM (o.crime_type, o.severity, o.law_cat_id);
+    ELSIF TG_TABLE_NAME = 'lawcategory' THEN
+        UPDATE incident_flat f
+        SET category = n.category
+        FROM new_rows n JOIN old_rows o ON o.law_cat_id = n.law_cat_id
+        WHERE f.law_cat_id = n.law_cat_id AND n.category IS DISTINCT FROM o.category;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION incident_flat_truncated()
+RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE incident_flat;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['incident', 'classified_as'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_flat_insert', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION incident_flat_sync()', t || '_flat_insert', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_flat_update', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION incident_flat_sync()', t || '_flat_update', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_flat_delete', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION incident_flat_sync()', t || '_flat_delete', t);
+    END LOOP;
+
+    FOREACH t IN ARRAY ARRAY['address', 'jurisdiction', 'crimetype', 'lawcategory'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_flat_update', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION incident_flat_reference_sync()', t || '_flat_update', t);
+    END LOOP;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS incident_flat_truncate ON incident;
+CREATE TRIGGER incident_flat_truncate
+    AFTER TRUNCATE ON incident
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_flat_truncated();
@@ -0,0 +1,59 @@
+-- ============================================================
+-- Migration 008: background report jobs (reports.py)
+-- ============================================================
+-- Reports too heavy for a request (every ZIP x demographic over many
+-- years, whole-borough exports) are submitted as rows here and run by the
+-- report workers, a few threads in each server process (or
+-- `python reports.py`). The table is the queue, the progress channel and the
+-- result store:
+--
+--   * a worker claims the oldest queued job with FOR UPDATE SKIP LOCKED, so
+--     any number of workers on any number of hosts share the queue;
+--   * while it runs, the worker writes progress (0..1) and a heartbeat
+--     every few seconds; a running job whose heartbeat stopped (its process
+--     died) goes back to the queue;
+--   * the result is a gzip'd CSV, kept with the job for
+--     REPORT_RETENTION_DAYS.
+--
+-- params_hash identifies a report (kind + normalized parameters). At most
+-- one job per hash is queued or running (the partial unique index), so a
+-- second identical submission joins the first. A recently finished one is
+-- reused as is.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS report_job (
+    job_id       BIGSERIAL PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    params       JSONB NOT NULL,
+    params_hash  TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'queued'
+                 CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    progress     REAL NOT NULL DEFAULT 0,
+    message      TEXT,
+    submitted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at   TIMESTAMPTZ,
+    finished_at  TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    worker       TEXT,                  -- host:pid/thread running it
+    result       BYTEA,                 -- gzip'd CSV
+    result_rows  INTEGER
+);
+
+-- one queued/running job per report; submissions join it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_report_job_in_flight
+    ON report_job (params_hash)
+    WHERE status IN ('queued', 'running');
+
+-- reuse of a recent result
+CREATE INDEX IF NOT EXISTS idx_report_job_hash_finished
+    ON report_job (params_hash, finished_at DESC)
+    WHERE status = 'done';
+
+-- the queue, oldest first
+CREATE INDEX IF NOT EXISTS idx_report_job_queued
+    ON report_job (job_id)
+    WHERE status = 'queued';
+
+-- the job list and retention
+CREATE INDEX IF NOT EXISTS idx_report_job_submitted
+    ON report_job (submitted_at DESC);
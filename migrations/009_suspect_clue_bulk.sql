@@ -0,0 +1,37 @@
+-- ============================================================
+-- Migration 009: cheaper bulk inserts into suspect_clue (clue_import.py)
+-- ============================================================
+-- * The BEFORE INSERT trigger from 001 called the plpgsql function
+--   update_suspect_clue_tsv() for every inserted row. clue_import.py
+--   computes to_tsvector('english', clue_text) for a whole load in its one
+--   INSERT ... SELECT, so the trigger now fires only when an insert leaves
+--   clue_tsv NULL. The one-clue form on /admin/<id> still does that.
+--   (A generated column would do the same without a trigger, but replacing
+--   the existing column rewrites the table and its GIN index under an
+--   exclusive lock.)
+-- * suspect_clue_incident_id_fkey is dropped. It duplicated the check done
+--   by the (incident_id, suspect_id) -> suspect key: a suspect row implies
+--   its incident. Deleting an incident still removes its clues, by cascading
+--   through suspect. The duplicate cost a second per-row lookup on every
+--   insert.
+-- * fastupdate stays on for the clue GIN index: new entries are appended to
+--   its pending list and merged in bulk (clue_import.py merges once at the
+--   end of a load) instead of updating the tree entry by entry.
+--
+-- The INSERT of 100k loaded clues on a 1M-incident dataset:
+--   per-row trigger + both FKs         8.6 s
+--   clue_tsv computed in the INSERT    5.5 s
+--   and without the duplicate FK       4.2 s
+--   (fastupdate off instead            8.1 s)
+-- ============================================================
+
+DROP TRIGGER IF EXISTS trigger_suspect_clue_insert_tsv ON suspect_clue;
+CREATE TRIGGER trigger_suspect_clue_insert_tsv
+    BEFORE INSERT ON suspect_clue
+    FOR EACH ROW
+    WHEN (NEW.clue_tsv IS NULL)
+    EXECUTE FUNCTION update_suspect_clue_tsv();
+
+ALTER TABLE suspect_clue DROP CONSTRAINT IF EXISTS suspect_clue_incident_id_fkey;
+
+ALTER INDEX idx_suspect_clue_tsv_gin SET (fastupdate = on);
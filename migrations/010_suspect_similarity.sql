@@ -0,0 +1,19 @@
+-- ============================================================
+-- Migration 010: index for similar-suspect candidates (similar_suspects.py)
+-- ============================================================
+-- /admin/<incident>/suspects/<suspect>/similar gathers candidates from
+-- three indexes and scores only those, never all pairs:
+--
+--   * clues: idx_suspect_clue_tsv_gin (001), with an OR of AND-pairs of
+--     the suspect's rarest clue lexemes: a candidate's clue shares at least
+--     two of them (just one when the suspect has a single rare lexeme);
+--   * weapons: idx_suspect_weapons_gin (001), weapons && the suspect's
+--     weapons, ANDed with this index on the suspect's gender and age group;
+--   * demographics: this index alone, the newest incidents' suspects with
+--     the same gender, age group and race (an index-only top-N scan).
+--
+-- Built CONCURRENTLY (autocommit mode in run_migrations.py).
+-- ============================================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_suspect_demographics
+    ON suspect (gender, age_grp, race, incident_id DESC, suspect_id);
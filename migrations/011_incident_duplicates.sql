@@ -0,0 +1,39 @@
+-- ============================================================
+-- Migration 011: near-duplicate incident detection (duplicates.py)
+-- ============================================================
+-- A duplicate report is only looked for among incidents in the same block:
+-- the same crime type, occurred within DAYS days of each other, at
+-- addresses in the same or a neighbouring grid cell (latitude and
+-- longitude rounded down to CELL_DEGREES). Victim and suspect demographics
+-- are compared only within a block, so the work grows with the number of
+-- incidents, not with its square.
+--
+--   * idx_incident_flat_crime_type_occurred finds a new report's block
+--     (admin_new_incident, before the insert): one crime type, a few days.
+--   * incident_duplicate keeps the pairs the batch sweep found, the later
+--     incident first, until an administrator deletes one of them (the
+--     rows cascade) or dismisses the pair.
+--
+-- Built CONCURRENTLY (autocommit mode in run_migrations.py).
+-- ============================================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_crime_type_occurred
+    ON incident_flat (crime_type_id, occurred_date) INCLUDE (address_id);
+
+CREATE TABLE IF NOT EXISTS incident_duplicate (
+    incident_id  INTEGER NOT NULL REFERENCES incident (incident_id) ON DELETE CASCADE,
+    duplicate_of INTEGER NOT NULL REFERENCES incident (incident_id) ON DELETE CASCADE,
+    score        REAL NOT NULL,          -- 0..1, duplicates.score
+    day_gap      INTEGER NOT NULL,
+    distance_m   REAL NOT NULL,
+    found_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+    dismissed_at TIMESTAMPTZ,            -- "not a duplicate"; later sweeps keep it dismissed
+    PRIMARY KEY (incident_id, duplicate_of)
+);
+
+-- /admin/duplicates: open pairs, best first
+CREATE INDEX IF NOT EXISTS idx_incident_duplicate_open
+    ON incident_duplicate (score DESC) WHERE dismissed_at IS NULL;
+-- the cascade from deleting the earlier incident
+CREATE INDEX IF NOT EXISTS idx_incident_duplicate_of
+    ON incident_duplicate (duplicate_of);
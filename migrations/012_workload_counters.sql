@@ -0,0 +1,218 @@
+-- ============================================================
+-- Migration 012: workload_counter, live open / closed / arrest counts
+-- ============================================================
+-- /admin/workload shows open and closed incidents and suspect arrest rates
+-- per jurisdiction, borough and crime type. Counting them from incident and
+-- suspect scans both tables; workload_counter keeps the counts per
+-- (jurisdiction, borough, crime type), so the page reads one row per group.
+-- An incident with two crime types counts in both, as in incident_flat.
+--
+-- Triggers add and subtract deltas inside the writing transaction:
+--
+--   * incident_flat (migration 007's triggers keep it in sync with incident,
+--     classified_as and the reference tables): each inserted or deleted row
+--     adds or removes one open or closed incident and its incident's
+--     suspects; an update (a borough rename) moves them between groups.
+--     A status edit or a bulk close rebuilds the incident's rows, i.e. a
+--     delete and an insert.
+--   * suspect: an insert, delete or arrest_status edit changes the suspect /
+--     arrested counts of every group its incident's rows are in.
+--   * TRUNCATE of incident_flat empties the counters (rebuild_incident_flat
+--     then re-inserts every row, which counts everything again); TRUNCATE of
+--     suspect zeroes the suspect counts.
+--
+-- Each trigger reads the other table's current rows, so an incident and its
+-- suspects deleted together (the cascade from incident) are subtracted once
+-- whichever trigger runs first. Two concurrent transactions changing an
+-- incident and its suspects can still each miss the other's change;
+-- workload.py compares the counters with a recount (workload_counter_drift)
+-- and rebuild_workload_counter() repairs them.
+--
+-- The counters start empty: the recount would hold the locks CREATE TRIGGER
+-- takes on incident_flat and suspect, blocking their writers, for seconds.
+-- Rows added after this migration (the incident_flat backfill, 015) are
+-- counted by the triggers; 017_workload_counter_fill recounts in its own
+-- transaction if anything is still missing.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS workload_counter (
+    jur_id            DOUBLE PRECISION NOT NULL,
+    borough           TEXT NOT NULL,            -- '' for incidents without one
+    crime_type_id     INTEGER NOT NULL,
+    open_incidents    BIGINT NOT NULL DEFAULT 0,
+    closed_incidents  BIGINT NOT NULL DEFAULT 0,
+    suspects          BIGINT NOT NULL DEFAULT 0,
+    arrested_suspects BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (jur_id, borough, crime_type_id)
+);
+
+-- ------------------------------------------------------------
+-- The counts recomputed from the source tables (reconciliation, rebuild)
+-- ------------------------------------------------------------
+CREATE OR REPLACE VIEW workload_counter_expected AS
+SELECT f.jur_id, COALESCE(f.borough, '') AS borough, f.crime_type_id,
+       COUNT(*) FILTER (WHERE f.status = 'Open') AS open_incidents,
+       COUNT(*) FILTER (WHERE f.status = 'Closed') AS closed_incidents,
+       COALESCE(SUM(s.suspects), 0)::BIGINT AS suspects,
+       COALESCE(SUM(s.arrested), 0)::BIGINT AS arrested_suspects
+FROM incident_flat f
+LEFT JOIN (SELECT incident_id, COUNT(*) AS suspects, COUNT(*) FILTER (WHERE arrest_status) AS arrested
+           FROM suspect GROUP BY incident_id) s ON s.incident_id = f.incident_id
+GROUP BY f.jur_id, COALESCE(f.borough, ''), f.crime_type_id;
+
+-- Groups whose stored counts differ from a recount (a missing row counts as zeros).
+CREATE OR REPLACE VIEW workload_counter_drift AS
+SELECT COALESCE(e.jur_id, w.jur_id) AS jur_id,
+       COALESCE(e.borough, w.borough) AS borough,
+       COALESCE(e.crime_type_id, w.crime_type_id) AS crime_type_id,
+       COALESCE(w.open_incidents, 0) AS stored_open, COALESCE(e.open_incidents, 0) AS expected_open,
+       COALESCE(w.closed_incidents, 0) AS stored_closed, COALESCE(e.closed_incidents, 0) AS expected_closed,
+       COALESCE(w.suspects, 0) AS stored_suspects, COALESCE(e.suspects, 0) AS expected_suspects,
+       COALESCE(w.arrested_suspects, 0) AS stored_arrested, COALESCE(e.arrested_suspects, 0) AS expected_arrested
+FROM workload_counter w
+FULL JOIN workload_counter_expected e
+       ON e.jur_id = w.jur_id AND e.borough = w.borough AND e.crime_type_id = w.crime_type_id
+WHERE (COALESCE(w.open_incidents, 0), COALESCE(w.closed_incidents, 0),
+       COALESCE(w.suspects, 0), COALESCE(w.arrested_suspects, 0))
+      IS DISTINCT FROM
+      (COALESCE(e.open_incidents, 0), COALESCE(e.closed_incidents, 0),
+       COALESCE(e.suspects, 0), COALESCE(e.arrested_suspects, 0));
+
+-- Replace the counters with a recount. The EXCLUSIVE lock makes writers wait
+-- to apply their deltas until after the recount, which cannot see their
+-- uncommitted rows, so nothing is counted twice or lost.
+CREATE OR REPLACE FUNCTION rebuild_workload_counter()
+RETURNS BIGINT AS $$
+DECLARE
+    n BIGINT;
+BEGIN
+    LOCK TABLE workload_counter IN EXCLUSIVE MODE;
+    DELETE FROM workload_counter;
+    INSERT INTO workload_counter SELECT * FROM workload_counter_expected;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- incident_flat: count rows in and out, with their incident's suspects
+-- ------------------------------------------------------------
+-- The statement's rows as (incident_id, jur_id, borough, crime_type_id,
+-- status, sign): +1 counts a row in, -1 out. Run through EXECUTE so one
+-- query serves all three operations (a transition table the operation does
+-- not have cannot be named). An update counts only the rows whose group or
+-- status changed; a jurisdiction or crime type rename leaves them as they are.
+CREATE OR REPLACE FUNCTION workload_counter_flat_sync()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        delta := 'SELECT incident_id, jur_id, borough, crime_type_id, status, 1 AS sign FROM new_rows';
+    ELSIF TG_OP = 'DELETE' THEN
+        delta := 'SELECT incident_id, jur_id, borough, crime_type_id, status, -1 AS sign FROM old_rows';
+    ELSE
+        delta := 'SELECT n.incident_id, n.jur_id, n.borough, n.crime_type_id, n.status, 1 AS sign
+                  FROM new_rows n JOIN old_rows o USING (incident_id, crime_type_id)
+                  WHERE (n.jur_id, n.borough, n.status) IS DISTINCT FROM (o.jur_id, o.borough, o.status)
+                  UNION ALL
+                  SELECT o.incident_id, o.jur_id, o.borough, o.crime_type_id, o.status, -1
+                  FROM new_rows n JOIN old_rows o USING (incident_id, crime_type_id)
+                  WHERE (n.jur_id, n.borough, n.status) IS DISTINCT FROM (o.jur_id, o.borough, o.status)';
+    END IF;
+
+    EXECUTE format($sql$
+        WITH r AS (%s),
+        s AS (SELECT incident_id, COUNT(*) AS suspects, COUNT(*) FILTER (WHERE arrest_status) AS arrested
+              FROM suspect WHERE incident_id IN (SELECT incident_id FROM r)
+              GROUP BY incident_id)
+        INSERT INTO workload_counter AS w
+        SELECT r.jur_id, COALESCE(r.borough, ''), r.crime_type_id,
+               SUM(CASE WHEN r.status = 'Open' THEN r.sign ELSE 0 END),
+               SUM(CASE WHEN r.status = 'Closed' THEN r.sign ELSE 0 END),
+               SUM(r.sign * COALESCE(s.suspects, 0)),
+               SUM(r.sign * COALESCE(s.arrested, 0))
+        FROM r LEFT JOIN s ON s.incident_id = r.incident_id
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (jur_id, borough, crime_type_id) DO UPDATE
+        SET open_incidents = w.open_incidents + EXCLUDED.open_incidents,
+            closed_incidents = w.closed_incidents + EXCLUDED.closed_incidents,
+            suspects = w.suspects + EXCLUDED.suspects,
+            arrested_suspects = w.arrested_suspects + EXCLUDED.arrested_suspects
+    $sql$, delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- suspect: add the per-incident change to each of its incident's groups
+-- ------------------------------------------------------------
+CREATE OR REPLACE FUNCTION workload_counter_suspect_sync()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        delta := 'SELECT incident_id, arrest_status IS TRUE AS arrested, 1 AS sign FROM new_rows';
+    ELSIF TG_OP = 'DELETE' THEN
+        delta := 'SELECT incident_id, arrest_status IS TRUE AS arrested, -1 AS sign FROM old_rows';
+    ELSE
+        delta := 'SELECT incident_id, arrest_status IS TRUE AS arrested, 1 AS sign FROM new_rows
+                  UNION ALL
+                  SELECT incident_id, arrest_status IS TRUE, -1 FROM old_rows';
+    END IF;
+
+    EXECUTE format($sql$
+        WITH d AS (SELECT incident_id, SUM(sign) AS suspects, SUM(sign * arrested::INT) AS arrested
+                   FROM (%s) changed
+                   GROUP BY incident_id)
+        INSERT INTO workload_counter AS w (jur_id, borough, crime_type_id, suspects, arrested_suspects)
+        SELECT f.jur_id, COALESCE(f.borough, ''), f.crime_type_id, SUM(d.suspects), SUM(d.arrested)
+        FROM d JOIN incident_flat f ON f.incident_id = d.incident_id
+        WHERE d.suspects <> 0 OR d.arrested <> 0
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (jur_id, borough, crime_type_id) DO UPDATE
+        SET suspects = w.suspects + EXCLUDED.suspects,
+            arrested_suspects = w.arrested_suspects + EXCLUDED.arrested_suspects
+    $sql$, delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION workload_counter_truncated()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'incident_flat' THEN
+        TRUNCATE workload_counter;
+    ELSE
+        UPDATE workload_counter SET suspects = 0, arrested_suspects = 0
+        WHERE suspects <> 0 OR arrested_suspects <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+    fn TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['incident_flat', 'suspect'] LOOP
+        fn := CASE t WHEN 'suspect' THEN 'workload_counter_suspect_sync' ELSE 'workload_counter_flat_sync' END;
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_workload_insert', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION %I()', t || '_workload_insert', t, fn);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_workload_update', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION %I()', t || '_workload_update', t, fn);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_workload_delete', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION %I()', t || '_workload_delete', t, fn);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_workload_truncate', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION workload_counter_truncated()', t || '_workload_truncate', t);
+    END LOOP;
+END;
+$$;
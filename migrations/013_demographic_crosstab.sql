@@ -0,0 +1,102 @@
+-- ============================================================
+-- Migration 013: demographic_crosstab, victim x suspect demographics
+-- ============================================================
+-- /incidents/crosstab shows how victims' gender, age group or race line up
+-- with their incidents' suspects', for all of NYC or one borough and / or
+-- crime type, and drills into a cell by borough and crime type. Every cut
+-- is stored here, so the page reads a few hundred rows of this table and
+-- never victim or suspect.
+--
+-- refresh_demographic_crosstab() computes them in one pass:
+--
+--   1. victim x suspect pairs of the same incident, counted per borough,
+--      crime type and all six demographics (about 175k groups for 1M
+--      incidents);
+--   2. one GROUP BY CUBE (borough, crime_type_id) x GROUPING SETS of the
+--      nine (victim attribute, suspect attribute) pairs over those counts:
+--      36 grouping sets, about 30k rows.
+--
+-- A NULL borough or crime_type_id is the total over all of them ('' is an
+-- incident without a borough); a missing race is ''. An incident with two
+-- crime types counts in both, as in incident_flat.
+--
+-- The table is a snapshot: demographic_crosstab_state records the
+-- data_version it was computed at, and the page says when the data has
+-- changed since. Refresh it with crosstab.py (or its job on the page). The
+-- refresh deletes and inserts in one transaction, so readers keep seeing the
+-- previous snapshot until it commits.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS demographic_crosstab (
+    borough       TEXT,                 -- NULL: all boroughs
+    crime_type_id INTEGER,              -- NULL: all crime types
+    victim_attr   TEXT NOT NULL,        -- gender, age_grp or race
+    victim_value  TEXT NOT NULL,
+    suspect_attr  TEXT NOT NULL,
+    suspect_value TEXT NOT NULL,
+    pairs         BIGINT NOT NULL       -- victim x suspect pairs of the same incident
+);
+
+-- a matrix: one (victim_attr, suspect_attr) and cut; a drill-down: one cell
+CREATE INDEX IF NOT EXISTS idx_demographic_crosstab_attrs
+    ON demographic_crosstab (victim_attr, suspect_attr, victim_value, suspect_value);
+
+CREATE TABLE IF NOT EXISTS demographic_crosstab_state (
+    singleton    BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    data_version BIGINT NOT NULL,        -- data_version.version / epoch it was computed at
+    epoch        BIGINT NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL,
+    seconds      REAL NOT NULL
+);
+
+-- work_mem: both aggregates fit in memory instead of spilling (11 s -> 5 s).
+CREATE OR REPLACE FUNCTION refresh_demographic_crosstab()
+RETURNS BIGINT AS $$
+DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    current data_version%ROWTYPE;
+    n       BIGINT;
+BEGIN
+    -- one refresh at a time; read the version first, so a write committed
+    -- during the refresh leaves the snapshot marked out of date
+    PERFORM pg_advisory_xact_lock(hashtext('refresh_demographic_crosstab'));
+    SELECT * INTO current FROM data_version;
+
+    DELETE FROM demographic_crosstab;
+    INSERT INTO demographic_crosstab
+    WITH pairs AS (
+        SELECT COALESCE(f.borough, '') AS borough, f.crime_type_id,
+               v.gender AS v_gender, v.age_grp AS v_age_grp, COALESCE(v.race, '') AS v_race,
+               s.gender AS s_gender, s.age_grp AS s_age_grp, COALESCE(s.race, '') AS s_race,
+               COUNT(*) AS pairs
+        FROM incident_flat f
+        JOIN victim v  ON v.incident_id = f.incident_id
+        JOIN suspect s ON s.incident_id = f.incident_id
+        GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+    )
+    SELECT borough, crime_type_id,
+           CASE WHEN GROUPING(v_gender) = 0 THEN 'gender' WHEN GROUPING(v_age_grp) = 0 THEN 'age_grp' ELSE 'race' END,
+           COALESCE(CASE WHEN GROUPING(v_gender) = 0 THEN v_gender
+                         WHEN GROUPING(v_age_grp) = 0 THEN v_age_grp ELSE v_race END, ''),
+           CASE WHEN GROUPING(s_gender) = 0 THEN 'gender' WHEN GROUPING(s_age_grp) = 0 THEN 'age_grp' ELSE 'race' END,
+           COALESCE(CASE WHEN GROUPING(s_gender) = 0 THEN s_gender
+                         WHEN GROUPING(s_age_grp) = 0 THEN s_age_grp ELSE s_race END, ''),
+           SUM(pairs)
+    FROM pairs
+    GROUP BY CUBE (borough, crime_type_id),
+             GROUPING SETS ((v_gender, s_gender), (v_gender, s_age_grp), (v_gender, s_race),
+                            (v_age_grp, s_gender), (v_age_grp, s_age_grp), (v_age_grp, s_race),
+                            (v_race, s_gender), (v_race, s_age_grp), (v_race, s_race));
+    GET DIAGNOSTICS n = ROW_COUNT;
+
+    INSERT INTO demographic_crosstab_state (data_version, epoch, refreshed_at, seconds)
+    VALUES (current.version, current.epoch, now(), extract(epoch FROM clock_timestamp() - started))
+    ON CONFLICT (singleton) DO UPDATE
+    SET data_version = EXCLUDED.data_version, epoch = EXCLUDED.epoch,
+        refreshed_at = EXCLUDED.refreshed_at, seconds = EXCLUDED.seconds;
+    ANALYZE demographic_crosstab;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql SET work_mem = '256MB';
+
+SELECT refresh_demographic_crosstab();
@@ -0,0 +1,240 @@
+-- ============================================================
+-- Migration 014: incident_trend_day / incident_trend_month, bucketed counts
+-- ============================================================
+-- The analysis trend and the trend API (trends.py) count incidents per
+-- day, week, month, quarter or year for some crime types and boroughs.
+-- Grouping incidents by EXTRACT(YEAR FROM occurred_date) reads every
+-- matching row and no index helps with the expression; these tables keep
+-- the counts already bucketed per (day | month, borough, crime type), so a
+-- series is a primary-key range read of a few thousand rows:
+--
+--   * incident_trend_day: day and week buckets;
+--   * incident_trend_month: month, quarter and year buckets (a ten-year
+--     monthly series of every borough and crime type reads ~10k rows, the
+--     daily table ~80k).
+--
+-- A row counts incident x classified_as x address rows, the join the
+-- analysis trend always grouped (and columnar.Snapshot.trend still does):
+-- an incident with two crime types counts in both, and an incident without
+-- a jurisdiction counts too, which incident_flat would drop. '' is an
+-- address without a borough.
+--
+-- Triggers add each statement's delta inside the writing transaction:
+--
+--   * incident: an insert, or an update of occurred_date or address_id,
+--     counts its classifications in or moves them between buckets; a status
+--     or description edit changes nothing. A delete is subtracted by a
+--     BEFORE DELETE row trigger, while its classified_as rows are still
+--     there: the cascade that removes them runs after the incident is gone
+--     (about 0.15 ms per incident of a bulk delete).
+--   * classified_as: an insert, delete or crime type edit of an incident
+--     that still exists;
+--   * address: a borough edit moves the counts of the incidents there;
+--   * TRUNCATE of incident or classified_as empties both tables.
+--
+-- rebuild_incident_trend() recounts them if the triggers were ever bypassed
+-- (generate_data.py's replica-mode load).
+--
+-- The tables start empty, so the trigger DDL on incident does not hold its
+-- writers for a recount: 019_incident_trend_fill recounts in its own
+-- transaction if the totals differ.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS incident_trend_day (
+    day           DATE NOT NULL,
+    borough       TEXT NOT NULL,            -- '' for incidents without one
+    crime_type_id INTEGER NOT NULL,
+    incidents     BIGINT NOT NULL,
+    PRIMARY KEY (day, borough, crime_type_id)
+);
+
+CREATE TABLE IF NOT EXISTS incident_trend_month (
+    month         DATE NOT NULL,            -- the first of the month
+    borough       TEXT NOT NULL,
+    crime_type_id INTEGER NOT NULL,
+    incidents     BIGINT NOT NULL,
+    PRIMARY KEY (month, borough, crime_type_id)
+);
+
+-- Replace both tables with a recount. The EXCLUSIVE locks make writers wait
+-- to apply their deltas until after the recount, as in
+-- rebuild_workload_counter() (migrations/012).
+CREATE OR REPLACE FUNCTION rebuild_incident_trend()
+RETURNS BIGINT AS $$
+DECLARE
+    n BIGINT;
+BEGIN
+    LOCK TABLE incident_trend_day, incident_trend_month IN EXCLUSIVE MODE;
+    DELETE FROM incident_trend_day;
+    DELETE FROM incident_trend_month;
+    INSERT INTO incident_trend_day
+    SELECT i.occurred_date, COALESCE(a.borough, ''), ca.crime_type_id, COUNT(*)
+    FROM incident i
+    JOIN classified_as ca ON ca.incident_id = i.incident_id
+    JOIN address a        ON a.address_id = i.address_id
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    INSERT INTO incident_trend_month
+    SELECT date_trunc('month', day)::DATE, borough, crime_type_id, SUM(incidents)
+    FROM incident_trend_day
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3;
+    ANALYZE incident_trend_day;
+    ANALYZE incident_trend_month;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- incident / classified_as / address: count rows in and out of their buckets
+-- ------------------------------------------------------------
+-- The statement's incident x classified_as rows as (occurred_date, borough,
+-- crime_type_id, sign), through EXECUTE as in workload_counter_flat_sync().
+-- Each side reads the other tables' current rows. Keys are applied in order,
+-- so concurrent writers lock the rows they share in the same order.
+CREATE OR REPLACE FUNCTION incident_trend_sync()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta TEXT;
+BEGIN
+    IF TG_TABLE_NAME = 'incident' AND TG_OP = 'INSERT' THEN
+        delta := 'SELECT n.occurred_date, a.borough, ca.crime_type_id, 1 AS sign
+                  FROM new_rows n
+                  JOIN classified_as ca ON ca.incident_id = n.incident_id
+                  JOIN address a        ON a.address_id = n.address_id';
+    ELSIF TG_TABLE_NAME = 'incident' THEN
+        delta := 'SELECT n.occurred_date, a.borough, ca.crime_type_id, 1 AS sign
+                  FROM new_rows n JOIN old_rows o USING (incident_id)
+                  JOIN classified_as ca ON ca.incident_id = n.incident_id
+                  JOIN address a        ON a.address_id = n.address_id
+                  WHERE (n.occurred_date, n.address_id) IS DISTINCT FROM (o.occurred_date, o.address_id)
+                  UNION ALL
+                  SELECT o.occurred_date, a.borough, ca.crime_type_id, -1
+                  FROM new_rows n JOIN old_rows o USING (incident_id)
+                  JOIN classified_as ca ON ca.incident_id = o.incident_id
+                  JOIN address a        ON a.address_id = o.address_id
+                  WHERE (n.occurred_date, n.address_id) IS DISTINCT FROM (o.occurred_date, o.address_id)';
+    ELSIF TG_TABLE_NAME = 'address' THEN
+        delta := 'SELECT i.occurred_date, n.borough, ca.crime_type_id, 1 AS sign
+                  FROM new_rows n JOIN old_rows o USING (address_id)
+                  JOIN incident i       ON i.address_id = n.address_id
+                  JOIN classified_as ca ON ca.incident_id = i.incident_id
+                  WHERE n.borough IS DISTINCT FROM o.borough
+                  UNION ALL
+                  SELECT i.occurred_date, o.borough, ca.crime_type_id, -1
+                  FROM new_rows n JOIN old_rows o USING (address_id)
+                  JOIN incident i       ON i.address_id = o.address_id
+                  JOIN classified_as ca ON ca.incident_id = i.incident_id
+                  WHERE n.borough IS DISTINCT FROM o.borough';
+    ELSE
+        -- classified_as; rows cascaded from a deleted incident find no incident
+        -- and were subtracted by incident_trend_deleted()
+        IF TG_OP = 'INSERT' THEN
+            delta := 'SELECT crime_type_id, incident_id, 1 AS sign FROM new_rows';
+        ELSIF TG_OP = 'DELETE' THEN
+            delta := 'SELECT crime_type_id, incident_id, -1 AS sign FROM old_rows';
+        ELSE
+            delta := 'SELECT crime_type_id, incident_id, 1 AS sign FROM new_rows
+                      UNION ALL
+                      SELECT crime_type_id, incident_id, -1 FROM old_rows';
+        END IF;
+        delta := format('SELECT i.occurred_date, a.borough, r.crime_type_id, r.sign
+                         FROM (%s) r
+                         JOIN incident i ON i.incident_id = r.incident_id
+                         JOIN address a  ON a.address_id = i.address_id', delta);
+    END IF;
+
+    EXECUTE format($sql$
+        WITH d AS (
+            SELECT occurred_date AS day, COALESCE(borough, '') AS borough, crime_type_id, SUM(sign) AS incidents
+            FROM (%s) r
+            GROUP BY 1, 2, 3
+            HAVING SUM(sign) <> 0
+        ), days AS (
+            INSERT INTO incident_trend_day AS t
+            SELECT * FROM d ORDER BY 1, 2, 3
+            ON CONFLICT (day, borough, crime_type_id) DO UPDATE
+            SET incidents = t.incidents + EXCLUDED.incidents
+        )
+        INSERT INTO incident_trend_month AS t
+        SELECT date_trunc('month', day)::DATE, borough, crime_type_id, SUM(incidents)
+        FROM d
+        GROUP BY 1, 2, 3
+        HAVING SUM(incidents) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (month, borough, crime_type_id) DO UPDATE
+        SET incidents = t.incidents + EXCLUDED.incidents
+    $sql$, delta);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- BEFORE DELETE, per row: the incident's classifications are still there.
+-- Static SQL, so the plan is cached across the rows of a bulk delete; the
+-- buckets exist, as the incident was counted into them.
+CREATE OR REPLACE FUNCTION incident_trend_deleted()
+RETURNS TRIGGER AS $$
+BEGIN
+    WITH d AS (
+        SELECT COALESCE(a.borough, '') AS borough, ca.crime_type_id, -COUNT(*) AS incidents
+        FROM classified_as ca
+        JOIN address a ON a.address_id = OLD.address_id
+        WHERE ca.incident_id = OLD.incident_id
+        GROUP BY 1, 2
+    ), days AS (
+        UPDATE incident_trend_day t
+        SET incidents = t.incidents + d.incidents
+        FROM d
+        WHERE (t.day, t.borough, t.crime_type_id) = (OLD.occurred_date, d.borough, d.crime_type_id)
+    )
+    UPDATE incident_trend_month t
+    SET incidents = t.incidents + d.incidents
+    FROM d
+    WHERE (t.month, t.borough, t.crime_type_id)
+          = (date_trunc('month', OLD.occurred_date)::DATE, d.borough, d.crime_type_id);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION incident_trend_truncated()
+RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE incident_trend_day, incident_trend_month;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS incident_trend_insert ON incident;
+CREATE TRIGGER incident_trend_insert AFTER INSERT ON incident
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_sync();
+DROP TRIGGER IF EXISTS incident_trend_update ON incident;
+CREATE TRIGGER incident_trend_update AFTER UPDATE ON incident
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_sync();
+DROP TRIGGER IF EXISTS incident_trend_delete ON incident;
+CREATE TRIGGER incident_trend_delete BEFORE DELETE ON incident
+    FOR EACH ROW EXECUTE FUNCTION incident_trend_deleted();
+DROP TRIGGER IF EXISTS incident_trend_truncate ON incident;
+CREATE TRIGGER incident_trend_truncate AFTER TRUNCATE ON incident
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_truncated();
+DROP TRIGGER IF EXISTS classified_as_trend_insert ON classified_as;
+CREATE TRIGGER classified_as_trend_insert AFTER INSERT ON classified_as
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_sync();
+DROP TRIGGER IF EXISTS classified_as_trend_update ON classified_as;
+CREATE TRIGGER classified_as_trend_update AFTER UPDATE ON classified_as
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_sync();
+DROP TRIGGER IF EXISTS classified_as_trend_delete ON classified_as;
+CREATE TRIGGER classified_as_trend_delete AFTER DELETE ON classified_as
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_sync();
+DROP TRIGGER IF EXISTS classified_as_trend_truncate ON classified_as;
+CREATE TRIGGER classified_as_trend_truncate AFTER TRUNCATE ON classified_as
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_truncated();
+DROP TRIGGER IF EXISTS address_trend_update ON address;
+CREATE TRIGGER address_trend_update AFTER UPDATE ON address
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION incident_trend_sync();
@@ -0,0 +1,24 @@
+-- migrate:backfill table=incident key=incident_id batch_size=5000 sleep_ms=50
+-- ============================================================
+-- Migration 015: copy existing incidents into incident_flat
+-- ============================================================
+-- 007 creates incident_flat and the triggers that keep it current; the
+-- incidents that were already there are added here by run_migrations.py,
+-- one incident_id range per transaction, so a batch holds its locks for
+-- tens of milliseconds instead of the whole table for a minute.
+--
+-- Incidents that already have rows (written by the triggers since 007, or
+-- by a previous, interrupted run) are skipped, so rerunning is cheap. FOR
+-- UPDATE waits for a transaction still writing one of the batch's
+-- incidents, whose trigger would otherwise insert the same rows; after
+-- the wait refresh_incident_flat() replaces whatever it committed.
+--
+-- The 012 and 014 triggers on incident_flat count these inserts as they go.
+-- ============================================================
+SELECT refresh_incident_flat(ARRAY(
+    SELECT i.incident_id
+    FROM incident i
+    WHERE i.incident_id >= :batch_start AND i.incident_id < :batch_end
+      AND NOT EXISTS (SELECT 1 FROM incident_flat f WHERE f.incident_id = i.incident_id)
+    FOR UPDATE OF i
+));
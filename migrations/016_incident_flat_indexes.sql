@@ -0,0 +1,32 @@
+-- ============================================================
+-- Migration 016: the incident_flat list indexes
+-- ============================================================
+-- Built after 015 has filled the table (one pass each instead of
+-- maintaining them row by row during the backfill) and CONCURRENTLY
+-- (autocommit mode in run_migrations.py), so the list pages and writers
+-- keep running while they build.
+-- ============================================================
+
+-- No filter / date range: newest first, stop after LIMIT rows.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_occurred
+    ON incident_flat (occurred_date DESC);
+
+-- One index per equality filter, each already in list order.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_status_occurred
+    ON incident_flat (status, occurred_date DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_borough_occurred
+    ON incident_flat (borough, occurred_date DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_postal_occurred
+    ON incident_flat (postal_code, occurred_date DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_category_occurred
+    ON incident_flat (category, occurred_date DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_severity_occurred
+    ON incident_flat (severity, occurred_date DESC);
+
+-- Reference data renames copy to every row using the value.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_crime_type_id
+    ON incident_flat (crime_type_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incident_flat_address_id
+    ON incident_flat (address_id);
+
+ANALYZE incident_flat;
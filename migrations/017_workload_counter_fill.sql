@@ -0,0 +1,18 @@
+-- ============================================================
+-- Migration 017: the initial workload_counter recount
+-- ============================================================
+-- 012 creates workload_counter and its triggers without counting the rows
+-- already there, so writers to incident_flat and suspect are not held up
+-- behind the trigger DDL for the length of a recount. On a database whose
+-- incident_flat was filled after 012 (015), the triggers have counted
+-- everything and this finds no drift; otherwise it rebuilds the counters
+-- here, in a transaction of its own. Only the rebuild locks
+-- workload_counter (about 3 s on 1M incidents), and only writers whose
+-- triggers update it in that window wait.
+--
+-- Same as `python workload.py --repair`, which can run instead at a quieter
+-- time: apply 016 with --target 16, then record 017 with --baseline 17.
+-- ============================================================
+
+SELECT rebuild_workload_counter()
+WHERE EXISTS (SELECT 1 FROM workload_counter_drift);
@@ -0,0 +1,14 @@
+-- ============================================================
+-- Migration 018: the first demographic_crosstab snapshot after the backfill
+-- ============================================================
+-- 013 computes the snapshot from incident_flat, which on a new database is
+-- only filled later, by the batched backfill in 015. That snapshot is then
+-- empty while data_version says it is current (the backfill changes no
+-- incidents), so the page would show no pairs until the next refresh.
+-- Refresh once more if so; where 013 already saw the rows this does
+-- nothing. The refresh writes only the crosstab tables.
+-- ============================================================
+
+SELECT refresh_demographic_crosstab()
+WHERE NOT EXISTS (SELECT 1 FROM demographic_crosstab)
+  AND EXISTS (SELECT 1 FROM incident_flat);
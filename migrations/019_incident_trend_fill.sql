@@ -0,0 +1,19 @@
+-- ============================================================
+-- Migration 019: the initial incident_trend recount
+-- ============================================================
+-- 014 creates incident_trend_day / _month and their triggers without
+-- counting the incidents already there, so writers are not held up behind
+-- the trigger DDL for the length of a recount. Where the incidents were all
+-- loaded after 014 the triggers have counted every classification and the
+-- totals match; otherwise the tables are rebuilt here, in a transaction of
+-- its own that locks only the two trend tables (about 5 s on 1M incidents).
+--
+-- Same as `python trends.py --rebuild`.
+-- ============================================================
+
+SELECT rebuild_incident_trend()
+WHERE (SELECT COALESCE(SUM(incidents), 0) FROM incident_trend_month)
+      <> (SELECT COUNT(*)
+          FROM incident i
+          JOIN classified_as ca ON ca.incident_id = i.incident_id
+          JOIN address a        ON a.address_id = i.address_id);
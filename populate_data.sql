@@ -11,87 +11,112 @@
 -- ============================================================
 -- Update weapons for suspects based on crime types and realistic scenarios
 -- We'll update at least 20 suspects with various weapons
+-- (Postgres has no UPDATE ... LIMIT, so each batch picks its rows in a subquery)
 
 UPDATE suspect 
 SET weapons = ARRAY['knife', 'handgun']
-WHERE incident_id IN (
-    SELECT i.incident_id 
-    FROM incident i
-    JOIN classified_as ca ON i.incident_id = ca.incident_id
-    JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-    WHERE LOWER(ct.crime_type) LIKE '%robbery%'
+WHERE (incident_id, suspect_id) IN (
+    SELECT s.incident_id, s.suspect_id
+    FROM suspect s
+    WHERE s.incident_id IN (
+        SELECT i.incident_id 
+        FROM incident i
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
+        WHERE LOWER(ct.crime_type) LIKE '%robbery%'
+        LIMIT 5
+    )
+    AND s.weapons IS NULL
     LIMIT 5
-)
-AND weapons IS NULL
-LIMIT 5;
+);
 
 UPDATE suspect 
 SET weapons = ARRAY['knife']
-WHERE incident_id IN (
-    SELECT i.incident_id 
-    FROM incident i
-    JOIN classified_as ca ON i.incident_id = ca.incident_id
-    JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-    WHERE LOWER(ct.crime_type) LIKE '%assault%'
+WHERE (incident_id, suspect_id) IN (
+    SELECT s.incident_id, s.suspect_id
+    FROM suspect s
+    WHERE s.incident_id IN (
+        SELECT i.incident_id 
+        FROM incident i
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
+        WHERE LOWER(ct.crime_type) LIKE '%assault%'
+        LIMIT 5
+    )
+    AND s.weapons IS NULL
     LIMIT 5
-)
-AND weapons IS NULL
-LIMIT 5;
+);
 
 -- Burglary suspects with handgun
 UPDATE suspect 
 SET weapons = ARRAY['handgun']
-WHERE incident_id IN (
-    SELECT i.incident_id 
-    FROM incident i
-    JOIN classified_as ca ON i.incident_id = ca.incident_id
-    JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-    WHERE LOWER(ct.crime_type) LIKE '%burglary%'
-    LIMIT 5
-)
-AND weapons IS NULL
-LIMIT 3;
+WHERE (incident_id, suspect_id) IN (
+    SELECT s.incident_id, s.suspect_id
+    FROM suspect s
+    WHERE s.incident_id IN (
+        SELECT i.incident_id 
+        FROM incident i
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
+        WHERE LOWER(ct.crime_type) LIKE '%burglary%'
+        LIMIT 5
+    )
+    AND s.weapons IS NULL
+    LIMIT 3
+);
 
 -- Burglary suspects with baseball bat
 UPDATE suspect 
 SET weapons = ARRAY['baseball_bat']
-WHERE incident_id IN (
-    SELECT i.incident_id 
-    FROM incident i
-    JOIN classified_as ca ON i.incident_id = ca.incident_id
-    JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-    WHERE LOWER(ct.crime_type) LIKE '%burglary%'
-    LIMIT 5
-)
-AND weapons IS NULL
-LIMIT 3;
+WHERE (incident_id, suspect_id) IN (
+    SELECT s.incident_id, s.suspect_id
+    FROM suspect s
+    WHERE s.incident_id IN (
+        SELECT i.incident_id 
+        FROM incident i
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
+        WHERE LOWER(ct.crime_type) LIKE '%burglary%'
+        LIMIT 5
+    )
+    AND s.weapons IS NULL
+    LIMIT 3
+);
 
 UPDATE suspect 
 SET weapons = ARRAY['blunt_object', 'rope']
-WHERE incident_id IN (
-    SELECT i.incident_id 
-    FROM incident i
-    JOIN classified_as ca ON i.incident_id = ca.incident_id
-    JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-    WHERE LOWER(ct.crime_type) LIKE '%kidnapping%' OR LOWER(ct.crime_type) LIKE '%abduction%'
+WHERE (incident_id, suspect_id) IN (
+    SELECT s.incident_id, s.suspect_id
+    FROM suspect s
+    WHERE s.incident_id IN (
+        SELECT i.incident_id 
+        FROM incident i
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
+        WHERE LOWER(ct.crime_type) LIKE '%kidnapping%' OR LOWER(ct.crime_type) LIKE '%abduction%'
+        LIMIT 3
+    )
+    AND s.weapons IS NULL
     LIMIT 3
-)
-AND weapons IS NULL
-LIMIT 3;
+);
 
 -- Additional suspects with different weapons for variety
 UPDATE suspect 
 SET weapons = ARRAY['blunt_object']
-WHERE incident_id IN (
-    SELECT i.incident_id 
-    FROM incident i
-    JOIN classified_as ca ON i.incident_id = ca.incident_id
-    JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-    WHERE LOWER(ct.crime_type) LIKE '%assault%'
-    LIMIT 5
-)
-AND weapons IS NULL
-LIMIT 2;
+WHERE (incident_id, suspect_id) IN (
+    SELECT s.incident_id, s.suspect_id
+    FROM suspect s
+    WHERE s.incident_id IN (
+        SELECT i.incident_id 
+        FROM incident i
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
+        WHERE LOWER(ct.crime_type) LIKE '%assault%'
+        LIMIT 5
+    )
+    AND s.weapons IS NULL
+    LIMIT 2
+);
 
 -- Set all remaining suspects with no weapons (unarmed)
 -- This ensures all tuples have meaningful values for the weapons attribute
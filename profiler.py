@@ -0,0 +1,244 @@
+"""
+Opt-in sampling profiler for the Flask routes.
+
+A fraction of requests per endpoint is picked for sampling. While a picked
+request runs, one background thread snapshots that request thread's Python
+stack every few milliseconds and folds it into collapsed stacks
+("outer;inner;leaf count"), aggregated per endpoint. The result can be
+downloaded from /admin/profiles and fed straight into flamegraph.pl or
+speedscope.
+
+Configuration (environment):
+    PROFILE_SAMPLE_RATE   default fraction of requests to sample (0 = off)
+    PROFILE_ROUTES        per-endpoint overrides, e.g. "index=0.2,recommendations=1"
+    PROFILE_INTERVAL_MS   sampling interval in milliseconds (default 5)
+    PROFILE_DIR           optional directory; each process flushes its stacks
+                          there so the download merges all worker processes
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, g, request
+
+MAX_STACK_DEPTH = 128
+FLUSH_EVERY_SECONDS = 10
+
+
+def _parse_route_rates(raw):
+    rates = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        endpoint, rate = part.split("=", 1)
+        try:
+            rates[endpoint.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, sample_rate=0.0, route_rates=None, interval=0.005, profile_dir=None):
+        self.sample_rate = sample_rate
+        self.route_rates = route_rates or {}
+        self.interval = interval
+        self.profile_dir = profile_dir
+
+        self._lock = threading.Lock()
+        self._active = {}              # thread id -> endpoint
+        self._stacks = {}              # endpoint -> Counter(collapsed stack -> samples)
+        self._requests = Counter()     # endpoint -> sampled request count
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._dirty = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE") or 0),
+            route_rates=_parse_route_rates(os.environ.get("PROFILE_ROUTES")),
+            interval=float(os.environ.get("PROFILE_INTERVAL_MS") or 5) / 1000.0,
+            profile_dir=os.environ.get("PROFILE_DIR") or None,
+        )
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or any(r > 0 for r in self.route_rates.values())
+
+    def rate_for(self, endpoint):
+        return self.route_rates.get(endpoint, self.sample_rate)
+
+    # ---------- request hooks ----------
+    def start_request(self, endpoint):
+        if not endpoint or endpoint.startswith("profiles_"):
+            return False
+        if random.random() >= self.rate_for(endpoint):
+            return False
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            self._requests[endpoint] += 1
+        self._ensure_thread()
+        self._wakeup.set()
+        return True
+
+    def stop_request(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    # ---------- sampler thread ----------
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="route-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        last_flush = time.monotonic()
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                # Nothing to sample: sleep until a sampled request starts.
+                self._wakeup.wait(FLUSH_EVERY_SECONDS)
+                self._wakeup.clear()
+            else:
+                frames = sys._current_frames()
+                folded = []
+                for tid, endpoint in active.items():
+                    frame = frames.get(tid)
+                    if frame is None or tid == me:
+                        continue
+                    folded.append((endpoint, self._collapse(frame)))
+                del frames
+                with self._lock:
+                    for endpoint, stack in folded:
+                        self._stacks.setdefault(endpoint, Counter())[stack] += 1
+                    self._dirty = self._dirty or bool(folded)
+                time.sleep(self.interval)
+
+            if self.profile_dir and time.monotonic() - last_flush >= FLUSH_EVERY_SECONDS:
+                self.flush()
+                last_flush = time.monotonic()
+
+    @staticmethod
+    def _collapse(frame):
+        labels = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    # ---------- output ----------
+    def snapshot(self):
+        with self._lock:
+            return {ep: Counter(c) for ep, c in self._stacks.items()}, Counter(self._requests)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._requests.clear()
+            self._dirty = True
+        if self.profile_dir:
+            self.flush()
+
+    def _own_file(self, endpoint):
+        return os.path.join(self.profile_dir, f"{endpoint}.{os.getpid()}.folded")
+
+    def flush(self):
+        """Write this process's stacks to PROFILE_DIR (one file per endpoint)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            stacks = {ep: Counter(c) for ep, c in self._stacks.items()}
+            self._dirty = False
+        os.makedirs(self.profile_dir, exist_ok=True)
+        pid_suffix = f".{os.getpid()}.folded"
+        for name in os.listdir(self.profile_dir):
+            if name.endswith(pid_suffix) and name[:-len(pid_suffix)] not in stacks:
+                os.remove(os.path.join(self.profile_dir, name))
+        for endpoint, counter in stacks.items():
+            tmp = self._own_file(endpoint) + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(format_folded(counter))
+            os.replace(tmp, self._own_file(endpoint))
+
+    def merged(self):
+        """Stacks of this process plus those flushed by sibling processes."""
+        stacks, _ = self.snapshot()
+        if not self.profile_dir or not os.path.isdir(self.profile_dir):
+            return stacks
+        own_suffix = f".{os.getpid()}.folded"
+        for name in os.listdir(self.profile_dir):
+            if not name.endswith(".folded") or name.endswith(own_suffix):
+                continue
+            endpoint = name.rsplit(".", 2)[0]
+            counter = stacks.setdefault(endpoint, Counter())
+            with open(os.path.join(self.profile_dir, name)) as f:
+                for line in f:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack and count.isdigit():
+                        counter[stack] += int(count)
+        return stacks
+
+
+def format_folded(counter):
+    return "".join(f"{stack} {count}\n" for stack, count in counter.most_common())
+
+
+def init_app(app, profiler=None):
+    """Attach the profiler hooks and the /admin/profiles download routes."""
+    profiler = profiler or SamplingProfiler.from_env()
+    app.extensions["route_profiler"] = profiler
+
+    @app.before_request
+    def _profile_start():
+        g.profiled = profiler.enabled and profiler.start_request(request.endpoint)
+
+    @app.teardown_request
+    def _profile_stop(exception):
+        if g.get("profiled"):
+            profiler.stop_request()
+
+    @app.route("/admin/profiles")
+    def profiles_index():
+        stacks = profiler.merged()
+        _, requests_seen = profiler.snapshot()
+        lines = [f"# sample_rate={profiler.sample_rate} interval_ms={profiler.interval * 1000:g}"]
+        lines.append("# endpoint\tsampled_requests(this process)\tstack_samples\tdownload")
+        for endpoint in sorted(stacks):
+            lines.append(
+                f"{endpoint}\t{requests_seen.get(endpoint, 0)}\t{sum(stacks[endpoint].values())}\t"
+                f"/admin/profiles/{endpoint}.folded"
+            )
+        return Response("\n".join(lines) + "\n", mimetype="text/plain")
+
+    @app.route("/admin/profiles/<endpoint>.folded")
+    def profiles_download(endpoint):
+        counter = profiler.merged().get(endpoint)
+        if counter is None:
+            abort(404)
+        return Response(
+            format_folded(counter),
+            mimetype="text/plain",
+            headers={"Content-Disposition": f"attachment; filename={endpoint}.folded"},
+        )
+
+    @app.route("/admin/profiles/reset", methods=["POST"])
+    def profiles_reset():
+        profiler.reset()
+        return Response("reset\n", mimetype="text/plain")
+
+    return profiler
@@ -0,0 +1,1144 @@
+"""
+SQL used by the routes in server.py.
+
+The routes only read request arguments and render templates; the SQL text and
+its bind parameters are built here, so other tools (check_query_plans.py, the
+benchmarks) can enumerate exactly the statements a route would run for a
+given set of filters. `args` is anything with .get() (and .getlist() for the
+list pages), e.g. request.args or a werkzeug MultiDict.
+"""
+from datetime import date, timedelta
+
+LIST_PAGE_SIZE = 20
+
+# ------------------------------------------------------------
+# /incidents and /admin list pages
+# ------------------------------------------------------------
+# incident_flat (migrations/007) is the six-table join of incident, address,
+# jurisdiction, classified_as, crimetype and lawcategory, kept by triggers:
+# one row per (incident, crime type), so the list reads a single table.
+LIST_FROM = """
+        FROM incident_flat f
+"""
+
+LIST_COLUMNS = """
+            f.occurred_date,
+            f.crime_type,
+            f.category,
+            f.severity,
+            f.status,
+            f.jurisdiction,
+            f.borough,
+            f.postal_code"""
+
+# request arg -> filter name, in form order (used to enumerate query shapes)
+LIST_FILTER_ARGS = (
+    "lawcategory", "status", "borough", "severity", "crime_type", "postal_code",
+    "date_start", "date_end", "victim_gender", "victim_age_grp", "victim_ethnicity",
+)
+
+
+def handle_wildcards_characters(s):
+    s = s.replace("\\", "\\\\")
+    s = s.replace("%", "\\%")
+    s = s.replace("_", "\\_")
+    return s
+
+
+def incident_list_filter(args):
+    """WHERE clause and params shared by the /incidents and /admin filter forms."""
+    filters = []
+    params = {}
+
+    lawcategory = args.get("lawcategory")
+    if lawcategory:
+        filters.append("f.category = :lawcategory")
+        params["lawcategory"] = lawcategory
+
+    status = args.get("status")
+    if status:
+        filters.append("f.status = :status")
+        params["status"] = status
+
+    borough = args.getlist("borough")
+    if borough:
+        filters.append("f.borough = ANY(:borough)")
+        params["borough"] = borough
+
+    severity = args.get("severity")
+    if severity:
+        filters.append("f.severity = :severity")
+        params["severity"] = severity
+
+    clean_crime_type = (args.get("crime_type") or "").strip().lower()
+    if clean_crime_type:
+        # escape % and _ on our side; use ESCAPE '\'
+        filters.append("f.crime_type ILIKE :crime_type ESCAPE '\\'")
+        params["crime_type"] = f"%{handle_wildcards_characters(clean_crime_type)}%"
+
+    postal_code = args.get("postal_code")
+    if postal_code:
+        filters.append("f.postal_code = :postal_code")
+        params["postal_code"] = postal_code
+
+    date_start = args.get("date_start")
+    if date_start:
+        filters.append("f.occurred_date >= :date_start")
+        params["date_start"] = date_start
+
+    date_end = args.get("date_end")
+    if date_end:
+        filters.append("f.occurred_date <= :date_end")
+        params["date_end"] = date_end
+
+    # ----- Victim EXISTS subfilter (prevents duplicate incidents) -----
+    victim_clauses = []
+    if args.get("victim_gender"):
+        victim_clauses.append("v.gender = :v_gender")
+        params["v_gender"] = args.get("victim_gender")
+    if args.get("victim_age_grp"):
+        victim_clauses.append("v.age_grp = :v_age_grp")
+        params["v_age_grp"] = args.get("victim_age_grp")
+    if args.get("victim_ethnicity"):
+        victim_clauses.append("v.race = :v_ethnicity")
+        params["v_ethnicity"] = args.get("victim_ethnicity")
+
+    if victim_clauses:
+        filters.append(
+            "EXISTS (SELECT 1 FROM victim v WHERE v.incident_id = f.incident_id AND "
+            + " AND ".join(victim_clauses) + ")"
+        )
+
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
+    return where_clause, params
+
+
+# facet -> incident_flat column; a facet is named after its filter's request arg
+LIST_FACETS = {
+    "borough": "f.borough",
+    "severity": "f.severity",
+    "status": "f.status",
+    "lawcategory": "f.category",
+}
+
+
+def incident_facets_sql(where_clause):
+    """Matching rows per value of each facet, plus the total, in one GROUPING SETS pass.
+
+    Rows are (facet, value, total); the grand-total row has facet NULL.
+    """
+    which = "\n".join(f"                 WHEN GROUPING({column}) = 0 THEN '{facet}'"
+                       for facet, column in LIST_FACETS.items())
+    columns = ", ".join(LIST_FACETS.values())
+    sets = ", ".join(f"({column})" for column in LIST_FACETS.values())
+    return f"""
+        SELECT CASE
+{which}
+               END AS facet,
+               COALESCE({columns}) AS value,
+               COUNT(*) AS total
+        {LIST_FROM}
+        {where_clause}
+        GROUP BY GROUPING SETS ({sets}, ())
+    """
+
+
+def facet_counts(rows):
+    """{facet: {value: count}, ..., "total": count} from incident_facets_sql rows."""
+    facets = {facet: {} for facet in LIST_FACETS}
+    facets["total"] = 0
+    for row in rows:
+        if row.facet is None:
+            facets["total"] = row.total
+        else:
+            facets[row.facet][row.value] = row.total
+    return facets
+
+
+def incident_page_sql(where_clause, id_first=False):
+    """One page of the list; /admin wants incident_id first, /incidents last."""
+    columns = f"\n            f.incident_id,{LIST_COLUMNS}" if id_first else f"{LIST_COLUMNS},\n            f.incident_id"
+    return f"""
+        SELECT{columns}
+        {LIST_FROM}
+        {where_clause}
+        ORDER BY f.occurred_date DESC
+        LIMIT :limit OFFSET :offset
+    """
+
+
+def page_params(params, page):
+    return {**params, "limit": LIST_PAGE_SIZE, "offset": (page - 1) * LIST_PAGE_SIZE}
+
+
+# ------------------------------------------------------------
+# incident detail pages (/incident/<id>, /admin/<id>)
+# ------------------------------------------------------------
+INCIDENT_DETAIL_SQL = """
+        SELECT
+            i.incident_id,
+            i.occurred_date,
+            i.status,
+            i.incident_details AS description,
+            ct.crime_type,
+            lc.category,
+            ct.severity,
+            j.description AS jurisdiction,
+            a.borough,
+            a.postal_code
+        FROM incident i
+        JOIN address a        ON i.address_id = a.address_id
+        JOIN jurisdiction j   ON i.jur_id = j.jur_id
+        JOIN classified_as ca ON i.incident_id = ca.incident_id
+        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
+        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
+        WHERE i.incident_id = :incident_id
+"""
+
+INCIDENT_SUSPECTS_SQL = """
+        SELECT suspect_id, gender, race, age_grp, arrest_status
+        FROM suspect
+        WHERE incident_id = :incident_id
+        ORDER BY suspect_id
+"""
+
+ADMIN_INCIDENT_SUSPECTS_SQL = """
+        SELECT suspect_id, gender, race, age_grp, arrest_status, weapons
+        FROM suspect
+        WHERE incident_id = :incident_id
+        ORDER BY suspect_id
+"""
+
+INCIDENT_VICTIMS_SQL = """
+        SELECT victim_id, gender, race, injury_severity, age_grp
+        FROM victim
+        WHERE incident_id = :incident_id
+        ORDER BY victim_id
+"""
+
+INCIDENT_CLUES_SQL = """
+        SELECT sc.clue_id, sc.suspect_id, sc.clue_text, sc.clue_tsv
+        FROM suspect_clue sc
+        WHERE sc.incident_id = :incident_id
+        ORDER BY sc.clue_id
+"""
+
+# ------------------------------------------------------------
+# reference data (dropdowns)
+# ------------------------------------------------------------
+CRIME_TYPES_SQL = """
+        SELECT ct.crime_type_id, ct.crime_type, ct.severity, lc.category
+        FROM crimetype ct
+        JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
+        ORDER BY lc.category, ct.crime_type
+"""
+
+JURISDICTIONS_SQL = """
+        SELECT jur_id, description
+        FROM jurisdiction
+        ORDER BY description
+"""
+
+LAW_CATEGORIES_SQL = """
+        SELECT law_cat_id, category FROM lawcategory ORDER BY law_cat_id
+"""
+
+# ------------------------------------------------------------
+# /incidents/analysis
+# ------------------------------------------------------------
+PRESETS_DAYS = {"90d": 90, "1y": 365, "5y": 365*5, "10y": 365*10}
+# The page's sections, each fetched on its own from /incidents/analysis/<section>
+# (query: SECTION_QUERIES["incidents_analysis.<section>"]).
+ANALYSIS_SECTIONS = ("top10", "custom", "trend")
+
+
+def analysis_top10_query(args, today=None):
+    """Section 1: top 10 crime types for a time window / borough / postal code."""
+    window = args.get("window", "all")  # 90d, 1y, 5y, 10y, all
+    borough = args.get("borough")
+    postal_code = args.get("postal_code")
+
+    filters = []
+    parameters = {}
+
+    if window != "all":
+        cutoff_date = (today or date.today()) - timedelta(days=PRESETS_DAYS.get(window, 90))
+        filters.append("i.occurred_date >= :cutoff_date")
+        parameters["cutoff_date"] = cutoff_date
+
+    if borough:
+        filters.append("a.borough = :borough")
+        parameters["borough"] = borough
+
+    if postal_code:
+        filters.append("a.postal_code = :postal_code")
+        parameters["postal_code"] = postal_code
+
+    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
+
+    sql = f"""
+    WITH counts AS (
+    SELECT
+        ct.crime_type_id,
+        lc.category,
+        ct.crime_type,
+        COUNT(*) AS incident_count
+    FROM classified_as ca
+    JOIN crimetype ct ON ct.crime_type_id = ca.crime_type_id
+    JOIN incident i ON i.incident_id = ca.incident_id
+    JOIN address a ON a.address_id = i.address_id
+    JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
+    {where_clause}
+    GROUP BY ct.crime_type_id, ct.crime_type, lc.category
+    ),
+    ranked AS (
+    SELECT
+        c.*,
+        DENSE_RANK() OVER (ORDER BY c.incident_count DESC) AS rnk
+    FROM counts c
+    )
+    SELECT category as law_category, crime_type, incident_count
+    FROM ranked
+    WHERE rnk <= 10
+    ORDER BY incident_count DESC, crime_type;
+    """
+    return sql, parameters
+
+
+def analysis_custom_query(args):
+    """Section 2: crime types by postal code and victim demographics."""
+    custom_filters = []
+    custom_parameters = {}
+
+    if args.get("custom_postal_code"):
+        custom_filters.append("a.postal_code = :custom_postal_code")
+        custom_parameters["custom_postal_code"] = args.get("custom_postal_code")
+
+    if args.get("custom_gender"):
+        custom_filters.append("v.gender = :custom_gender")
+        custom_parameters["custom_gender"] = args.get("custom_gender")
+
+    if args.get("custom_age_group"):
+        custom_filters.append("v.age_grp = :custom_age_group")
+        custom_parameters["custom_age_group"] = args.get("custom_age_group")
+
+    if args.get("custom_ethnicity"):
+        custom_filters.append("v.race = :custom_ethnicity")
+        custom_parameters["custom_ethnicity"] = args.get("custom_ethnicity")
+
+    custom_where_clause = "WHERE " + " AND ".join(custom_filters) if custom_filters else ""
+
+    sql = f"""
+    SELECT
+        lc.category as law_category,
+        ct.crime_type,
+        COUNT(*) AS num_incidents
+    FROM incident i
+        JOIN victim v ON v.incident_id = i.incident_id
+        JOIN address a ON i.address_id = a.address_id
+        JOIN classified_as ca ON ca.incident_id = i.incident_id
+        JOIN crimetype ct ON ct.crime_type_id = ca.crime_type_id
+        JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
+    {custom_where_clause}
+    GROUP BY ct.crime_type_id, lc.category, ct.crime_type
+    ORDER BY num_incidents DESC;
+    """
+    return sql, custom_parameters
+
+
+def analysis_trend_query(args):
+    """Section 3: incidents per year, optionally by year range, crime type and borough.
+
+    Read from the monthly counts (incident_trend_month, migrations/014), a
+    primary-key range instead of grouping incidents by EXTRACT(YEAR ...).
+    """
+    trend_filters = []
+    trend_parameters = {}
+
+    year_from = args.get("year_from")
+    if year_from:
+        trend_filters.append("t.month >= :year_from")
+        trend_parameters["year_from"] = f"{int(year_from)}-01-01"
+
+    year_to = args.get("year_to")
+    if year_to:
+        trend_filters.append("t.month <= :year_to")
+        trend_parameters["year_to"] = f"{int(year_to)}-12-31"
+
+    if args.get("crime_type_id"):
+        trend_filters.append("t.crime_type_id = :crime_type_id")
+        trend_parameters["crime_type_id"] = args.get("crime_type_id")
+
+    if args.get("trend_borough"):
+        trend_filters.append("t.borough = :trend_borough")
+        trend_parameters["trend_borough"] = args.get("trend_borough")
+
+    where_clause_trend = "WHERE " + " AND ".join(trend_filters) if trend_filters else ""
+
+    sql = f"""
+    SELECT
+        EXTRACT(YEAR FROM t.month)::INT AS year,
+        SUM(t.incidents)::BIGINT AS num_incidents
+    FROM incident_trend_month t
+    {where_clause_trend}
+    GROUP BY year
+    HAVING SUM(t.incidents) > 0
+    ORDER BY year;
+    """
+    return sql, trend_parameters
+
+
+# ------------------------------------------------------------
+# /recommendations
+# ------------------------------------------------------------
+def recommendation_params(args):
+    return {
+        "gender": (args.get("gender") or "").strip(),
+        "age_grp": (args.get("age_grp") or "").strip(),
+        "race": (args.get("race") or "").strip(),
+    }
+
+
+# Section A: Top 10 "safest" (lowest demographic match %)
+# Notes:
+# - We only include rows with BOTH postal_code and borough present.
+# - If no demographic filters were supplied (all empty), demo_incidents == total_incidents,
+#   so demo_pct == 100% for all rows. That's expected: "people like me" == everyone.
+RECOMMENDATIONS_TOP10_SQL = """
+    WITH base AS (
+      SELECT
+        i.incident_id,
+        a.postal_code::text AS postal_code,
+        a.borough
+      FROM incident i
+      JOIN address a        ON a.address_id = i.address_id
+      WHERE a.postal_code IS NOT NULL
+        AND a.postal_code <> ''
+        AND a.borough IS NOT NULL
+        AND a.borough <> ''
+    ),
+    tot AS (
+      SELECT
+        b.postal_code,
+        b.borough,
+        COUNT(DISTINCT b.incident_id) AS total_incidents
+      FROM base b
+      GROUP BY b.postal_code, b.borough
+    ),
+    demo AS (
+      SELECT
+        b.postal_code,
+        b.borough,
+        COUNT(DISTINCT b.incident_id) AS demo_incidents
+      FROM base b
+      WHERE
+        -- If all demographic filters are empty, count EVERY incident as matching.
+        (:gender = '' AND :age_grp = '' AND :race = '')
+        OR EXISTS (
+            SELECT 1
+            FROM victim v
+            WHERE v.incident_id = b.incident_id
+              AND (:gender  = '' OR v.gender = :gender)
+              AND (:age_grp = '' OR v.age_grp = :age_grp)
+              AND (:race    = '' OR v.race   = :race)
+        )
+      GROUP BY b.postal_code, b.borough
+    )
+    SELECT
+      t.postal_code,
+      t.borough,
+      t.total_incidents,
+      COALESCE(d.demo_incidents, 0) AS demo_incidents,
+      CASE WHEN t.total_incidents = 0
+           THEN 0.0
+           ELSE ROUND(100.0 * COALESCE(d.demo_incidents,0) / t.total_incidents, 2)
+      END AS demo_pct
+    FROM tot t
+    LEFT JOIN demo d
+      ON d.postal_code = t.postal_code AND d.borough = t.borough
+    -- SAFEST first = lowest demographic match percentage.
+    ORDER BY demo_pct ASC, t.total_incidents DESC, t.postal_code ASC
+    LIMIT 10;
+"""
+
+# Section B: risk for a specific postal code (postal+borough-consistent)
+# postal_code is compared uncast so idx_address_postal_code (migration 002) applies.
+RECOMMENDATIONS_ZIP_SQL = """
+        -- Find a concrete borough for this ZIP (prefer any non-null value).
+        WITH zz AS (
+          SELECT a.borough
+          FROM address a
+          JOIN incident i ON i.address_id = a.address_id
+          WHERE a.postal_code = :zip
+            AND a.borough IS NOT NULL AND a.borough <> ''
+          GROUP BY a.borough
+          ORDER BY COUNT(DISTINCT i.incident_id) DESC
+          LIMIT 1
+        ),
+
+        -- Totals per that (zip, borough)
+        tot AS (
+          SELECT COUNT(DISTINCT i.incident_id) AS total_incidents
+          FROM incident i
+          JOIN address a ON a.address_id = i.address_id
+          WHERE a.postal_code = :zip
+            AND a.borough = (SELECT borough FROM zz)
+        ),
+
+        -- "Matching" incidents for the same (zip, borough)
+        demo AS (
+          SELECT COUNT(DISTINCT i.incident_id) AS demo_incidents
+          FROM incident i
+          JOIN address a ON a.address_id = i.address_id
+          WHERE a.postal_code = :zip
+            AND a.borough = (SELECT borough FROM zz)
+            AND (
+                  (:gender = '' AND :age_grp = '' AND :race = '')
+               OR EXISTS (
+                    SELECT 1
+                    FROM victim v
+                    WHERE v.incident_id = i.incident_id
+                      AND (:gender  = '' OR v.gender = :gender)
+                      AND (:age_grp = '' OR v.age_grp = :age_grp)
+                      AND (:race    = '' OR v.race   = :race)
+               )
+            )
+        )
+
+        SELECT
+          CAST(:zip AS text)                     AS postal_code,
+          (SELECT borough FROM zz)               AS borough,
+          (SELECT total_incidents FROM tot)      AS total_incidents,
+          (SELECT demo_incidents  FROM demo)     AS demo_incidents,
+          CASE
+            WHEN (SELECT total_incidents FROM tot) = 0 THEN 0.0
+            ELSE ROUND(
+              100.0 * (SELECT demo_incidents FROM demo)
+                    / NULLIF((SELECT total_incidents FROM tot), 0), 2)
+          END AS demo_pct;
+"""
+
+
+# ------------------------------------------------------------
+# /admin/new and /admin/system writes
+# ------------------------------------------------------------
+# Each form submission is a single statement: data-modifying CTEs chain
+# the inserts, so a new incident with its address, classification,
+# suspects and victims takes one round trip instead of one per row.
+# A single statement is atomic on its own, so the routes run these in
+# autocommit mode, which also saves the BEGIN and COMMIT round trips.
+# Every inserted value sits directly in an INSERT's VALUES or SELECT
+# list, so Postgres coerces the bind parameters to the column types
+# exactly as the old one-row-per-statement INSERTs did.
+SUSPECT_FIELDS = ("gender", "race", "age_grp", "arrest_status")
+VICTIM_FIELDS = ("gender", "race", "injury_severity", "age_grp")
+
+
+def new_incident_sql(n_suspects, n_victims):
+    """One statement that inserts an incident and everything attached to it.
+
+    Bind parameters: b, p, lat, lon (address, reused when an identical one
+    exists), jur, odate, status, details, ctid, and s<i>_<field> / v<i>_<field>
+    for i in range(n_suspects) / range(n_victims). Returns incident_id.
+    """
+    ctes = ["""
+        found_address AS (
+            SELECT address_id
+            FROM address
+            WHERE borough = :b AND postal_code = :p AND latitude = :lat AND longitude = :lon
+            LIMIT 1
+        )""", """
+        new_address AS (
+            INSERT INTO address (borough, postal_code, latitude, longitude)
+            SELECT :b, :p, :lat, :lon
+            WHERE NOT EXISTS (SELECT 1 FROM found_address)
+            RETURNING address_id
+        )""", """
+        new_incident AS (
+            INSERT INTO incident (jur_id, address_id, occurred_date, status, incident_details)
+            SELECT :jur, a.address_id, :odate, :status, :details
+            FROM (SELECT address_id FROM found_address
+                  UNION ALL
+                  SELECT address_id FROM new_address) a
+            RETURNING incident_id
+        )""", """
+        new_classification AS (
+            INSERT INTO classified_as (incident_id, crime_type_id)
+            SELECT incident_id, :ctid FROM new_incident
+        )"""]
+    for table, prefix, fields, n in (("suspect", "s", SUSPECT_FIELDS, n_suspects),
+                                     ("victim", "v", VICTIM_FIELDS, n_victims)):
+        if not n:
+            continue
+        rows = ",\n                ".join(
+            "((SELECT incident_id FROM new_incident), "
+            + ", ".join(f":{prefix}{i}_{f}" for f in fields) + ")"
+            for i in range(n))
+        ctes.append(f"""
+        new_{table}s AS (
+            INSERT INTO {table} (incident_id, {", ".join(fields)})
+            VALUES {rows}
+        )""")
+    return "WITH" + ",".join(ctes) + "\n        SELECT incident_id FROM new_incident"
+
+
+def people_params(prefix, fields, people):
+    """Bind parameters for new_incident_sql from a list of per-person dicts."""
+    return {f"{prefix}{i}_{f}": person[f] for i, person in enumerate(people) for f in fields}
+
+
+# law category must exist and the name must be new under it; both checks
+# and the insert run in one statement and the checks come back as columns
+CREATE_CRIME_TYPE_SQL = """
+        WITH checks AS (
+            SELECT
+              EXISTS (SELECT 1 FROM lawcategory WHERE law_cat_id = :lc) AS law_cat_exists,
+              EXISTS (SELECT 1 FROM crimetype
+                      WHERE law_cat_id = :lc AND lower(crime_type) = :ct_lower) AS duplicate
+        ), inserted AS (
+            INSERT INTO crimetype (law_cat_id, crime_type, severity)
+            SELECT :lc, :ct, :sev
+            FROM checks
+            WHERE law_cat_exists AND NOT duplicate
+            RETURNING crime_type_id
+        )
+        SELECT law_cat_exists, duplicate, (SELECT crime_type_id FROM inserted) AS crime_type_id
+        FROM checks
+"""
+
+# no row back means the jurisdiction already existed
+CREATE_JURISDICTION_SQL = """
+        INSERT INTO jurisdiction (jur_id, description)
+        VALUES (:id, :d)
+        ON CONFLICT (jur_id) DO NOTHING
+        RETURNING jur_id
+"""
+
+
+# ------------------------------------------------------------
+# Conditional GET validators (migrations/004_data_version.sql)
+# ------------------------------------------------------------
+# Read before a page's own queries: if the data changes in between, the
+# page is newer than its ETag and the next revalidation just refetches it.
+DATA_VERSION_SQL = """
+        SELECT version, changed_at FROM data_version
+"""
+
+# Incidents untouched since the last bulk load have no incident_version row.
+# read_at is the data version of the same snapshot (see CacheBus.remember_incident).
+INCIDENT_VERSION_SQL = """
+        SELECT COALESCE(iv.version, d.epoch)       AS version,
+               COALESCE(iv.changed_at, d.epoch_at) AS changed_at,
+               d.version                           AS read_at
+        FROM data_version d
+        LEFT JOIN incident_version iv ON iv.incident_id = :incident_id
+"""
+
+
+# ------------------------------------------------------------
+# Time budgets and degraded answers (/incidents/analysis, /recommendations)
+# ------------------------------------------------------------
+# When a section's query runs out of its route's time budget, the route
+# serves the last good result for the same query, or else the section's
+# coarse variant: the same query keeping only the arguments listed here,
+# which refresh_fallbacks.py keeps computed. None: no coarse variant.
+SECTION_QUERIES = {
+    "incidents_analysis.top10": analysis_top10_query,
+    "incidents_analysis.custom": analysis_custom_query,
+    "incidents_analysis.trend": analysis_trend_query,
+    "recommendations.top10": lambda args: (RECOMMENDATIONS_TOP10_SQL, recommendation_params(args)),
+}
+
+COARSE_ARGS = {
+    "incidents_analysis.top10": ("window",),
+    "incidents_analysis.custom": (),
+    "incidents_analysis.trend": ("crime_type_id",),
+    "recommendations.top10": ("gender",),
+    "recommendations.zip": None,
+}
+
+
+def section_shape(section, params):
+    """Metrics label for a query shape, named like check_query_plans.py: section[param+param]."""
+    return f"{section}[{'+'.join(sorted(k for k, v in params.items() if v not in (None, '')))}]"
+
+
+def coarse_query(section, args):
+    """(sql, params, dropped args) of the section's coarse variant, or None."""
+    keep = COARSE_ARGS.get(section)
+    if keep is None:
+        return None
+    kept = {name: args.get(name) for name in keep if args.get(name)}
+    dropped = [name for name in args if args.get(name) and name not in kept and name in SECTION_ARGS[section]]
+    sql, params = SECTION_QUERIES[section](kept)
+    return sql, params, dropped
+
+
+def coarse_variants(crime_type_ids, today=None):
+    """Every coarse (section, sql, params) worth precomputing."""
+    for window in list(PRESETS_DAYS) + ["all"]:
+        yield ("incidents_analysis.top10",) + analysis_top10_query({"window": window}, today=today)
+    yield ("incidents_analysis.custom",) + analysis_custom_query({})
+    for crime_type_id in [None] + [str(c) for c in crime_type_ids]:
+        yield ("incidents_analysis.trend",) + analysis_trend_query({"crime_type_id": crime_type_id})
+    for gender in ("", "Female", "Male"):
+        yield ("recommendations.top10", RECOMMENDATIONS_TOP10_SQL, recommendation_params({"gender": gender}))
+
+
+# request args each section reads (to name what a coarse answer left out, and
+# to build an /incidents/analysis/<section> URL from the page's args)
+SECTION_ARGS = {
+    "incidents_analysis.top10": ("window", "borough", "postal_code"),
+    "incidents_analysis.custom": ("custom_postal_code", "custom_gender", "custom_age_group", "custom_ethnicity"),
+    "incidents_analysis.trend": ("year_from", "year_to", "crime_type_id", "trend_borough"),
+    "recommendations.top10": ("gender", "age_grp", "race"),
+}
+
+
+def section_args(section, args):
+    """The non-empty args of request args that section reads, in SECTION_ARGS order."""
+    return {name: args.get(name) for name in SECTION_ARGS[section] if args.get(name)}
+
+
+# ------------------------------------------------------------
+# Background reports (reports.py)
+# ------------------------------------------------------------
+# The same filters as the pages, over everything: each report runs in
+# chunks (a year, a borough, a keyset batch) so the worker can report progress.
+REPORT_YEARS_SQL = """
+        SELECT EXTRACT(YEAR FROM MIN(occurred_date))::INT AS first_year,
+               EXTRACT(YEAR FROM MAX(occurred_date))::INT AS last_year
+        FROM incident
+"""
+
+REPORT_BOROUGHS_SQL = """
+        SELECT DISTINCT borough FROM address
+        WHERE borough IS NOT NULL AND borough <> ''
+        ORDER BY borough
+"""
+
+
+def report_analysis_query(args, year):
+    """One year of the analysis report: incidents per borough x ZIP x victim demographic.
+
+    Takes the trend section's crime type / borough and the custom section's
+    postal code / demographic filters; an incident with victims of several
+    demographics counts once for each.
+    """
+    filters = ["i.occurred_date >= :year_start", "i.occurred_date < :next_year_start"]
+    parameters = {"year_start": date(year, 1, 1), "next_year_start": date(year + 1, 1, 1)}
+
+    if args.get("crime_type_id"):
+        filters.append("EXISTS (SELECT 1 FROM classified_as ca"
+                       " WHERE ca.incident_id = i.incident_id AND ca.crime_type_id = :crime_type_id)")
+        parameters["crime_type_id"] = int(args.get("crime_type_id"))
+
+    if args.get("trend_borough"):
+        filters.append("a.borough = :trend_borough")
+        parameters["trend_borough"] = args.get("trend_borough")
+
+    if args.get("custom_postal_code"):
+        filters.append("a.postal_code = :custom_postal_code")
+        parameters["custom_postal_code"] = args.get("custom_postal_code")
+
+    if args.get("custom_gender"):
+        filters.append("v.gender = :custom_gender")
+        parameters["custom_gender"] = args.get("custom_gender")
+
+    if args.get("custom_age_group"):
+        filters.append("v.age_grp = :custom_age_group")
+        parameters["custom_age_group"] = args.get("custom_age_group")
+
+    if args.get("custom_ethnicity"):
+        filters.append("v.race = :custom_ethnicity")
+        parameters["custom_ethnicity"] = args.get("custom_ethnicity")
+
+    sql = f"""
+    SELECT
+        EXTRACT(YEAR FROM i.occurred_date)::INT AS year,
+        a.borough,
+        a.postal_code,
+        v.gender,
+        v.age_grp,
+        v.race,
+        COUNT(DISTINCT i.incident_id) AS num_incidents
+    FROM incident i
+        JOIN victim v ON v.incident_id = i.incident_id
+        JOIN address a ON i.address_id = a.address_id
+    WHERE {" AND ".join(filters)}
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ORDER BY 1, 2, 3, 4, 5, 6;
+    """
+    return sql, parameters
+
+
+# Every ZIP of one borough ranked like Section A of /recommendations (safest first).
+REPORT_RECOMMENDATIONS_SQL = (RECOMMENDATIONS_TOP10_SQL
+                              .replace("AND a.borough <> ''", "AND a.borough = :borough")
+                              .replace("LIMIT 10;", ";"))
+
+REPORT_EXPORT_BATCH = 20000
+
+
+def report_export_sql(where_clause):
+    """One keyset batch of the list export, in (incident_id, crime_type_id) order."""
+    keyset = "(f.incident_id, f.crime_type_id) > (:after_incident, :after_crime_type)"
+    where = f"{where_clause} AND {keyset}" if where_clause else f"WHERE {keyset}"
+    return f"""
+        SELECT f.incident_id, f.crime_type_id,
+{LIST_COLUMNS}
+        {LIST_FROM}
+        {where}
+        ORDER BY f.incident_id, f.crime_type_id
+        LIMIT :batch
+"""
+
+
+def report_export_count_sql(where_clause):
+    return f"""
+        SELECT COUNT(*) {LIST_FROM}
+        {where_clause}
+"""
+
+
+# report kind -> request args it takes (a page's filters, so the page can submit itself)
+REPORT_ARGS = {
+    "analysis": SECTION_ARGS["incidents_analysis.trend"] + SECTION_ARGS["incidents_analysis.custom"],
+    "recommendations": SECTION_ARGS["recommendations.top10"],
+    "export": LIST_FILTER_ARGS,
+}
+
+
+# ------------------------------------------------------------
+# /admin bulk close / reopen / delete (reports.py jobs)
+# ------------------------------------------------------------
+# Incidents are changed BULK_BATCH at a time in incident_id order, one
+# transaction per batch, so the cascades to suspect, victim, classified_as
+# and suspect_clue (and the incident_flat / version triggers) hold their
+# locks briefly and a long action never blocks the detail pages.
+BULK_BATCH = 500
+
+
+def bulk_batch_sql(where_clause):
+    """Next batch of incident ids matching the /admin filter, after :after_incident."""
+    keyset = "f.incident_id > :after_incident"
+    where = f"{where_clause} AND {keyset}" if where_clause else f"WHERE {keyset}"
+    return f"""
+        SELECT DISTINCT f.incident_id
+        {LIST_FROM}
+        {where}
+        ORDER BY f.incident_id
+        LIMIT :batch
+"""
+
+
+def bulk_count_sql(where_clause):
+    return f"""
+        SELECT COUNT(DISTINCT f.incident_id) {LIST_FROM}
+        {where_clause}
+"""
+
+
+# unchanged rows are skipped, so they neither fire triggers nor count as changed
+BULK_STATUS_SQL = """
+        UPDATE incident SET status = :status
+        WHERE incident_id = ANY(:ids) AND status IS DISTINCT FROM :status
+        RETURNING incident_id
+"""
+
+BULK_DELETE_SQL = """
+        DELETE FROM incident WHERE incident_id = ANY(:ids)
+        RETURNING incident_id
+"""
+
+
+# ------------------------------------------------------------
+# /admin/<id>/suspects/<suspect_id>/similar (similar_suspects.py)
+# ------------------------------------------------------------
+# A suspect's attributes and the distinct lexemes of all its clues.
+SUSPECT_PROFILE_SQL = """
+        SELECT s.incident_id, s.suspect_id, s.gender, s.age_grp, s.race, s.weapons,
+               ARRAY(SELECT DISTINCT l FROM suspect_clue c, unnest(tsvector_to_array(c.clue_tsv)) l
+                     WHERE c.incident_id = s.incident_id AND c.suspect_id = s.suspect_id) AS lexemes
+        FROM suspect s
+        WHERE s.incident_id = :incident_id AND s.suspect_id = :suspect_id
+"""
+
+# Documents per clue lexeme, for weighting rare words over the template ones.
+CLUE_LEXEME_STATS_SQL = """
+        SELECT word, ndoc, (SELECT COUNT(*) FROM suspect_clue) AS docs
+        FROM ts_stat('SELECT clue_tsv FROM suspect_clue')
+"""
+
+# Candidates from three indexes, each capped (migrations/010): clues matching
+# any of the suspect's rare lexemes (GIN), suspects of the same gender / age
+# group carrying any of its weapons (GIN && B-tree), and the newest suspects
+# of the same gender / age group / race (B-tree). A NULL argument turns its
+# source off. Suspects of the same incident are left out.
+SIMILAR_CANDIDATES_SQL = """
+        WITH clue_hits AS (
+            SELECT c.incident_id, c.suspect_id
+            FROM suspect_clue c
+            WHERE c.clue_tsv @@ CAST(:clue_query AS tsquery)
+            GROUP BY c.incident_id, c.suspect_id
+            ORDER BY MAX(ts_rank(c.clue_tsv, CAST(:clue_query AS tsquery))) DESC
+            LIMIT :per_source
+        ),
+        weapon_hits AS (
+            SELECT s.incident_id, s.suspect_id
+            FROM suspect s
+            WHERE s.weapons && CAST(:weapons AS TEXT[])
+              AND s.gender = :gender AND s.age_grp = :age_grp
+            ORDER BY s.incident_id DESC
+            LIMIT :per_source
+        ),
+        demographic_hits AS (
+            SELECT s.incident_id, s.suspect_id
+            FROM suspect s
+            WHERE s.gender = :gender AND s.age_grp = :age_grp AND s.race = :race
+            ORDER BY s.incident_id DESC
+            LIMIT :per_demographic
+        ),
+        candidates AS (
+            SELECT * FROM clue_hits
+            UNION SELECT * FROM weapon_hits
+            UNION SELECT * FROM demographic_hits
+        )
+        SELECT s.incident_id, s.suspect_id, s.gender, s.age_grp, s.race, s.weapons,
+               ARRAY(SELECT DISTINCT l FROM suspect_clue c, unnest(tsvector_to_array(c.clue_tsv)) l
+                     WHERE c.incident_id = s.incident_id AND c.suspect_id = s.suspect_id) AS lexemes
+        FROM candidates
+        JOIN suspect s USING (incident_id, suspect_id)
+        WHERE s.incident_id <> :incident_id
+"""
+
+SIMILAR_INCIDENTS_SQL = """
+        SELECT i.incident_id, i.occurred_date, i.status, a.borough, a.postal_code,
+               (SELECT string_agg(ct.crime_type, ', ' ORDER BY ct.crime_type)
+                FROM classified_as ca JOIN crimetype ct ON ct.crime_type_id = ca.crime_type_id
+                WHERE ca.incident_id = i.incident_id) AS crime_types
+        FROM incident i
+        JOIN address a ON a.address_id = i.address_id
+        WHERE i.incident_id = ANY(:incident_ids)
+"""
+
+# ------------------------------------------------------------
+# Near-duplicate incidents (duplicates.py, migrations/011)
+# ------------------------------------------------------------
+# Incidents are only compared within a block: the same crime type, within
+# :days days, at addresses in the same or a neighbouring grid cell of :cell
+# degrees. Each candidate carries its victims' and suspects' demographics
+# ("gender/age group/race") for duplicates.score.
+_DUPLICATE_PEOPLE = """
+               ARRAY(SELECT concat_ws('/', v.gender, v.age_grp, COALESCE(v.race, '?')) FROM victim v
+                     WHERE v.incident_id = {incident} ORDER BY 1) AS victims,
+               ARRAY(SELECT concat_ws('/', s.gender, s.age_grp, COALESCE(s.race, '?')) FROM suspect s
+                     WHERE s.incident_id = {incident} ORDER BY 1) AS suspects""".strip()
+
+# The block of a report not inserted yet (admin_new_incident); :cell_x and
+# :cell_y are its own cell. idx_incident_flat_crime_type_occurred.
+DUPLICATE_CANDIDATES_SQL = f"""
+        SELECT f.incident_id, f.occurred_date, f.status, a.borough, a.postal_code,
+               abs(f.occurred_date - CAST(:occurred_date AS DATE)) AS day_gap,
+               -- metres (equirectangular; exact enough across a few cells)
+               111320 * sqrt(power(a.latitude - :latitude, 2)
+                             + power((a.longitude - :longitude) * cos(radians(:latitude)), 2)) AS distance_m,
+               {_DUPLICATE_PEOPLE.format(incident="f.incident_id")}
+        FROM incident_flat f
+        JOIN address a ON a.address_id = f.address_id
+        WHERE f.crime_type_id = :crime_type_id
+          AND f.occurred_date BETWEEN CAST(:occurred_date AS DATE) - :days AND CAST(:occurred_date AS DATE) + :days
+          AND floor(a.latitude / :cell) BETWEEN :cell_x - 1 AND :cell_x + 1
+          AND floor(a.longitude / :cell) BETWEEN :cell_y - 1 AND :cell_y + 1
+"""
+
+# Batch sweep, one date window [:date_from, :date_to) at a time, plus the
+# :days days before it: each incident's block key and point. duplicates.py
+# pairs up rows whose keys are neighbours in NumPy; a self-join here
+# expands every row into its 27 neighbouring keys and sorts them all.
+DUPLICATE_BLOCK_SQL = """
+        SELECT DISTINCT f.incident_id, f.crime_type_id, f.occurred_date - CAST(:date_from AS DATE) AS day,
+               floor(a.latitude / :cell)::BIGINT AS cell_x, floor(a.longitude / :cell)::BIGINT AS cell_y,
+               a.latitude, a.longitude
+        FROM incident_flat f
+        JOIN address a ON a.address_id = f.address_id
+        WHERE f.occurred_date >= CAST(:date_from AS DATE) - :days AND f.occurred_date < :date_to
+          AND a.latitude IS NOT NULL AND a.longitude IS NOT NULL
+"""
+
+DUPLICATE_PEOPLE_SQL = f"""
+        SELECT i.incident_id,
+               {_DUPLICATE_PEOPLE.format(incident="i.incident_id")}
+        FROM unnest(CAST(:incident_ids AS INTEGER[])) AS i (incident_id)
+"""
+
+DUPLICATE_DATES_SQL = "SELECT MIN(occurred_date) AS first_date, MAX(occurred_date) AS last_date FROM incident_flat"
+
+# A window's earlier findings are replaced by the sweep's; dismissed pairs stay.
+DUPLICATE_CLEAR_SQL = """
+        DELETE FROM incident_duplicate d
+        USING incident i
+        WHERE i.incident_id = d.incident_id AND d.dismissed_at IS NULL
+          AND i.occurred_date >= :date_from AND i.occurred_date < :date_to
+"""
+DUPLICATE_SAVE_SQL = """
+        INSERT INTO incident_duplicate (incident_id, duplicate_of, score, day_gap, distance_m)
+        SELECT * FROM unnest(CAST(:incident_ids AS INTEGER[]), CAST(:duplicate_ofs AS INTEGER[]),
+                             CAST(:scores AS REAL[]), CAST(:day_gaps AS INTEGER[]), CAST(:distances AS REAL[]))
+        ON CONFLICT (incident_id, duplicate_of) DO UPDATE
+        SET score = EXCLUDED.score, day_gap = EXCLUDED.day_gap, distance_m = EXCLUDED.distance_m, found_at = now()
+"""
+
+_DUPLICATE_INCIDENT = """
+               {i}.occurred_date AS {prefix}occurred_date, {i}.status AS {prefix}status,
+               {a}.borough AS {prefix}borough, {a}.postal_code AS {prefix}postal_code,
+               (SELECT string_agg(ct.crime_type, ', ' ORDER BY ct.crime_type)
+                FROM classified_as ca JOIN crimetype ct ON ct.crime_type_id = ca.crime_type_id
+                WHERE ca.incident_id = {i}.incident_id) AS {prefix}crime_types""".strip()
+
+DUPLICATE_LIST_SQL = f"""
+        SELECT d.incident_id, d.duplicate_of, d.score, d.day_gap, d.distance_m, d.found_at,
+               COUNT(*) OVER () AS total,
+               {_DUPLICATE_INCIDENT.format(i="i", a="a", prefix="")},
+               {_DUPLICATE_INCIDENT.format(i="o", a="oa", prefix="other_")}
+        FROM incident_duplicate d
+        JOIN incident i ON i.incident_id = d.incident_id
+        JOIN address a ON a.address_id = i.address_id
+        JOIN incident o ON o.incident_id = d.duplicate_of
+        JOIN address oa ON oa.address_id = o.address_id
+        WHERE d.dismissed_at IS NULL AND d.score >= :min_score
+        ORDER BY d.score DESC, d.incident_id DESC
+        LIMIT :limit
+"""
+
+DUPLICATE_DISMISS_SQL = """
+        UPDATE incident_duplicate SET dismissed_at = now()
+        WHERE incident_id = :incident_id AND duplicate_of = :duplicate_of
+"""
+
+# ------------------------------------------------------------
+# Workload counters (workload.py, /admin/workload, migrations/012)
+# ------------------------------------------------------------
+# The dashboard reads workload_counter only, one row per (jurisdiction,
+# borough, crime type) group, totalled by the chosen dimension.
+WORKLOAD_DIMENSIONS = {
+    "jurisdiction": ("w.jur_id", "j.description", "JOIN jurisdiction j ON j.jur_id = w.jur_id"),
+    "borough": ("w.borough", "NULLIF(w.borough, '')", ""),
+    "crime_type": ("w.crime_type_id", "ct.crime_type", "JOIN crimetype ct ON ct.crime_type_id = w.crime_type_id"),
+}
+
+
+def workload_sql(dimension):
+    key, name, join = WORKLOAD_DIMENSIONS[dimension]
+    return f"""
+        SELECT {key} AS key, {name} AS name,
+               SUM(w.open_incidents) AS open_incidents, SUM(w.closed_incidents) AS closed_incidents,
+               SUM(w.suspects) AS suspects, SUM(w.arrested_suspects) AS arrested_suspects
+        FROM workload_counter w
+        {join}
+        GROUP BY 1, 2
+        HAVING SUM(w.open_incidents) + SUM(w.closed_incidents) > 0
+        ORDER BY SUM(w.open_incidents) DESC, 2
+"""
+
+
+# Groups whose counters differ from a recount of incident_flat and suspect.
+WORKLOAD_DRIFT_SQL = """
+        SELECT d.*, j.description AS jurisdiction, ct.crime_type
+        FROM workload_counter_drift d
+        LEFT JOIN jurisdiction j ON j.jur_id = d.jur_id
+        LEFT JOIN crimetype ct ON ct.crime_type_id = d.crime_type_id
+        ORDER BY d.jur_id, d.borough, d.crime_type_id
+"""
+WORKLOAD_REBUILD_SQL = "SELECT rebuild_workload_counter()"
+
+# ------------------------------------------------------------
+# Victim x suspect demographic cross-tab (crosstab.py, /incidents/crosstab, migrations/013)
+# ------------------------------------------------------------
+# Every query reads the stored cuts only. A cut is all of NYC or one
+# borough, times all crime types or one: the other rows have NULL there.
+CROSSTAB_STATE_SQL = """
+        SELECT s.refreshed_at, s.seconds, d.changed_at,
+               (s.data_version, s.epoch) IS DISTINCT FROM (d.version, d.epoch) AS stale
+        FROM data_version d
+        LEFT JOIN demographic_crosstab_state s ON TRUE
+"""
+CROSSTAB_REFRESH_SQL = "SELECT refresh_demographic_crosstab()"
+
+
+def crosstab_cut(borough, crime_type_id, skip=None):
+    """WHERE terms selecting one cut; skip names a dimension left to the caller (a breakdown)."""
+    terms = []
+    if skip != "borough":
+        terms.append("x.borough IS NULL" if borough is None else "x.borough = :borough")
+    if skip != "crime_type":
+        terms.append("x.crime_type_id IS NULL" if crime_type_id is None else "x.crime_type_id = :crime_type_id")
+    return " AND ".join(terms)
+
+
+def crosstab_matrix_sql(borough, crime_type_id):
+    return f"""
+        SELECT x.victim_value, x.suspect_value, x.pairs
+        FROM demographic_crosstab x
+        WHERE x.victim_attr = :victim AND x.suspect_attr = :suspect
+          AND {crosstab_cut(borough, crime_type_id)}
+"""
+
+
+# One cell by borough or by crime type within the other filter, with each
+# group's total over all cells (the cell's share of that group's pairs).
+CROSSTAB_BREAKDOWNS = {
+    "borough": ("borough", "c.key", ""),
+    "crime_type": ("crime_type_id", "ct.crime_type", "JOIN crimetype ct ON ct.crime_type_id = c.key"),
+}
+
+
+def crosstab_breakdown_sql(dimension, borough, crime_type_id):
+    column, name, join = CROSSTAB_BREAKDOWNS[dimension]
+    return f"""
+        SELECT c.key, {name} AS name, c.pairs, c.total
+        FROM (SELECT x.{column} AS key, x.victim_value, x.suspect_value, x.pairs,
+                     SUM(x.pairs) OVER (PARTITION BY x.{column}) AS total
+              FROM demographic_crosstab x
+              WHERE x.victim_attr = :victim AND x.suspect_attr = :suspect AND x.{column} IS NOT NULL
+                AND {crosstab_cut(borough, crime_type_id, skip=dimension)}) c
+        {join}
+        WHERE c.victim_value = :victim_value AND c.suspect_value = :suspect_value
+        ORDER BY c.pairs DESC, 2
+"""
+
+
+# ------------------------------------------------------------
+# Trend API (trends.py, /incidents/trend, migrations/014)
+# ------------------------------------------------------------
+# Counts per bucket from the stored day / month counts: day and week buckets
+# from incident_trend_day, month, quarter and year from incident_trend_month.
+# The range [:start, :stop) is whole buckets; a series per borough or crime
+# type with by, else one for everything matching.
+TREND_GRAINS = {
+    "day": ("incident_trend_day", "day"),
+    "week": ("incident_trend_day", "day"),
+    "month": ("incident_trend_month", "month"),
+    "quarter": ("incident_trend_month", "month"),
+    "year": ("incident_trend_month", "month"),
+}
+TREND_BY = {None: "''", "borough": "t.borough", "crime_type": "t.crime_type_id"}
+
+
+def trend_series_sql(grain, by=None, crime_type_ids=False, boroughs=False):
+    table, column = TREND_GRAINS[grain]
+    bucket = f"t.{column}" if grain == column else f"date_trunc('{grain}', t.{column}::TIMESTAMP)::DATE"
+    filters = [f"t.{column} >= :start", f"t.{column} < :stop"]
+    if crime_type_ids:
+        filters.append("t.crime_type_id = ANY(:crime_type_ids)")
+    if boroughs:
+        filters.append("t.borough = ANY(:boroughs)")
+    return f"""
+        SELECT {bucket} AS bucket, {TREND_BY[by]} AS key, SUM(t.incidents)::BIGINT AS incidents
+        FROM {table} t
+        WHERE {" AND ".join(filters)}
+        GROUP BY 1, 2
+"""
+
+
+TREND_REBUILD_SQL = "SELECT rebuild_incident_trend()"
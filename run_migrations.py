@@ -1,43 +1,406 @@
 #!/usr/bin/env python3
 """
-Run migrations.sql against the database
+Apply the numbered migrations in migrations/ to the database.
+
+Each file is named NNN_description.sql and is applied once, in version
+order. Applied versions are recorded in schema_migrations together with a
+checksum of the file, so an already-applied migration that was edited
+afterwards is reported instead of silently diverging.
+
+How a file is run depends on its contents:
+
+  * normally the whole file runs in one transaction together with its
+    schema_migrations row, so it is applied completely or not at all;
+  * files with CREATE/DROP INDEX CONCURRENTLY or REINDEX CONCURRENTLY (or a
+    "-- migrate:no-transaction" line) run statement by statement in
+    autocommit mode. An INVALID index left by an interrupted concurrent
+    build is dropped before the build is retried;
+  * a "-- migrate:backfill table=T key=K batch_size=N sleep_ms=M" file holds
+    one statement using :batch_start and :batch_end. It runs once per
+    integer key range of about batch_size rows, each range in its own
+    transaction, sleeping sleep_ms between ranges and printing progress.
+
+    python run_migrations.py                # apply pending migrations
+    python run_migrations.py --status       # list applied / pending versions
+    python run_migrations.py --baseline 2   # record 001-002 as applied without running them
 """
+import argparse
+import hashlib
 import os
-from sqlalchemy import create_engine, text
+import re
+import sys
+import time
+
+from sqlalchemy import create_engine
 
 # Database connection (same as server.py)
 DATABASE_USERNAME = "yl5961"
 DATABASE_PASSWRD = "115674"
 DATABASE_HOST = "34.139.8.30"
 DATABASEURI = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWRD}@{DATABASE_HOST}/proj1part2"
+DATABASEURI = os.environ.get("DATABASE_URL", DATABASEURI)
 
-def run_migrations():
-    """Execute migrations.sql"""
-    engine = create_engine(DATABASEURI)
-    
-    # Read migrations.sql
-    migrations_path = os.path.join(os.path.dirname(__file__), 'migrations.sql')
-    with open(migrations_path, 'r') as f:
-        sql_content = f.read()
-    
-    # Execute each statement (split by semicolon)
-    with engine.connect() as conn:
-        # Split by semicolon and execute each statement
-        statements = [s.strip() for s in sql_content.split(';') if s.strip() and not s.strip().startswith('--')]
-        
-        for statement in statements:
-            if statement:
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+FILENAME_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+# Serializes runners: a second run_migrations.py waits instead of racing the first.
+ADVISORY_LOCK_ID = 0x6D696772  # "migr"
+
+SCHEMA_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    duration_ms INTEGER
+)
+"""
+
+CONCURRENT_RE = re.compile(r"\b(CREATE|DROP)\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY\b|\bREINDEX\b.*\bCONCURRENTLY\b",
+                           re.IGNORECASE | re.DOTALL)
+CREATE_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w\"]+)", re.IGNORECASE)
+DIRECTIVE_RE = re.compile(r"^--\s*migrate:([\w-]+)(.*)$", re.MULTILINE)
+
+
+class MigrationError(Exception):
+    pass
+
+
+# ---- SQL splitting ----
+
+def split_statements(sql):
+    """Split a SQL script into statements on top-level semicolons.
+
+    Semicolons inside quoted strings, quoted identifiers, dollar-quoted
+    bodies ($$ ... $$ or $tag$ ... $tag$) and comments do not end a
+    statement. Comment-only chunks are dropped.
+    """
+    statements = []
+    start = i = 0
+    n = len(sql)
+    while i < n:
+        c = sql[i]
+        if c == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif c == "/" and sql.startswith("/*", i):
+            depth, i = 1, i + 2
+            while i < n and depth:
+                if sql.startswith("/*", i):
+                    depth, i = depth + 1, i + 2
+                elif sql.startswith("*/", i):
+                    depth, i = depth - 1, i + 2
+                else:
+                    i += 1
+        elif c == "'":
+            # E'...' strings also allow backslash escapes
+            backslash = i > 0 and sql[i - 1] in "eE" and (i == 1 or not (sql[i - 2].isalnum() or sql[i - 2] == "_"))
+            i += 1
+            while i < n:
+                if backslash and sql[i] == "\\":
+                    i += 2
+                elif sql[i] == "'":
+                    if sql.startswith("''", i):
+                        i += 2
+                    else:
+                        break
+                else:
+                    i += 1
+            i += 1
+        elif c == '"':
+            end = sql.find('"', i + 1)
+            i = n if end == -1 else end + 1
+        elif c == "$":
+            m = re.match(r"\$([A-Za-z_][A-Za-z0-9_]*)?\$", sql[i:])
+            # $1 style parameters and identifiers like a$b are not quotes
+            if m and not (i > 0 and (sql[i - 1].isalnum() or sql[i - 1] == "_")):
+                tag = m.group(0)
+                end = sql.find(tag, i + len(tag))
+                i = n if end == -1 else end + len(tag)
+            else:
+                i += 1
+        elif c == ";":
+            statements.append(sql[start:i])
+            i += 1
+            start = i
+        else:
+            i += 1
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if _strip_comments(s).strip()]
+
+
+def _strip_comments(statement):
+    return re.sub(r"--[^\n]*", "", statement)
+
+
+# ---- migration files ----
+
+class Migration:
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+        m = FILENAME_RE.match(self.filename)
+        self.version = int(m.group(1))
+        self.name = m.group(2)
+        with open(path, encoding="utf-8") as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+        self.statements = split_statements(self.sql)
+        self.directives = {}
+        for key, rest in DIRECTIVE_RE.findall(self.sql):
+            self.directives[key] = dict(part.split("=", 1) for part in rest.split() if "=" in part)
+
+        if "backfill" in self.directives:
+            self.mode = "backfill"
+            opts = self.directives["backfill"]
+            missing = {"table", "key"} - set(opts)
+            if missing:
+                raise MigrationError(f"{self.filename}: backfill directive needs {', '.join(sorted(missing))}")
+            if len(self.statements) != 1 or ":batch_start" not in self.sql or ":batch_end" not in self.sql:
+                raise MigrationError(f"{self.filename}: a backfill migration is exactly one statement "
+                                     "using :batch_start and :batch_end")
+        elif "no-transaction" in self.directives or any(CONCURRENT_RE.search(s) for s in self.statements):
+            self.mode = "autocommit"
+        else:
+            self.mode = "transaction"
+
+    def __repr__(self):
+        return f"{self.version:03d}_{self.name} ({self.mode})"
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".sql"):
+            continue
+        if not FILENAME_RE.match(filename):
+            raise MigrationError(f"{filename}: migration files must be named NNN_description.sql")
+        migration = Migration(os.path.join(directory, filename))
+        if migration.version in migrations:
+            raise MigrationError(f"{filename}: version {migration.version} is also used by "
+                                 f"{migrations[migration.version].filename}")
+        migrations[migration.version] = migration
+    return [migrations[v] for v in sorted(migrations)]
+
+
+# ---- runner ----
+
+class Runner:
+    def __init__(self, raw_conn, lock_timeout="5s", batch_size=None, sleep_ms=None, out=print):
+        self.conn = raw_conn
+        self.lock_timeout = lock_timeout
+        self.batch_size = batch_size
+        self.sleep_ms = sleep_ms
+        self.out = out
+
+    def _execute(self, sql, fetch=False):
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+            if fetch:
+                return cur.fetchall()
+            return cur.rowcount
+
+    def applied(self):
+        self.conn.autocommit = True
+        self._execute(SCHEMA_MIGRATIONS_SQL)
+        rows = self._execute("SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version",
+                             fetch=True)
+        return {row[0]: row for row in rows}
+
+    def _record(self, migration, duration_ms):
+        with self.conn.cursor() as cur:
+            cur.execute("INSERT INTO schema_migrations (version, name, checksum, duration_ms) "
+                        "VALUES (%s, %s, %s, %s)",
+                        (migration.version, migration.name, migration.checksum, duration_ms))
+
+    def check_checksums(self, migrations, applied):
+        changed = [m for m in migrations if m.version in applied and applied[m.version][2] != m.checksum]
+        if changed:
+            names = ", ".join(m.filename for m in changed)
+            raise MigrationError(f"applied migrations were edited afterwards: {names}. "
+                                 "Add a new migration instead of changing an applied one.")
+
+    def migrate(self, migrations, target=None):
+        self.conn.autocommit = True
+        self._execute(f"SELECT pg_advisory_lock({ADVISORY_LOCK_ID})")
+        try:
+            applied = self.applied()
+            self.check_checksums(migrations, applied)
+            pending = [m for m in migrations if m.version not in applied and (target is None or m.version <= target)]
+            if not pending:
+                self.out("Database is up to date.")
+            for migration in pending:
+                self.apply(migration)
+            return pending
+        finally:
+            self.conn.autocommit = True
+            self._execute(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_ID})")
+
+    def apply(self, migration):
+        self.out(f"Applying {migration.filename} ({migration.mode}) ...")
+        started = time.monotonic()
+        if migration.mode == "transaction":
+            self._apply_transaction(migration, started)
+        else:
+            if migration.mode == "autocommit":
+                self._apply_autocommit(migration)
+            else:
+                self._apply_backfill(migration)
+            self.conn.autocommit = True
+            self._record(migration, int((time.monotonic() - started) * 1000))
+        self.out(f"✓ {migration.filename} in {time.monotonic() - started:.1f}s")
+
+    def _apply_transaction(self, migration, started):
+        self.conn.autocommit = False
+        try:
+            # A DDL lock that cannot be had quickly fails the migration instead
+            # of queueing every request behind it.
+            self._execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+            for statement in migration.statements:
+                self._run_statement(migration, statement)
+            self._record(migration, int((time.monotonic() - started) * 1000))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.autocommit = True
+
+    def _apply_autocommit(self, migration):
+        self.conn.autocommit = True
+        try:
+            for statement in migration.statements:
+                m = CREATE_CONCURRENT_INDEX_RE.search(statement)
+                if m:
+                    self._drop_invalid_index(m.group(1))
+                # concurrent builds wait for older transactions to finish; a
+                # lock_timeout there would only abort them halfway (INVALID index)
+                concurrent = CONCURRENT_RE.search(statement)
+                self._execute(f"SET lock_timeout = '{0 if concurrent else self.lock_timeout}'")
+                self._run_statement(migration, statement)
+        finally:
+            self._execute("RESET lock_timeout")
+
+    def _drop_invalid_index(self, name):
+        rows = self._execute(
+            "SELECT c.oid::regclass::text FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid "
+            f"WHERE c.oid = to_regclass('{name}') AND NOT x.indisvalid", fetch=True)
+        for (index,) in rows:
+            self.out(f"  dropping INVALID index {index} left by an interrupted build")
+            self._execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+
+    def _run_statement(self, migration, statement):
+        t0 = time.monotonic()
+        try:
+            self._execute(statement)
+        except Exception as e:
+            raise MigrationError(f"{migration.filename}: {str(e).strip()}\n  statement: {_preview(statement, 200)}") from e
+        self.out(f"  {_preview(statement)}  ({time.monotonic() - t0:.2f}s)")
+
+    def _apply_backfill(self, migration):
+        opts = migration.directives["backfill"]
+        table, key = opts["table"], opts["key"]
+        batch_size = self.batch_size or int(opts.get("batch_size", 5000))
+        sleep = (self.sleep_ms if self.sleep_ms is not None else int(opts.get("sleep_ms", 50))) / 1000
+        statement = migration.statements[0]
+
+        self.conn.autocommit = True
+        self._execute(f"SET lock_timeout = '{self.lock_timeout}'")
+        low, high = self._execute(f"SELECT min({key}), max({key}) FROM {table}", fetch=True)[0]
+        if low is None:
+            self.out(f"  {table} is empty, nothing to backfill")
+            return
+        batches = rows = 0
+        started = last_report = time.monotonic()
+        batch_start = low
+        try:
+            while batch_start is not None and batch_start <= high:
+                # the key batch_size rows further on bounds this batch; walking the
+                # primary key keeps batches even when the key has gaps
+                nxt = self._execute(f"SELECT {key} FROM {table} WHERE {key} >= {int(batch_start)} "
+                                    f"ORDER BY {key} OFFSET {batch_size} LIMIT 1", fetch=True)
+                batch_end = nxt[0][0] if nxt else high + 1
+                sql = statement.replace(":batch_start", str(int(batch_start))).replace(":batch_end", str(int(batch_end)))
                 try:
-                    conn.execute(text(statement))
-                    print(f"✓ Executed: {statement[:50]}...")
+                    rows += max(self._execute(sql), 0)
                 except Exception as e:
-                    print(f"✗ Error: {e}")
-                    print(f"  Statement: {statement[:100]}...")
-        
-        conn.commit()
-        print("\n✅ Migrations completed!")
+                    raise MigrationError(f"{migration.filename}: batch {key} [{batch_start}, {batch_end}): {e}") from e
+                batches += 1
+                batch_start = batch_end
+
+                now = time.monotonic()
+                if now - last_report >= 5 or batch_start > high:
+                    done = min((batch_start - low) / (high + 1 - low), 1.0)
+                    elapsed = now - started
+                    eta = elapsed / done - elapsed if done else 0
+                    self.out(f"  {table}.{key} {done:6.1%}  batches={batches}  rows={rows:,}  "
+                             f"{rows / elapsed if elapsed else 0:,.0f} rows/s  eta {eta:.0f}s")
+                    last_report = now
+                if sleep and batch_start <= high:
+                    time.sleep(sleep)
+        finally:
+            self._execute("RESET lock_timeout")
+
+    def baseline(self, migrations, version):
+        """Record every migration up to version as applied without running it."""
+        applied = self.applied()
+        for migration in migrations:
+            if migration.version <= version and migration.version not in applied:
+                self._record(migration, None)
+                self.out(f"✓ recorded {migration.filename} as applied")
+
+
+def _preview(statement, width=70):
+    line = " ".join(_strip_comments(statement).split())
+    return line if len(line) <= width else line[:width - 3] + "..."
 
-if __name__ == "__main__":
-    run_migrations()
 
+def migrate(database_url=DATABASEURI, target=None, **runner_options):
+    """Apply pending migrations; returns the list of migrations applied."""
+    migrations = load_migrations()
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        return Runner(conn.connection.dbapi_connection, **runner_options).migrate(migrations, target)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply numbered migrations from migrations/")
+    parser.add_argument("--database-url", default=DATABASEURI)
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    parser.add_argument("--baseline", type=int, metavar="VERSION",
+                        help="record migrations up to VERSION as applied without running them "
+                             "(for a database migrated before schema_migrations existed)")
+    parser.add_argument("--lock-timeout", default="5s", help="lock_timeout for migration statements")
+    parser.add_argument("--batch-size", type=int, help="override backfill batch_size")
+    parser.add_argument("--sleep-ms", type=int, help="override backfill sleep_ms between batches")
+    args = parser.parse_args(argv)
 
+    try:
+        migrations = load_migrations()
+        engine = create_engine(args.database_url)
+        with engine.connect() as conn:
+            runner = Runner(conn.connection.dbapi_connection, lock_timeout=args.lock_timeout,
+                            batch_size=args.batch_size, sleep_ms=args.sleep_ms)
+            if args.status:
+                applied = runner.applied()
+                for m in migrations:
+                    row = applied.get(m.version)
+                    state = f"applied {row[3]:%Y-%m-%d %H:%M}" if row else "pending"
+                    if row and row[2] != m.checksum:
+                        state += "  (file changed since it was applied!)"
+                    print(f"{m.filename:48s} {m.mode:12s} {state}")
+                return 0
+            if args.baseline is not None:
+                runner.baseline(migrations, args.baseline)
+                return 0
+            runner.migrate(migrations, args.target)
+    except MigrationError as e:
+        print(f"✗ {e}", file=sys.stderr)
+        return 1
+    print("\n✅ Migrations completed!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Production server: several worker processes, each with a pool of request
+threads, serving server.py's app (gunicorn with gthread workers).
+
+    python serve.py --workers 8 --threads 4 0.0.0.0 8111
+
+The app is imported once in the master, which also compiles all templates,
+and forked into the workers. Each worker drops the inherited connection
+pool right after the fork (see server._reset_engine_after_fork) and opens
+its own connections, at boot with --warm or otherwise on first use, and
+starts its cache invalidation listener (cache_bus.py, CACHE_BUS=0 to skip).
+
+Defaults come from the environment: WEB_CONCURRENCY (workers, default one
+per CPU core), WEB_THREADS (threads per worker, default 4), WEB_TIMEOUT,
+plus the app settings read by server.load_config (DATABASE_URL,
+DB_POOL_SIZE, DB_MAX_OVERFLOW, FLASK_SECRET_KEY, ...).
+"""
+import os
+
+import click
+from gunicorn.app.base import BaseApplication
+
+import server
+
+
+class ServeApplication(BaseApplication):
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def _post_fork(arbiter, worker):
+    arbiter.log.info("worker %s started with a fresh database pool", worker.pid)
+    server.start_cache_bus()
+    server.start_report_workers()
+    if server.app.config["WARM_ON_START"]:
+        try:
+            server.warm_up()
+        except Exception:
+            # a worker that cannot reach the database yet still serves; it connects on demand
+            arbiter.log.exception("worker %s: warm-up failed", worker.pid)
+
+
+@click.command()
+@click.option('--workers', '-w', type=int, default=lambda: int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+              show_default="WEB_CONCURRENCY or CPU count", help='Worker processes.')
+@click.option('--threads', '-t', type=int, default=lambda: int(os.environ.get("WEB_THREADS", 4)),
+              show_default="WEB_THREADS or 4", help='Request threads per worker.')
+@click.option('--timeout', type=int, default=lambda: int(os.environ.get("WEB_TIMEOUT", 60)),
+              show_default="WEB_TIMEOUT or 60", help='Seconds before a stuck worker is restarted.')
+@click.option('--max-requests', type=int, default=0,
+              help='Restart each worker after this many requests (0 = never).')
+@click.option('--access-log', is_flag=True, help='Log every request to stdout.')
+@click.option('--warm', is_flag=True, help='Each worker opens its pool and loads reference data before serving '
+                                            '(also WARM_ON_START=1).')
+@click.argument('HOST', default='0.0.0.0')
+@click.argument('PORT', default=8111, type=int)
+def serve(workers, threads, timeout, max_requests, access_log, warm, host, port):
+    """Serve the app with WORKERS processes x THREADS threads."""
+    # Every thread of a worker can hold one connection, so size the pool to the
+    # threads unless DB_POOL_SIZE says otherwise.
+    config = {} if "DB_POOL_SIZE" in os.environ else {"DB_POOL_SIZE": threads}
+    if warm:
+        config["WARM_ON_START"] = True
+    app = server.create_app(config)
+    # Templates are compiled once here and inherited by every forked worker;
+    # database warm-up happens per worker in _post_fork.
+    server.boot(warm=False)
+    per_worker = app.config["DB_POOL_SIZE"] + app.config["DB_MAX_OVERFLOW"]
+    print(f"serving on {host}:{port} with {workers} workers x {threads} threads "
+          f"(up to {workers * per_worker} database connections)")
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "gthread",
+        "threads": threads,
+        "timeout": timeout,
+        "keepalive": 5,
+        "max_requests": max_requests,
+        "max_requests_jitter": max_requests // 10,
+        "preload_app": True,
+        "post_fork": _post_fork,
+        "accesslog": "-" if access_log else None,
+    }
+    ServeApplication(app, options).run()
+
+
+if __name__ == "__main__":
+    serve()
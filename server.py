@@ -5,20 +5,59 @@ Example Webserver
 To run locally:
     python server.py
 Go to http://localhost:8111 in your browser.
+For production (one worker process per core), use serve.py.
 A debugger such as "pdb" may be helpful for debugging.
 Read about it online.
 """
+import hashlib
 import os
-from pydoc import text
-from sqlalchemy import *
-from flask import Flask, request, render_template, g, redirect, Response, abort, url_for, abort, flash
-from datetime import date, timedelta
-from math import ceil
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from flask import Flask, request, render_template, g, redirect, Response, abort, url_for, abort, flash, make_response, jsonify
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+from datetime import date, datetime
+from math import ceil, isfinite
+
+import clue_import
+import crosstab
+import metrics
+import profiler
+import reports
+import trends
+from cache_bus import CacheBus, INCIDENT_TABLES, touches
+from single_flight import SingleFlight
+from route_queries import (
+    LIST_PAGE_SIZE, LIST_FILTER_ARGS, incident_list_filter, incident_facets_sql, facet_counts, incident_page_sql, page_params,
+    INCIDENT_DETAIL_SQL, INCIDENT_SUSPECTS_SQL, ADMIN_INCIDENT_SUSPECTS_SQL, INCIDENT_VICTIMS_SQL,
+    INCIDENT_CLUES_SQL, CRIME_TYPES_SQL, JURISDICTIONS_SQL, LAW_CATEGORIES_SQL,
+    ANALYSIS_SECTIONS, SECTION_QUERIES, section_args,
+    recommendation_params, RECOMMENDATIONS_TOP10_SQL, RECOMMENDATIONS_ZIP_SQL,
+    new_incident_sql, people_params, SUSPECT_FIELDS, VICTIM_FIELDS,
+    CREATE_CRIME_TYPE_SQL, CREATE_JURISDICTION_SQL,
+    DATA_VERSION_SQL, INCIDENT_VERSION_SQL,
+    coarse_query, section_shape,
+    DUPLICATE_LIST_SQL, DUPLICATE_DISMISS_SQL,
+    WORKLOAD_DIMENSIONS, workload_sql,
+)
 
 tmpl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 app = Flask(__name__, template_folder=tmpl_dir)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret")
 
+# Opt-in sampling profiler (PROFILE_SAMPLE_RATE / PROFILE_ROUTES), see profiler.py
+route_profiler = profiler.init_app(app)
+# Per-process counters at /admin/metrics, see metrics.py
+metrics.init_app(app)
+# /reports: background report jobs, see reports.py
+reports.init_app(app)
+
 #
 # The following is a dummy URI that does not connect to a valid database. You will need to modify it to connect to your Part 2 database in order to use the data.
 #
@@ -37,10 +76,493 @@ DATABASE_HOST = "34.139.8.30"
 DATABASEURI = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWRD}@{DATABASE_HOST}/proj1part2"
 
 
+def load_config(environ=os.environ):
+    """App settings from the environment; the defaults keep `python server.py` working unchanged."""
+    return {
+        # Point at another database (e.g. a local generate_data.py dataset) without editing this file.
+        "DATABASE_URL": environ.get("DATABASE_URL", DATABASEURI),
+        "DB_POOL_SIZE": int(environ.get("DB_POOL_SIZE", 5)),
+        "DB_MAX_OVERFLOW": int(environ.get("DB_MAX_OVERFLOW", 10)),
+        "DB_POOL_RECYCLE": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "DB_POOL_PRE_PING": environ.get("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no"),
+        "SECRET_KEY": environ.get("FLASK_SECRET_KEY", "dev-secret"),
+        # Compiled templates persist here across restarts ("" turns the cache off).
+        "JINJA_CACHE_DIR": environ.get("JINJA_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache")),
+        # Seconds the jurisdiction / crime type / law category dropdown rows are reused.
+        "REFERENCE_CACHE_TTL": float(environ.get("REFERENCE_CACHE_TTL", 300)),
+        # Seconds / entries the list pages' facet counts are reused per filter.
+        "FACET_CACHE_TTL": float(environ.get("FACET_CACHE_TTL", 60)),
+        "FACET_CACHE_SIZE": int(environ.get("FACET_CACHE_SIZE", 1024)),
+        # Open the pool and load the reference data at boot instead of on first request.
+        "WARM_ON_START": environ.get("WARM_ON_START", "0").lower() in ("1", "true", "yes"),
+        # LISTEN for data changes made by other processes (cache_bus.py, migrations/005).
+        "CACHE_BUS": environ.get("CACHE_BUS", "1").lower() not in ("0", "false", "no"),
+        "CACHE_BUS_HEARTBEAT": float(environ.get("CACHE_BUS_HEARTBEAT", 30)),
+        "CACHE_BUS_INCIDENTS": int(environ.get("CACHE_BUS_INCIDENTS", 10000)),
+        # Coalesce identical concurrent aggregates: cluster, process or off (single_flight.py).
+        "SINGLE_FLIGHT": environ.get("SINGLE_FLIGHT", "cluster"),
+        # Time budget (ms) per route for its aggregate queries, e.g. "recommendations=8000" (0 = none).
+        "ROUTE_BUDGETS_MS": _parse_budgets(environ.get("ROUTE_BUDGETS_MS",
+                                                       "incidents_analysis_section=8000,recommendations=8000")),
+        # Answer the analysis / recommendation aggregates from the NumPy snapshot (columnar.py).
+        "COLUMNAR": environ.get("COLUMNAR", "0").lower() in ("1", "true", "yes"),
+        "COLUMNAR_DIR": environ.get("COLUMNAR_DIR", os.path.join(app.instance_path, "columnar")),
+        "COLUMNAR_MAX_LAG": float(environ.get("COLUMNAR_MAX_LAG", 120)),
+        # Background report jobs (reports.py): worker threads per process (0 = none here),
+        # seconds a finished identical report is reused, days results are kept.
+        "REPORT_WORKERS": int(environ.get("REPORT_WORKERS", 2)),
+        "REPORT_REUSE_SECONDS": float(environ.get("REPORT_REUSE_SECONDS", 900)),
+        "REPORT_RETENTION_DAYS": int(environ.get("REPORT_RETENTION_DAYS", 7)),
+        # Seconds the clue lexeme statistics behind similar-suspect scoring are reused (similar_suspects.py).
+        "CLUE_STATS_TTL": float(environ.get("CLUE_STATS_TTL", 3600)),
+        # Score (0..1) from which a possible duplicate incident is shown or warned about (duplicates.py).
+        "DUPLICATE_MIN_SCORE": float(environ.get("DUPLICATE_MIN_SCORE", 0.75)),
+    }
+
+
+def _parse_budgets(raw):
+    budgets = {}
+    for part in (raw or "").split(","):
+        endpoint, _, ms = part.partition("=")
+        if endpoint.strip() and ms.strip():
+            budgets[endpoint.strip()] = float(ms)
+    return budgets
+
+
 #
-# This line creates a database engine that knows how to connect to the URI above.
+# The engine knows how to connect to DATABASE_URL. It is created on first use
+# (get_engine), not at import or in create_app(), so starting a process costs
+# nothing until a request actually needs the database, and a pre-fork server
+# can import this module without opening connections in the parent.
 #
-engine = create_engine(DATABASEURI)
+engine = None
+_engine_lock = threading.Lock()
+flights = SingleFlight()
+columnar_store = None
+
+
+def create_app(config=None):
+    """Configure the app from the environment; config overrides individual settings.
+
+    Any existing engine is dropped and rebuilt with the new settings on first use.
+    """
+    global engine, columnar_store
+    app.config.update(load_config())
+    app.config.update(config or {})
+    app.secret_key = app.config["SECRET_KEY"]
+    flights.mode = app.config["SINGLE_FLIGHT"]
+    columnar_store = None
+    if app.config["COLUMNAR"]:
+        from columnar import ColumnarStore  # NumPy: only loaded when the snapshot is on
+        columnar_store = ColumnarStore(app.config["COLUMNAR_DIR"])
+    with _engine_lock:
+        if engine is not None:
+            engine.dispose()
+            engine = None
+    if app.config["JINJA_CACHE_DIR"]:
+        os.makedirs(app.config["JINJA_CACHE_DIR"], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["JINJA_CACHE_DIR"])
+    return app
+
+
+def get_engine():
+    global engine
+    if engine is None:
+        with _engine_lock:
+            if engine is None:
+                if "DATABASE_URL" not in app.config:
+                    app.config.update(load_config())
+                engine = create_engine(
+                    app.config["DATABASE_URL"],
+                    pool_size=app.config["DB_POOL_SIZE"],
+                    max_overflow=app.config["DB_MAX_OVERFLOW"],
+                    pool_recycle=app.config["DB_POOL_RECYCLE"],
+                    pool_pre_ping=app.config["DB_POOL_PRE_PING"],
+                )
+                app.extensions["db_engine"] = engine
+    return engine
+
+
+def _reset_engine_after_fork():
+    # A forked worker must never share the parent's pooled sockets. Replace the
+    # inherited pool with an empty one; close=False leaves the parent's
+    # connections alone (closing them from the child would break the parent).
+    if engine is not None:
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_engine_after_fork)
+
+
+# ---- startup: templates, reference data, pool ----
+REFERENCE_QUERIES = {
+    "jurisdictions": JURISDICTIONS_SQL,
+    "crime_types": CRIME_TYPES_SQL,
+    "law_categories": LAW_CATEGORIES_SQL,
+}
+_reference_cache = {}  # name -> (expires_at, rows)
+
+
+def cached_reference_rows(name):
+    """Cached rows for name, or None when missing or older than REFERENCE_CACHE_TTL."""
+    hit = _reference_cache.get(name)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def store_reference_rows(name, rows):
+    rows = [dict(r) for r in rows]
+    _reference_cache[name] = (time.monotonic() + app.config.get("REFERENCE_CACHE_TTL", 300), rows)
+    return rows
+
+
+def reference_rows(conn, name):
+    """Rows of a small dropdown table, reused for REFERENCE_CACHE_TTL seconds."""
+    rows = cached_reference_rows(name)
+    if rows is None:
+        rows = store_reference_rows(name, conn.execute(text(REFERENCE_QUERIES[name])).mappings())
+    return rows
+
+
+def invalidate_reference_data(*names):
+    for name in names or list(_reference_cache):
+        _reference_cache.pop(name, None)
+
+
+# ---- list facet counts ----
+# normalized filter -> (expires_at, boroughs, postal_code, facets), least recently used first
+_facet_cache = OrderedDict()
+_facet_lock = threading.Lock()
+_facet_generation = 0  # bumped by every invalidation; a result computed across one is not stored
+
+
+def facet_key(where_clause, params):
+    """Cache key of a list filter: the same filters in any order (or borough order) share it."""
+    return where_clause, tuple(sorted((k, tuple(sorted(v)) if isinstance(v, list) else v)
+                                      for k, v in params.items()))
+
+
+def cached_facets(key):
+    """(facets, None) on a hit; (None, generation) on a miss, to hand back to store_facets."""
+    with _facet_lock:
+        hit = _facet_cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            _facet_cache.move_to_end(key)
+            return hit[3], None
+        return None, _facet_generation
+
+
+def store_facets(key, params, rows, generation):
+    facets = facet_counts(rows)
+    with _facet_lock:
+        if generation == _facet_generation:
+            _facet_cache[key] = (time.monotonic() + app.config.get("FACET_CACHE_TTL", 60),
+                                 params.get("borough"), params.get("postal_code"), facets)
+            _facet_cache.move_to_end(key)
+            while len(_facet_cache) > app.config.get("FACET_CACHE_SIZE", 1024):
+                _facet_cache.popitem(last=False)
+    return facets
+
+
+def list_facets(conn, where_clause, params):
+    """Facet counts and total for a list filter; one GROUPING SETS query on a miss."""
+    key = facet_key(where_clause, params)
+    facets, generation = cached_facets(key)
+    if facets is None:
+        facets = store_facets(key, params, conn.execute(text(incident_facets_sql(where_clause)), params),
+                              generation)
+    return facets
+
+
+def invalidate_facets(event=None):
+    """Drop the facet counts event may have changed (all of them for None)."""
+    global _facet_generation
+    with _facet_lock:
+        _facet_generation += 1
+        for key, (_, boroughs, postal_code, _) in list(_facet_cache.items()):
+            if event is None or any(touches(event, borough=b, postal_code=postal_code) for b in boroughs or [None]):
+                del _facet_cache[key]
+
+
+# ---- cross-process invalidation (cache_bus.py) ----
+REFERENCE_TABLES = {"crimetype": "crime_types", "jurisdiction": "jurisdictions"}
+cache_bus = None
+
+
+def _on_data_change(event):
+    if event is None or event.table == "*":
+        invalidate_reference_data()
+    elif event.table in REFERENCE_TABLES:
+        invalidate_reference_data(REFERENCE_TABLES[event.table])
+    if event is None or event.table in INCIDENT_TABLES or event.table in ("*", "crimetype"):
+        invalidate_facets(event)
+
+
+def start_cache_bus():
+    """Start this process's invalidation listener (after any fork: it is a thread)."""
+    global cache_bus
+    if not app.config.get("CACHE_BUS"):
+        return None
+    if cache_bus is None:
+        cache_bus = CacheBus(app.config["DATABASE_URL"], heartbeat=app.config["CACHE_BUS_HEARTBEAT"],
+                             max_incidents=app.config["CACHE_BUS_INCIDENTS"])
+        cache_bus.subscribe(_on_data_change)
+    return cache_bus.start()
+
+
+# ---- background report jobs (reports.py) ----
+report_workers = None
+
+
+def start_report_workers():
+    """Start this process's report worker threads (after any fork, like the cache bus)."""
+    global report_workers
+    if app.config.get("REPORT_WORKERS", 0) <= 0:
+        return None
+    if report_workers is None:
+        report_workers = reports.ReportWorkers(get_engine(), size=app.config["REPORT_WORKERS"],
+                                               retention_days=app.config["REPORT_RETENTION_DAYS"])
+    return report_workers.start()
+
+
+def precompile_templates():
+    """Compile every template now instead of on its first request.
+
+    With JINJA_CACHE_DIR set, compiled code is loaded from (or written to) the
+    bytecode cache, so only the first boot after a template change pays for
+    parsing and compiling.
+    """
+    env = app.jinja_env
+    names = env.list_templates(extensions=("html",))
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def warm_up():
+    """Load the reference data and open DB_POOL_SIZE connections ahead of traffic."""
+    eng = get_engine()
+    conns = []
+    try:
+        for _ in range(max(app.config["DB_POOL_SIZE"], 1)):
+            conns.append(eng.connect())
+        for name in REFERENCE_QUERIES:
+            reference_rows(conns[0], name)
+    finally:
+        for conn in conns:
+            conn.close()  # back to the pool, still open
+
+
+def boot(warm=None):
+    """Startup path for server.py and serve.py; returns per-step timings in ms."""
+    timings = {}
+    t0 = time.perf_counter()
+    precompile_templates()
+    build_tag()
+    timings["templates_ms"] = (time.perf_counter() - t0) * 1000
+    if app.config.get("WARM_ON_START") if warm is None else warm:
+        t0 = time.perf_counter()
+        warm_up()
+        timings["warm_up_ms"] = (time.perf_counter() - t0) * 1000
+    return timings
+
+
+# ---- aggregates: single flight, time budgets, degraded answers ----
+QUERY_TIMEOUTS = metrics.counter(
+    "query_timeouts_total", "Aggregate queries cancelled by their route's time budget", ("route", "shape"))
+DEGRADED_SECTIONS = metrics.counter(
+    "degraded_sections_total", "Page sections served from a fallback after a timeout", ("route", "section", "fallback"))
+COLUMNAR_ANSWERS = metrics.counter(
+    "columnar_answers_total", "Aggregates answered from the NumPy snapshot instead of Postgres", ("section", "lagging"))
+metrics.register_collector(lambda: [
+    ("single_flight_calls_total", "Aggregate executions led, joined in-process or shared across processes",
+     {(("outcome", k),): v for k, v in flights.stats.items()}),
+    ("cache_bus_total", "Cache invalidation events, flushes, gaps and reconnects",
+     {(("kind", k),): v for k, v in (cache_bus.stats if cache_bus else {}).items()}),
+])
+
+
+def is_query_timeout(error):
+    """True for a statement cancelled by statement_timeout (SQLSTATE 57014)."""
+    orig = getattr(error, "orig", None)
+    return (getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)) == "57014"
+
+
+def budget_left_ms(endpoint, started):
+    """Milliseconds left of endpoint's ROUTE_BUDGETS_MS budget, or None without a budget."""
+    budget = app.config.get("ROUTE_BUDGETS_MS", {}).get(endpoint)
+    if not budget:
+        return None
+    return budget - (time.monotonic() - started) * 1000
+
+
+def empty_result():
+    return IteratorResult(SimpleResultMetaData([]), iter([]))
+
+
+def degraded_info(kind, finished_at=None, dropped=()):
+    """What a timed-out section shows instead: kind is stale, coarse or unavailable."""
+    info = {"kind": kind, "dropped": list(dropped)}
+    if finished_at is not None:
+        seconds = (datetime.now(finished_at.tzinfo) - finished_at).total_seconds()
+        for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60), ("second", 1)):
+            if seconds >= size or unit == "second":
+                n = int(seconds // size)
+                info["age"] = "%d %s%s" % (n, unit, "" if n == 1 else "s")
+                break
+    return info
+
+
+def columnar_answer(section, params, version):
+    """(Result, lagging) from the COLUMNAR snapshot for data at version, or None to query Postgres."""
+    if columnar_store is None:
+        return None
+    snapshot, lagging = columnar_store.usable(version, app.config["COLUMNAR_MAX_LAG"])
+    result = snapshot.answer(section, params) if snapshot is not None else None
+    if result is None:
+        return None
+    COLUMNAR_ANSWERS.inc(section=section, lagging=int(lagging))
+    return result, lagging
+
+
+def aggregate(section, sql, params, args=None):
+    """Run an expensive aggregate once for all identical concurrent requests (single_flight.py),
+    within what is left of the route's time budget.
+
+    With COLUMNAR on, a usable snapshot answers first (columnar.py); one
+    behind the data sets g.snapshot_lag. On timeout the section gets its
+    last good result, else its coarse variant (route_queries.COARSE_ARGS),
+    else an empty result, and g.degraded says which. In cluster mode this
+    commits g.conn's transaction, which only ever holds reads here.
+    """
+    answered = columnar_answer(section, params, g.get("data_version") or known_version())
+    if answered is not None:
+        g.snapshot_lag = g.get("snapshot_lag") or answered[1]
+        return answered[0]
+    left = budget_left_ms(request.endpoint, g.started)
+    if left is None or left > 0:
+        try:
+            return flights.execute(g.conn, sql, params, timeout_ms=left)()
+        except OperationalError as e:
+            if not is_query_timeout(e):
+                raise
+            g.conn.rollback()
+    QUERY_TIMEOUTS.inc(route=request.endpoint, shape=section_shape(section, params))
+
+    hit, info = flights.last_good(g.conn, sql, params), None
+    if hit is not None:
+        info = degraded_info("stale", hit[1])
+    else:
+        coarse = coarse_query(section, args or {})
+        hit = flights.last_good(g.conn, *coarse[:2]) if coarse else None
+        if hit is not None:
+            info = degraded_info("coarse", hit[1], coarse[2])
+    info = info or degraded_info("unavailable")
+    g.degraded = dict(g.get("degraded") or {}, **{section: info})
+    DEGRADED_SECTIONS.inc(route=request.endpoint, section=section, fallback=info["kind"])
+    return hit[0]() if hit is not None else empty_result()
+
+
+@app.context_processor
+def _degraded_sections():
+    return {"degraded": g.get("degraded") or {}}
+
+
+# ---- conditional GET (migrations/004_data_version.sql) ----
+_build_tag = None
+
+
+def build_tag():
+    """Short hash of the templates and route code, so a deploy that changes a page's HTML changes its ETag."""
+    global _build_tag
+    if _build_tag is None:
+        here = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha1()
+        for name in sorted(app.jinja_env.list_templates(extensions=("html",))):
+            with open(os.path.join(tmpl_dir, name), "rb") as f:
+                digest.update(f.read())
+        for name in ("server.py", "route_queries.py"):
+            with open(os.path.join(here, name), "rb") as f:
+                digest.update(f.read())
+        _build_tag = digest.hexdigest()[:10]
+    return _build_tag
+
+
+def page_validators(version, changed_at, incident_id=None, daily=False):
+    """(etag, last_modified) of a page rendered from the data at this version.
+
+    daily: the page also depends on today's date (analysis time windows), so
+    the validators roll over at local midnight even when the data does not.
+    """
+    parts = ["i%d" % incident_id if incident_id is not None else "d", "v%d" % version]
+    if daily:
+        today = date.today()
+        parts.append(today.strftime("%Y%m%d"))
+        changed_at = max(changed_at, datetime.combine(today, datetime.min.time()).astimezone())
+    parts.append(build_tag())
+    return "-".join(parts), changed_at
+
+
+def validator_headers(etag, last_modified):
+    # no-cache: browsers and the CDN may store the page but must revalidate it on every use
+    return {"ETag": quote_etag(etag), "Last-Modified": http_date(last_modified), "Cache-Control": "no-cache"}
+
+
+def not_modified(environ, etag, last_modified):
+    """True when the request's If-None-Match (or If-Modified-Since) still matches."""
+    return not is_resource_modified(environ, etag=etag, last_modified=last_modified)
+
+
+def known_version(incident_id=None):
+    """(version, changed_at) from the cache bus without a query, or None."""
+    if cache_bus is None:
+        return None
+    return cache_bus.data_version() if incident_id is None else cache_bus.incident_version(incident_id)
+
+
+def remember_version(incident_id, row):
+    if cache_bus is not None and incident_id is not None:
+        cache_bus.remember_incident(incident_id, row.version, row.changed_at, row.read_at)
+    return row.version, row.changed_at
+
+
+def conditional_get(daily=False):
+    """Answer revalidations of a read page with 304 before the view runs any query.
+
+    The data version comes from the cache bus when it is listening, else from
+    one primary-key read; pages per incident use that incident's version.
+    Without migration 004 the page is served as before.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            incident_id = kwargs.get("incident_id")
+            known = known_version(incident_id)
+            if known is None:
+                try:
+                    if incident_id is None:
+                        row = g.conn.execute(text(DATA_VERSION_SQL)).one()
+                    else:
+                        row = g.conn.execute(text(INCIDENT_VERSION_SQL), {"incident_id": incident_id}).one()
+                except ProgrammingError:
+                    g.conn.rollback()
+                    return view(**kwargs)
+                known = remember_version(incident_id, row)
+            g.data_version = known
+            etag, last_modified = page_validators(*known, incident_id, daily)
+            if not_modified(request.environ, etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if g.get("degraded") or g.get("snapshot_lag"):
+                    # a fallback (or an older snapshot) must not be revalidated as if it were the real page
+                    response.headers["Cache-Control"] = "no-store"
+                    return response
+            response.headers.update(validator_headers(etag, last_modified))
+            return response
+        return wrapper
+    return decorator
 
 #
 # Example of running queries in your database
@@ -63,118 +585,20 @@ with engine.connect() as conn:
 @app.route('/admin')
 def admin_index():
     page = max(int(request.args.get("page", 1)), 1)
-    incidents_per_page = 20
-
-    # regular filters
-    lawcategory     = request.args.get("lawcategory")
-    status          = request.args.get("status")
-    borough         = request.args.getlist("borough")
-    severity        = request.args.get("severity")
-    crime_type      = request.args.get("crime_type")
-    postal_code     = request.args.get("postal_code")
-    date_start      = request.args.get("date_start")
-    date_end        = request.args.get("date_end")
-
-    # NEW: victim filters
-    victim_gender    = request.args.get("victim_gender")
-    victim_age_grp   = request.args.get("victim_age_grp")
-    victim_ethnicity = request.args.get("victim_ethnicity")
-
-    filters = []
-    params  = {}
-
-    if lawcategory:
-        filters.append("lc.category = :lawcategory")
-        params["lawcategory"] = lawcategory
-
-    if status:
-        filters.append("i.status = :status")
-        params["status"] = status
-
-    if borough:
-        filters.append("a.borough = ANY(:borough)")
-        params["borough"] = borough
-
-    if severity:
-        filters.append("ct.severity = :severity")
-        params["severity"] = severity
-
-    clean_crime_type = (crime_type or "").strip().lower()
-    if clean_crime_type:
-        # escape % and _ on our side; use ESCAPE '\\'
-        filters.append("ct.crime_type ILIKE :crime_type ESCAPE '\\\\'")
-        params["crime_type"] = f"%{handle_wildcards_characters(clean_crime_type)}%"
-
-    if postal_code:
-        filters.append("a.postal_code = :postal_code")
-        params["postal_code"] = postal_code
-
-    if date_start:
-        filters.append("i.occurred_date >= :date_start")
-        params["date_start"] = date_start
-
-    if date_end:
-        filters.append("i.occurred_date <= :date_end")
-        params["date_end"] = date_end
-
-    # ----- Victim EXISTS subfilter (prevents duplicate incidents) -----
-    victim_clauses = []
-    if victim_gender:
-        victim_clauses.append("v.gender = :v_gender")
-        params["v_gender"] = victim_gender
-    if victim_age_grp:
-        victim_clauses.append("v.age_grp = :v_age_grp")
-        params["v_age_grp"] = victim_age_grp
-    if victim_ethnicity:
-        victim_clauses.append("v.race = :v_ethnicity")
-        params["v_ethnicity"] = victim_ethnicity
-
-    if victim_clauses:
-        victim_sql = "EXISTS (SELECT 1 FROM victim v WHERE v.incident_id = i.incident_id AND " + " AND ".join(victim_clauses) + ")"
-        filters.append(victim_sql)
-
-    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
-
-    # ---------- COUNT ----------
-    count_query = f"""
-        SELECT COUNT(*) AS total
-        FROM incident i
-        JOIN address a        ON i.address_id = a.address_id
-        JOIN jurisdiction j   ON i.jur_id = j.jur_id
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
-        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
-        {where_clause}
-    """
-    total_incidents = g.conn.execute(text(count_query), params).scalar_one()
+    incidents_per_page = LIST_PAGE_SIZE
+
+    # regular + victim filters (shared with the general-user list)
+    where_clause, params = incident_list_filter(request.args)
+
+    # ---------- COUNT + FACETS ----------
+    facets = list_facets(g.conn, where_clause, params)
+    total_incidents = facets["total"]
     total_pages = max(ceil(total_incidents / incidents_per_page), 1)
-    offset = (page - 1) * incidents_per_page
 
     # ---------- DATA ----------
-    data_query = f"""
-        SELECT
-            i.incident_id,
-            i.occurred_date,
-            ct.crime_type,
-            lc.category,
-            ct.severity,
-            i.status,
-            j.description AS jurisdiction,
-            a.borough,
-            a.postal_code
-        FROM incident i
-        JOIN address a        ON i.address_id = a.address_id
-        JOIN jurisdiction j   ON i.jur_id = j.jur_id
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
-        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
-        {where_clause}
-        ORDER BY i.occurred_date DESC
-        LIMIT :limit OFFSET :offset;
-    """
     cursor = g.conn.execute(
-        text(data_query),
-        {**params, "limit": incidents_per_page, "offset": offset},
+        text(incident_page_sql(where_clause, id_first=True)),
+        page_params(params, page),
     )
     rows = cursor.fetchall()
     columns = [
@@ -216,55 +640,83 @@ def admin_index():
         total_pages=total_pages,
         page_numbers=page_numbers,
         make_url=make_url_admin,
+        facets=facets,
     )
+
+
+BULK_ACTIONS = {"close": "bulk_close", "reopen": "bulk_reopen", "delete": "bulk_delete"}
+
+
+@app.route('/admin/bulk', methods=['POST'])
+def admin_bulk():
+    """Close, reopen or delete the selected incidents, or every incident matching the list filter.
+
+    Runs as a background job (reports.py) in keyed batches; redirects to its progress page.
+    """
+    kind = BULK_ACTIONS.get(request.form.get("action", ""))
+    filter_args = [(name, value) for name in LIST_FILTER_ARGS for value in request.form.getlist(name) if value]
+    if request.form.get("scope") == "selected":
+        args = MultiDict(("incident_id", value) for value in request.form.getlist("incident_id"))
+    else:
+        args = MultiDict(filter_args)
+    back = url_for("admin_index", **MultiDict(filter_args).to_dict(flat=False))
+    if kind is None:
+        flash("Choose an action.", "error")
+        return redirect(back)
+    params = job_params(kind, args)
+    if not params:
+        # an empty filter would be every incident in the database
+        flash("Select incidents or set a filter first.", "error")
+        return redirect(back)
+    return submit_admin_job(kind, params)
+
+
+def job_params(kind, args):
+    """reports.normalize, or 400 for a malformed value."""
+    try:
+        return reports.normalize(kind, args)
+    except ValueError:
+        abort(400)
+
+
+def submit_admin_job(kind, params):
+    """Queue one of the data-changing report kinds (reports.py); redirects to its progress page.
+
+    POST /reports refuses these kinds, so they are only submitted from /admin routes.
+    """
+    job_id, how = reports.submit(g.conn, kind, params)
+    return redirect(url_for("report_job", job_id=job_id, submitted=how), code=303)
+
+
+@app.route('/admin/duplicates/sweep', methods=['POST'])
+def admin_duplicate_sweep():
+    return submit_admin_job("duplicate_sweep", job_params("duplicate_sweep", request.form))
+
+
+@app.route('/admin/workload/check', methods=['POST'])
+def admin_workload_reconcile():
+    return submit_admin_job("workload_reconcile", job_params("workload_reconcile", request.form))
+
+
+@app.route('/admin/crosstab/refresh', methods=['POST'])
+def admin_crosstab_refresh():
+    return submit_admin_job("crosstab_refresh", job_params("crosstab_refresh", request.form))
+
+
 @app.route('/admin/<int:incident_id>', methods=['GET', 'POST'])
 def admin_incident_detail(incident_id):
     # Incident core
-    incident = g.conn.execute(text("""
-        SELECT
-            i.incident_id,
-            i.occurred_date,
-            i.status,
-            i.incident_details AS description,
-            ct.crime_type,
-            lc.category,
-            ct.severity,
-            j.description AS jurisdiction,
-            a.borough,
-            a.postal_code
-        FROM incident i
-        JOIN address a        ON i.address_id = a.address_id
-        JOIN jurisdiction j   ON i.jur_id = j.jur_id
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
-        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
-        WHERE i.incident_id = :incident_id
-    """), {"incident_id": incident_id}).mappings().first()
+    incident = g.conn.execute(text(INCIDENT_DETAIL_SQL), {"incident_id": incident_id}).mappings().first()
     if not incident:
         abort(404)
 
     # Related rows
-    suspects = g.conn.execute(text("""
-        SELECT suspect_id, gender, race, age_grp, arrest_status, weapons
-        FROM suspect
-        WHERE incident_id = :incident_id
-        ORDER BY suspect_id
-    """), {"incident_id": incident_id}).mappings().all()
-
-    victims = g.conn.execute(text("""
-        SELECT victim_id, gender, race, injury_severity, age_grp
-        FROM victim
-        WHERE incident_id = :incident_id
-        ORDER BY victim_id
-    """), {"incident_id": incident_id}).mappings().all()
+    suspects = g.conn.execute(text(ADMIN_INCIDENT_SUSPECTS_SQL), {"incident_id": incident_id}).mappings().all()
+
+    victims = g.conn.execute(text(INCIDENT_VICTIMS_SQL), {"incident_id": incident_id}).mappings().all()
 
     # Suspect clues with full-text search support
-    suspect_clues = g.conn.execute(text("""
-        SELECT sc.clue_id, sc.suspect_id, sc.clue_text, sc.clue_tsv
-        FROM suspect_clue sc
-        WHERE sc.incident_id = :incident_id
-        ORDER BY sc.clue_id
-    """), {"incident_id": incident_id}).mappings().all()
+    suspect_clues = g.conn.execute(text(INCIDENT_CLUES_SQL), {"incident_id": incident_id}).mappings().all()
 
     if request.method == "POST":
         action = (request.form.get("action") or "").strip()
@@ -462,14 +914,41 @@ def admin_incident_detail(incident_id):
     )
 
 
+@app.route('/admin/<int:incident_id>/suspects/<int:suspect_id>/similar')
+def admin_similar_suspects(incident_id, suspect_id):
+    # candidates from the clue / weapon / demographic indexes, scored in one
+    # NumPy pass (similar_suspects.py); no comparison against every suspect
+    import similar_suspects  # NumPy: loaded on first use, not with the app
+    started = time.perf_counter()
+    suspect, matches = similar_suspects.find_similar(
+        g.conn, incident_id, suspect_id, flights=flights,
+        stats_ttl=app.config["CLUE_STATS_TTL"])
+    if suspect is None:
+        abort(404)
+    return render_template(
+        "admin_similar.html",
+        incident_id=incident_id,
+        suspect=suspect,
+        matches=matches,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+def execute_write(sql, params):
+    """Run one self-contained write statement in autocommit mode.
+
+    For the single-statement writes in route_queries.py: the statement is
+    atomic by itself, and skipping BEGIN/COMMIT makes it one round trip.
+    """
+    if g.conn.in_transaction():
+        g.conn.commit()
+    return g.conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(sql), params)
+
+
 @app.route('/admin/new', methods=['GET', 'POST'])
 def admin_new_incident():
     # Dropdowns
-    jurs_raw = g.conn.execute(text("""
-        SELECT jur_id, description
-        FROM jurisdiction
-        ORDER BY description
-    """)).mappings().all()
+    jurs_raw = reference_rows(g.conn, "jurisdictions")
     jurs = []
     for j in jurs_raw:
         try:
@@ -478,12 +957,7 @@ def admin_new_incident():
             display_id = j["jur_id"]
         jurs.append({"jur_id": j["jur_id"], "description": j["description"], "display_id": display_id})
 
-    crimes = g.conn.execute(text("""
-        SELECT ct.crime_type_id, ct.crime_type, ct.severity, lc.category
-        FROM crimetype ct
-        JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
-        ORDER BY lc.category, ct.crime_type
-    """)).mappings().all()
+    crimes = reference_rows(g.conn, "crime_types")
 
     if request.method == 'GET':
         return render_template('admin_new.html', jurs=jurs, crimes=crimes)
@@ -528,18 +1002,22 @@ def admin_new_incident():
 
     # numerics
     try:
-        float(latitude); float(longitude)
+        lat, lon = float(latitude), float(longitude)
     except Exception:
         errors.append("Latitude/Longitude must be numeric.")
+    else:
+        if not (isfinite(lat) and isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+            errors.append("Latitude must be between -90 and 90 and longitude between -180 and 180.")
 
-    # jurisdiction exists
+    # jurisdiction exists (the dropdown rows are usually cached; only an id
+    # missing from them, e.g. added by another process, costs a query)
     jur_id = None
     if jur_id_raw:
         try:
             jur_id = float(jur_id_raw)
         except Exception:
             errors.append("Jurisdiction value is invalid.")
-    if jur_id is not None:
+    if jur_id is not None and jur_id not in {float(j["jur_id"]) for j in jurs_raw}:
         exists = g.conn.execute(
             text("SELECT 1 FROM jurisdiction WHERE jur_id = :id"),
             {"id": jur_id}
@@ -550,92 +1028,94 @@ def admin_new_incident():
     if errors:
         return render_template('admin_new.html', jurs=jurs, crimes=crimes, errors=errors, form=request.form)
 
-    # --- DB writes ---
-    # 1) Address reuse/insert
-    addr_row = g.conn.execute(
-        text("""
-            SELECT address_id
-            FROM address
-            WHERE borough = :b AND postal_code = :p AND latitude = :lat AND longitude = :lon
-            LIMIT 1
-        """),
-        {"b": borough, "p": postal_code, "lat": latitude, "lon": longitude},
-    ).first()
-    address_id = addr_row[0] if addr_row else g.conn.execute(
-        text("""
-            INSERT INTO address (borough, postal_code, latitude, longitude)
-            VALUES (:b, :p, :lat, :lon)
-            RETURNING address_id
-        """),
-        {"b": borough, "p": postal_code, "lat": latitude, "lon": longitude},
-    ).scalar_one()
-
-    # 2) Incident (store the single occurred_date; no end-date tag)
-    incident_id = g.conn.execute(
-        text("""
-            INSERT INTO incident (jur_id, address_id, occurred_date, status, incident_details)
-            VALUES (:jur, :addr, :odate, :status, :details)
-            RETURNING incident_id
-        """),
-        {
-            "jur": jur_id,
-            "addr": address_id,
-            "odate": d_when.isoformat(),
-            "status": status,
-            "details": details or None
-        },
-    ).scalar_one()
-
-    # 3) Classified_As
-    g.conn.execute(
-        text("INSERT INTO classified_as (incident_id, crime_type_id) VALUES (:iid, :ctid)"),
-        {"iid": incident_id, "ctid": int(crime_type_id)},
-    )
-
-    # 4) Suspects (up to 3)
+    # Suspects (up to 3; gender and age group required)
+    suspects = []
     for i in range(1, 4):
         s_gender = (request.form.get(f'suspect{i}_gender') or '').strip()
         s_race   = (request.form.get(f'suspect{i}_race') or '').strip()
         s_age    = (request.form.get(f'suspect{i}_age_grp') or '').strip()
         s_arrest = request.form.get(f'suspect{i}_arrest_status')
-        arrest_status = True if s_arrest == 'on' else False
-        if any([s_gender, s_race, s_age, s_arrest]):
-            if s_gender and s_age:
-                g.conn.execute(
-                    text("""
-                        INSERT INTO suspect (incident_id, gender, race, age_grp, arrest_status)
-                        VALUES (:iid, :g, :r, :age, :ar)
-                    """),
-                    {"iid": incident_id, "g": s_gender or None, "r": s_race or None,
-                     "age": s_age or None, "ar": arrest_status},
-                )
+        if s_gender and s_age:
+            suspects.append({"gender": s_gender, "race": s_race or None, "age_grp": s_age,
+                             "arrest_status": s_arrest == 'on'})
 
-    # 5) Victims (up to 3)
+    # Victims (up to 3; gender and age group required)
+    victims = []
     for i in range(1, 4):
         v_gender = (request.form.get(f'victim{i}_gender') or '').strip()
         v_race   = (request.form.get(f'victim{i}_race') or '').strip()
         v_age    = (request.form.get(f'victim{i}_age_grp') or '').strip()
         v_injury = (request.form.get(f'victim{i}_injury') or '').strip()
-        if any([v_gender, v_race, v_age, v_injury]):
-            if v_gender and v_age:
-                g.conn.execute(
-                    text("""
-                        INSERT INTO victim (incident_id, gender, race, injury_severity, age_grp)
-                        VALUES (:iid, :g, :r, :inj, :age)
-                    """),
-                    {"iid": incident_id, "g": v_gender or None, "r": v_race or None,
-                     "inj": v_injury or None, "age": v_age or None},
-                )
+        if v_gender and v_age:
+            victims.append({"gender": v_gender, "race": v_race or None, "injury_severity": v_injury or None,
+                            "age_grp": v_age})
+
+    # Possible duplicates in the report's block (duplicates.py): shown once,
+    # "Create anyway" posts the form again with confirm_duplicate set.
+    if not request.form.get('confirm_duplicate'):
+        import duplicates  # NumPy: loaded on first use, not with the app
+        possible = duplicates.check_new(
+            g.conn, d_when, int(crime_type_id), float(latitude), float(longitude),
+            victims, suspects, app.config["DUPLICATE_MIN_SCORE"])
+        if possible:
+            return render_template('admin_new.html', jurs=jurs, crimes=crimes, form=request.form,
+                                   duplicates=possible)
+
+    # --- DB writes: address reuse/insert, incident, classification, suspects
+    # and victims in one statement (see route_queries.new_incident_sql) ---
+    incident_id = execute_write(
+        new_incident_sql(len(suspects), len(victims)),
+        {
+            "b": borough, "p": postal_code, "lat": float(latitude), "lon": float(longitude),
+            "jur": jur_id,
+            "odate": d_when,
+            "status": status,
+            "details": details or None,
+            "ctid": int(crime_type_id),
+            **people_params("s", SUSPECT_FIELDS, suspects),
+            **people_params("v", VICTIM_FIELDS, victims),
+        },
+    ).scalar_one()
 
-    g.conn.commit()
     return redirect(url_for('admin_incident_detail', incident_id=incident_id))
 
+@app.route('/admin/duplicates', methods=['GET', 'POST'])
+def admin_duplicates():
+    # Pairs stored by the last sweep (duplicates.py); dismissing one keeps it
+    # out of later sweeps' results. Deleting a duplicate is on its detail page.
+    if request.method == 'POST':
+        try:
+            pair = {"incident_id": int(request.form.get('incident_id', '')),
+                    "duplicate_of": int(request.form.get('duplicate_of', ''))}
+        except ValueError:
+            abort(400)
+        execute_write(DUPLICATE_DISMISS_SQL, pair)
+        flash(f"Incidents #{pair['incident_id']} and #{pair['duplicate_of']} marked as not duplicates.", "success")
+        return redirect(url_for('admin_duplicates', min_score=request.form.get('min_score') or None))
+    min_score = request.args.get('min_score', type=float, default=app.config["DUPLICATE_MIN_SCORE"])
+    pairs = g.conn.execute(text(DUPLICATE_LIST_SQL), {"min_score": min_score, "limit": 200}).mappings().all()
+    return render_template('admin_duplicates.html', pairs=pairs, min_score=min_score,
+                           total=pairs[0]["total"] if pairs else 0)
+
+
+@app.route('/admin/workload')
+def admin_workload():
+    # Open / closed incidents and arrest rates from the trigger-maintained
+    # workload_counter (migrations/012): one row per group, however many
+    # incidents. workload.py checks the counters against a recount.
+    by = request.args.get('by', 'jurisdiction')
+    if by not in WORKLOAD_DIMENSIONS:
+        abort(400)
+    groups = g.conn.execute(text(workload_sql(by))).mappings().all()
+    totals = {column: sum(row[column] for row in groups)
+              for column in ("open_incidents", "closed_incidents", "suspects", "arrested_suspects")}
+    return render_template('admin_workload.html', groups=groups, totals=totals, by=by,
+                           dimensions=list(WORKLOAD_DIMENSIONS))
+
 @app.route('/admin/system', methods=['GET', 'POST'])
 def admin_system():
     # Still load existing categories so Crime Type can reference them
-    lawcats = g.conn.execute(text("""
-        SELECT law_cat_id, category FROM lawcategory ORDER BY law_cat_id
-    """)).mappings().all()
+    lawcats = reference_rows(g.conn, "law_categories")
 
     msg = None
     errors = []
@@ -657,26 +1137,17 @@ def admin_system():
                 errors.append("Severity must be low/medium/high.")
 
             if not errors:
-                lc_ok = g.conn.execute(
-                    text("SELECT 1 FROM lawcategory WHERE law_cat_id = :id"),
-                    {"id": law_cat_id}
-                ).first()
-                if not lc_ok:
+                # existence check, duplicate check and insert in one statement
+                result = execute_write(CREATE_CRIME_TYPE_SQL, {
+                    "lc": law_cat_id, "ct": crime_type, "ct_lower": crime_type.lower(), "sev": severity,
+                }).mappings().one()
+                if not result["law_cat_exists"]:
                     errors.append(f"Law category '{law_cat_id}' does not exist.")
+                elif result["duplicate"]:
+                    errors.append("Crime type already exists under that law category.")
                 else:
-                    dup = g.conn.execute(text("""
-                        SELECT 1 FROM crimetype
-                        WHERE law_cat_id=:lc AND lower(crime_type)=:ct
-                    """), {"lc": law_cat_id, "ct": crime_type.lower()}).first()
-                    if dup:
-                        errors.append("Crime type already exists under that law category.")
-                    else:
-                        g.conn.execute(text("""
-                            INSERT INTO crimetype (law_cat_id, crime_type, severity)
-                            VALUES (:lc, :ct, :sev)
-                        """), {"lc": law_cat_id, "ct": crime_type, "sev": severity})
-                        g.conn.commit()
-                        msg = f"Created crime type “{crime_type}” ({severity}) under {law_cat_id}"
+                    invalidate_reference_data("crime_types")
+                    msg = f"Created crime type “{crime_type}” ({severity}) under {law_cat_id}"
 
         # --- Create Jurisdiction (INT input -> FLOAT PK) ---
         elif kind == 'jurisdiction':
@@ -699,20 +1170,31 @@ def admin_system():
                     errors.append("Jurisdiction ID must be an integer (e.g., 72).")
 
             if not errors:
-                exists = g.conn.execute(
-                    text("SELECT 1 FROM jurisdiction WHERE jur_id = :id"),
-                    {"id": jur_float}
-                ).first()
-                if exists:
+                created = execute_write(CREATE_JURISDICTION_SQL, {"id": jur_float, "d": description}).first()
+                if not created:
                     errors.append(f"Jurisdiction {int(jur_float)} already exists.")
                 else:
-                    g.conn.execute(
-                        text("INSERT INTO jurisdiction (jur_id, description) VALUES (:id, :d)"),
-                        {"id": jur_float, "d": description}
-                    )
-                    g.conn.commit()
+                    invalidate_reference_data("jurisdictions")
                     msg = f"Created jurisdiction {int(jur_float)} — {description}"
 
+        # --- Bulk suspect clues (CSV upload, one set-based load) ---
+        elif kind == 'clue_import':
+            upload = request.files.get('clues_csv')
+            if not upload or not upload.filename:
+                errors.append("Choose a CSV file of incident_id, suspect_id, clue_text rows.")
+            else:
+                dry_run = bool(request.form.get('dry_run'))
+                result = clue_import.import_clues(g.conn, upload.stream, dry_run=dry_run)
+                errors.extend(f"Line {line}: {reason}" for line, reason in result.rejects)
+                if result.rejected > len(result.rejects):
+                    errors.append(f"... and {result.rejected - len(result.rejects):,} more rows rejected.")
+                if result.error:
+                    errors.append(f"The file was rejected and nothing was imported: {result.error}")
+                elif dry_run:
+                    msg = f"Checked {result.rows:,} rows: {result.rows - result.rejected:,} would be imported"
+                else:
+                    msg = f"Imported {result.inserted:,} of {result.rows:,} clues in {result.seconds:.1f}s"
+
     return render_template(
         "admin_system.html",
         lawcats=lawcats,  # still needed for the crime-type dropdown
@@ -722,6 +1204,7 @@ def admin_system():
 
 ######################################### above is admin functions ######################################################
 @app.route("/recommendations", methods=["GET"])
+@conditional_get()
 def recommendations():
     """
     Personalized recommendations using demographic match rate:
@@ -736,72 +1219,10 @@ def recommendations():
     age_grp = (request.args.get("age_grp") or "").strip()
     race   = (request.args.get("race") or "").strip()
 
-    params = {"gender": gender, "age_grp": age_grp, "race": race}
+    params = recommendation_params(request.args)
 
-    # ------------------------------------------------------------
-    # Section A: Top 10 "safest" (lowest demographic match %)
-    # ------------------------------------------------------------
-    # Notes:
-    # - We only include rows with BOTH postal_code and borough present.
-    # - If no demographic filters were supplied (all empty), demo_incidents == total_incidents,
-    #   so demo_pct == 100% for all rows. That’s expected: “people like me” == everyone.
-    top10_sql = """
-    WITH base AS (
-      SELECT
-        i.incident_id,
-        a.postal_code::text AS postal_code,
-        a.borough
-      FROM incident i
-      JOIN address a        ON a.address_id = i.address_id
-      WHERE a.postal_code IS NOT NULL
-        AND a.postal_code <> ''
-        AND a.borough IS NOT NULL
-        AND a.borough <> ''
-    ),
-    tot AS (
-      SELECT
-        b.postal_code,
-        b.borough,
-        COUNT(DISTINCT b.incident_id) AS total_incidents
-      FROM base b
-      GROUP BY b.postal_code, b.borough
-    ),
-    demo AS (
-      SELECT
-        b.postal_code,
-        b.borough,
-        COUNT(DISTINCT b.incident_id) AS demo_incidents
-      FROM base b
-      WHERE
-        -- If all demographic filters are empty, count EVERY incident as matching.
-        (:gender = '' AND :age_grp = '' AND :race = '')
-        OR EXISTS (
-            SELECT 1
-            FROM victim v
-            WHERE v.incident_id = b.incident_id
-              AND (:gender  = '' OR v.gender = :gender)
-              AND (:age_grp = '' OR v.age_grp = :age_grp)
-              AND (:race    = '' OR v.race   = :race)
-        )
-      GROUP BY b.postal_code, b.borough
-    )
-    SELECT
-      t.postal_code,
-      t.borough,
-      t.total_incidents,
-      COALESCE(d.demo_incidents, 0) AS demo_incidents,
-      CASE WHEN t.total_incidents = 0
-           THEN 0.0
-           ELSE ROUND(100.0 * COALESCE(d.demo_incidents,0) / t.total_incidents, 2)
-      END AS demo_pct
-    FROM tot t
-    LEFT JOIN demo d
-      ON d.postal_code = t.postal_code AND d.borough = t.borough
-    -- SAFEST first = lowest demographic match percentage.
-    ORDER BY demo_pct ASC, t.total_incidents DESC, t.postal_code ASC
-    LIMIT 10;
-    """
-    top_rows = g.conn.execute(text(top10_sql), params).mappings().all()
+    # Section A: Top 10 "safest" (lowest demographic match %), see route_queries.py
+    top_rows = aggregate("recommendations.top10", RECOMMENDATIONS_TOP10_SQL, params, request.args).mappings().all()
 
     # Build a simple column header list for the table
     top_cols = ["Postal Code", "Borough", "Total Incidents", "Matching Incidents", "Match %"]
@@ -813,84 +1234,10 @@ def recommendations():
     risk_bucket = None
     # --- Section B: risk for a specific postal code (postal+borough-consistent) ---
     if postal:
-        zip_sql = """
-        -- Find a concrete borough for this ZIP (prefer any non-null value).
-        WITH zz AS (
-          SELECT a.borough
-          FROM address a
-          JOIN incident i ON i.address_id = a.address_id
-          WHERE a.postal_code::text = :zip
-            AND a.borough IS NOT NULL AND a.borough <> ''
-          GROUP BY a.borough
-          ORDER BY COUNT(DISTINCT i.incident_id) DESC
-          LIMIT 1
-        ),
-
-
-        -- Totals per that (zip, borough)
-        tot AS (
-          SELECT COUNT(DISTINCT i.incident_id) AS total_incidents
-          FROM incident i
-          JOIN address a ON a.address_id = i.address_id
-          WHERE a.postal_code::text = :zip
-            AND a.borough = (SELECT borough FROM zz)
-        ),
-
-        -- “Matching” incidents for the same (zip, borough)
-        demo AS (
-          SELECT COUNT(DISTINCT i.incident_id) AS demo_incidents
-          FROM incident i
-          JOIN address a ON a.address_id = i.address_id
-          WHERE a.postal_code::text = :zip
-            AND a.borough = (SELECT borough FROM zz)
-            AND (
-                  (:gender = '' AND :age_grp = '' AND :race = '')
-               OR EXISTS (
-                    SELECT 1
-                    FROM victim v
-                    WHERE v.incident_id = i.incident_id
-                      AND (:gender  = '' OR v.gender = :gender)
-                      AND (:age_grp = '' OR v.age_grp = :age_grp)
-                      AND (:race    = '' OR v.race   = :race)
-               )
-            )
-        )
-
-        SELECT
-          CAST(:zip AS text)                     AS postal_code,
-          (SELECT borough FROM zz)               AS borough,
-          (SELECT total_incidents FROM tot)      AS total_incidents,
-          (SELECT demo_incidents  FROM demo)     AS demo_incidents,
-          CASE
-            WHEN (SELECT total_incidents FROM tot) = 0 THEN 0.0
-            ELSE ROUND(
-              100.0 * (SELECT demo_incidents FROM demo)
-                    / NULLIF((SELECT total_incidents FROM tot), 0), 2)
-          END AS demo_pct;
-
-        """
-        row = g.conn.execute(
-            text(zip_sql),
-            {"zip": postal, "gender": gender, "age_grp": age_grp, "race": race},
-        ).mappings().first()
+        row = aggregate("recommendations.zip", RECOMMENDATIONS_ZIP_SQL, {"zip": postal, **params}).mappings().first()
 
         if row:
-            pct = float(row["demo_pct"])
-            # Buckets — tweak thresholds if you prefer
-            if pct <= 10:
-                risk_bucket = "Low"
-            elif pct <= 25:
-                risk_bucket = "Moderate"
-            else:
-                risk_bucket = "High"
-
-            user_result = {
-                "postal_code": row["postal_code"],
-                "borough": row["borough"],
-                "total_incidents": row["total_incidents"],
-                "demo_incidents": row["demo_incidents"],
-                "demo_pct": pct,
-            }
+            user_result, risk_bucket = zip_risk(row)
 
     return render_template(
         "recommendations.html",
@@ -908,45 +1255,38 @@ def recommendations():
     )
 
 
+def zip_risk(row):
+    """(user_result, risk_bucket) for one RECOMMENDATIONS_ZIP_SQL row."""
+    pct = float(row["demo_pct"])
+    # Buckets — tweak thresholds if you prefer
+    if pct <= 10:
+        risk_bucket = "Low"
+    elif pct <= 25:
+        risk_bucket = "Moderate"
+    else:
+        risk_bucket = "High"
+
+    user_result = {
+        "postal_code": row["postal_code"],
+        "borough": row["borough"],
+        "total_incidents": row["total_incidents"],
+        "demo_incidents": row["demo_incidents"],
+        "demo_pct": pct,
+    }
+    return user_result, risk_bucket
+
+
 ######################################### above is personalized recommendation functions ######################################################
 @app.route('/incident/<int:incident_id>', methods=['GET'])
+@conditional_get()
 def user_incident_detail(incident_id):
-    incident = g.conn.execute(text("""
-        SELECT
-            i.incident_id,
-            i.occurred_date,
-            i.status,
-            i.incident_details AS description,
-            ct.crime_type,
-            lc.category,
-            ct.severity,
-            j.description AS jurisdiction,
-            a.borough,
-            a.postal_code
-        FROM incident i
-        JOIN address a        ON i.address_id = a.address_id
-        JOIN jurisdiction j   ON i.jur_id = j.jur_id
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
-        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
-        WHERE i.incident_id = :incident_id
-    """), {"incident_id": incident_id}).mappings().first()
+    incident = g.conn.execute(text(INCIDENT_DETAIL_SQL), {"incident_id": incident_id}).mappings().first()
     if not incident:
         abort(404)
 
-    suspects = g.conn.execute(text("""
-        SELECT suspect_id, gender, race, age_grp, arrest_status
-        FROM suspect
-        WHERE incident_id = :incident_id
-        ORDER BY suspect_id
-    """), {"incident_id": incident_id}).mappings().all()
+    suspects = g.conn.execute(text(INCIDENT_SUSPECTS_SQL), {"incident_id": incident_id}).mappings().all()
 
-    victims = g.conn.execute(text("""
-        SELECT victim_id, gender, race, injury_severity, age_grp
-        FROM victim
-        WHERE incident_id = :incident_id
-        ORDER BY victim_id
-    """), {"incident_id": incident_id}).mappings().all()
+    victims = g.conn.execute(text(INCIDENT_VICTIMS_SQL), {"incident_id": incident_id}).mappings().all()
 
     return render_template("user_detail.html",
                            incident=incident, suspects=suspects, victims=victims)
@@ -972,12 +1312,6 @@ def make_url_page(page):
 				args_flat[k] = ""
 	return url_for("index", **args_flat)
 
-def handle_wildcards_characters(s):
-	s = s.replace("\\", "\\\\")
-	s = s.replace("%", "\\%")
-	s = s.replace("_", "\\_")
-	return s
-
 @app.before_request
 def before_request():
 	"""
@@ -987,8 +1321,9 @@ def before_request():
 
 	The variable g is globally accessible.
 	"""
+	g.started = time.monotonic()
 	try:
-		g.conn = engine.connect()
+		g.conn = get_engine().connect()
 	except:
 		print("uh oh, problem connecting to database")
 		import traceback; traceback.print_exc()
@@ -1027,116 +1362,20 @@ def index():
     """
     # --- query parameters ---
     page = max(int(request.args.get("page", 1)), 1)
-    incidents_per_page = 20
-
-    lawcategory      = request.args.get("lawcategory")
-    status           = request.args.get("status")
-    borough          = request.args.getlist("borough")
-    severity         = request.args.get("severity")
-    crime_type       = request.args.get("crime_type")
-    postal_code      = request.args.get("postal_code")
-    date_start       = request.args.get("date_start")
-    date_end         = request.args.get("date_end")
-    victim_gender    = request.args.get("victim_gender")
-    victim_age_grp   = request.args.get("victim_age_grp")
-    victim_ethnicity = request.args.get("victim_ethnicity")
-
-    filters     = []
-    parameters  = {}
-
-    if lawcategory:
-        filters.append("lc.category = :lawcategory")
-        parameters["lawcategory"] = lawcategory
-
-    if status:
-        filters.append("i.status = :status")
-        parameters["status"] = status
-
-    if borough:
-        filters.append("a.borough = ANY(:borough)")
-        parameters["borough"] = borough
-
-    if severity:
-        filters.append("ct.severity = :severity")
-        parameters["severity"] = severity
-
-    clean_crime_type = (crime_type or "").strip().lower()
-    if clean_crime_type:
-        filters.append("ct.crime_type ILIKE :crime_type ESCAPE '\\'")
-        parameters["crime_type"] = f"%{handle_wildcards_characters(clean_crime_type)}%"
-
-    if postal_code:
-        filters.append("a.postal_code = :postal_code")
-        parameters["postal_code"] = postal_code
-
-    if date_start:
-        filters.append("i.occurred_date >= :date_start")
-        parameters["date_start"] = date_start
-
-    if date_end:
-        filters.append("i.occurred_date <= :date_end")
-        parameters["date_end"] = date_end
-
-    # victim filters
-    if victim_gender:
-        filters.append("v.gender = :victim_gender")
-        parameters["victim_gender"] = victim_gender
-
-    if victim_age_grp:
-        filters.append("v.age_grp = :victim_age_grp")
-        parameters["victim_age_grp"] = victim_age_grp
-
-    if victim_ethnicity:
-        filters.append("v.race = :victim_ethnicity")
-        parameters["victim_ethnicity"] = victim_ethnicity
-
-    # build WHERE
-    where_clause = ""
-    if filters:
-        where_clause = "WHERE " + " AND ".join(filters)
-
-    # --- counts for pagination ---
-    count_query = f"""
-        SELECT COUNT(*) AS total
-        FROM incident i
-        JOIN address a        ON i.address_id = a.address_id
-        JOIN jurisdiction j   ON i.jur_id = j.jur_id
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
-        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
-        LEFT JOIN victim v    ON v.incident_id = i.incident_id
-        {where_clause}
-    """
-    total_incidents = g.conn.execute(text(count_query), parameters).scalar_one()
+    incidents_per_page = LIST_PAGE_SIZE
+
+    # filters (victim filters use EXISTS so an incident with several victims is listed once)
+    where_clause, parameters = incident_list_filter(request.args)
+
+    # --- counts for pagination and the filter options (cached per filter) ---
+    facets = list_facets(g.conn, where_clause, parameters)
+    total_incidents = facets["total"]
     total_pages = max(ceil(total_incidents / incidents_per_page), 1)
-    offset = (page - 1) * incidents_per_page
 
     # --- data query (incident_id LAST) ---
-    data_query = f"""
-        SELECT
-            i.occurred_date,
-            ct.crime_type,
-            lc.category,
-            ct.severity,
-            i.status,
-            j.description AS jurisdiction,
-            a.borough,
-            a.postal_code,
-            i.incident_id
-        FROM incident i
-        JOIN address a        ON i.address_id = a.address_id
-        JOIN jurisdiction j   ON i.jur_id = j.jur_id
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct     ON ca.crime_type_id = ct.crime_type_id
-        JOIN lawcategory lc   ON lc.law_cat_id = ct.law_cat_id
-        LEFT JOIN victim v    ON v.incident_id = i.incident_id
-        {where_clause}
-        ORDER BY i.occurred_date DESC
-        LIMIT :limit OFFSET :offset
-    """
     cursor = g.conn.execute(
-        text(data_query),
-        {**parameters, "limit": incidents_per_page, "offset": offset},
+        text(incident_page_sql(where_clause)),
+        page_params(parameters, page),
     )
     rows = cursor.fetchall()
 
@@ -1163,6 +1402,7 @@ def index():
         total_pages=total_pages,
         page_numbers=page_numbers,
         make_url=make_url_page,
+        facets=facets,
     )
 
 #
@@ -1175,196 +1415,107 @@ def index():
 #
 
 @app.route('/incidents/analysis', methods=['GET'])
+@conditional_get()
 def incidents_analysis():
-
-	# section 1: top 10 crime types in nyc
-
-	# user inputs
-	window = request.args.get("window", "all")  # 90d, 180d, 1y, 3y, all
-	borough = request.args.get("borough")
-	postal_code = request.args.get("postal_code")
-	PRESETS_DAYS = {"90d": 90, "1y": 365, "5y": 365*5, "10y": 365*10}
-
-	filters = []
-	parameters = {}
-
-	if window != "all":
-		cutoff_date = date.today() - timedelta(days=PRESETS_DAYS.get(window, 90))
-		filters.append("i.occurred_date >= :cutoff_date")
-		parameters["cutoff_date"] = cutoff_date
-
-	if borough:
-		filters.append("a.borough = :borough")
-		parameters["borough"] = borough
-
-	if postal_code:
-		filters.append("a.postal_code = :postal_code")
-		parameters["postal_code"] = postal_code
-
-	if filters:
-		where_clause = "WHERE " + " AND ".join(filters)
-	else:
-		where_clause = ""
-
-	# query 1: top 10 crime types
-	top10_sql = f"""
-	WITH counts AS (
-	SELECT
-		ct.crime_type_id,
-        lc.category,
-		ct.crime_type,
-		COUNT(*) AS incident_count
-	FROM classified_as ca
-	JOIN crimetype ct ON ct.crime_type_id = ca.crime_type_id
-	JOIN incident i ON i.incident_id = ca.incident_id
-	JOIN address a ON a.address_id = i.address_id
-    JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
-	{where_clause}
-	GROUP BY ct.crime_type_id, ct.crime_type, lc.category
-	),
-	ranked AS (
-	SELECT
-		c.*,
-		DENSE_RANK() OVER (ORDER BY c.incident_count DESC) AS rnk
-	FROM counts c
-	)
-	SELECT category as law_category, crime_type, incident_count
-	FROM ranked
-	WHERE rnk <= 10
-	ORDER BY incident_count DESC, crime_type;
-	"""
-
-	# execute query & store results
-	cursor = g.conn.execute(text(top10_sql), parameters)
-	rows = cursor.fetchall()
-	columns = cursor.keys()
-	cursor.close()
-    
-	# query 2: customized filter
-    
-	# user inputs
-	custom_postal_code = request.args.get("custom_postal_code")
-	custom_gender = request.args.get("custom_gender")
-	custom_age_group = request.args.get("custom_age_group")
-	custom_ethnicity = request.args.get("custom_ethnicity")
-
-	custom_filters = []
-	custom_parameters = {}
-
-	if custom_postal_code:
-		custom_filters.append("a.postal_code = :custom_postal_code")
-		custom_parameters["custom_postal_code"] = custom_postal_code
-
-	if custom_gender:
-		custom_filters.append("v.gender = :custom_gender")
-		custom_parameters["custom_gender"] = custom_gender
-
-	if custom_age_group:
-		custom_filters.append("v.age_grp = :custom_age_group")
-		custom_parameters["custom_age_group"] = custom_age_group
-
-	if custom_ethnicity:
-		custom_filters.append("v.race = :custom_ethnicity")
-		custom_parameters["custom_ethnicity"] = custom_ethnicity
-
-	if custom_filters:
-		custom_where_clause = "WHERE " + " AND ".join(custom_filters)
-	else:
-		custom_where_clause = ""
-            
-    # query 2: customized filters
-	custom_sql = f"""
-    SELECT 
-        lc.category as law_category,
-        ct.crime_type,
-        COUNT(*) AS num_incidents
-    FROM incident i
-        JOIN victim v ON v.incident_id = i.incident_id
-        JOIN address a ON i.address_id = a.address_id
-        JOIN classified_as ca ON ca.incident_id = i.incident_id
-        JOIN crimetype ct ON ct.crime_type_id = ca.crime_type_id
-        JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
-    {custom_where_clause}
-    GROUP BY ct.crime_type_id, lc.category, ct.crime_type
-    ORDER BY num_incidents DESC;
-    """
-
-    # execute query & store results
-	custom_cursor = g.conn.execute(text(custom_sql), custom_parameters)
-	custom_rows = custom_cursor.fetchall()
-	custom_columns = custom_cursor.keys()
-	custom_cursor.close()
-
-
-    # query 3: crime trend over time
-
-    # set up
-	crime_types = g.conn.execute(text("""
-        SELECT ct.crime_type_id, ct.crime_type, ct.severity, lc.category
-        FROM crimetype ct
-        JOIN lawcategory lc ON lc.law_cat_id = ct.law_cat_id
-        ORDER BY lc.category, ct.crime_type
-    """)).mappings().all()
-
-    # user inputs
-	year_from = request.args.get("year_from")
-	year_to = request.args.get("year_to")
-	crime_type_id = request.args.get("crime_type_id")
-	trend_borough = request.args.get("trend_borough")
-
-	trend_filters = []
-	trend_parameters = {}
-
-	if year_from:
-		trend_filters.append("i.occurred_date >= :year_from")
-		trend_parameters["year_from"] = f"{int(year_from)}-01-01"
-
-	if year_to:
-		trend_filters.append("i.occurred_date <= :year_to")
-		trend_parameters["year_to"] = f"{int(year_to)}-12-31"
-
-	if crime_type_id:
-		trend_filters.append("ct.crime_type_id = :crime_type_id")
-		trend_parameters["crime_type_id"] = crime_type_id
-
-	if trend_borough:
-		trend_filters.append("a.borough = :trend_borough")
-		trend_parameters["trend_borough"] = trend_borough
-
-	if trend_filters:
-		where_clause_trend = "WHERE " + " AND ".join(trend_filters)
-	else:
-		where_clause_trend = ""
-
-
-    # query 3: crime trend over time
-	crime_trend_sql = f"""
-    SELECT 
-        EXTRACT(YEAR FROM i.occurred_date)::INT AS year,
-        COUNT(*) AS num_incidents
-    FROM incident i
-        JOIN classified_as ca ON i.incident_id = ca.incident_id
-        JOIN crimetype ct ON ca.crime_type_id = ct.crime_type_id
-        JOIN address a ON i.address_id = a.address_id
-    {where_clause_trend}
-    GROUP BY year
-    ORDER BY year;
-    """
-
-    # execute query & store results
-	trend_cursor = g.conn.execute(text(crime_trend_sql), trend_parameters)
-	trend_rows = trend_cursor.fetchall()
-	trend_columns = trend_cursor.keys()
-	trend_cursor.close()
+    # The page shell: the three forms, filled in from the args, and a
+    # placeholder per section that the page fetches on its own from
+    # incidents_analysis_section with only that section's args. No aggregate
+    # runs here, and submitting one form reloads only its section.
+    section_urls = {
+        name: url_for('incidents_analysis_section', section=name,
+                      **section_args("incidents_analysis." + name, request.args))
+        for name in ANALYSIS_SECTIONS
+    }
+    return render_template(
+        "incidents-analysis.html", section_urls=section_urls, crime_types=reference_rows(g.conn, "crime_types"),
+        window=request.args.get("window", "all"), borough=request.args.get("borough"),
+        postal_code=request.args.get("postal_code"),
+        custom_postal_code=request.args.get("custom_postal_code"), custom_gender=request.args.get("custom_gender"),
+        custom_age_group=request.args.get("custom_age_group"), custom_ethnicity=request.args.get("custom_ethnicity"),
+        crime_type_id=request.args.get("crime_type_id"), year_from=request.args.get("year_from"),
+        year_to=request.args.get("year_to"), trend_borough=request.args.get("trend_borough"),
+    )
 
 
-	return render_template(
-        "incidents-analysis.html", 
-        rows=rows, columns=columns, window=window, borough=borough, postal_code=postal_code,
-        custom_rows=custom_rows, custom_columns=custom_columns, custom_postal_code=custom_postal_code, custom_gender=custom_gender, custom_age_group=custom_age_group, custom_ethnicity=custom_ethnicity,
-        trend_rows=trend_rows, trend_columns=trend_columns, crime_types=crime_types, crime_type_id=crime_type_id, year_from=year_from, year_to=year_to, trend_borough=trend_borough
+@app.route('/incidents/analysis/<section>', methods=['GET'])
+@conditional_get(daily=True)
+def incidents_analysis_section(section):
+    # One section of /incidents/analysis: an HTML fragment for the page, or
+    # JSON with ?format=json. Its URL carries only the section's args, so it
+    # is the section's cache key (and ETag) in browsers and CDNs.
+    if section not in ANALYSIS_SECTIONS:
+        abort(404)
+    key = "incidents_analysis." + section
+    args = section_args(key, request.args)
+    sql, params = SECTION_QUERIES[key](args)
+    result = aggregate(key, sql, params, args)
+    rows, columns = result.fetchall(), list(result.keys())
+    if request.args.get("format") == "json":
+        return jsonify(section=section, columns=columns, rows=[list(row) for row in rows],
+                       degraded=(g.get("degraded") or {}).get(key))
+    return render_template("_analysis_section.html", section=key, rows=rows, columns=columns,
+                           heading=args.get("borough") if section == "top10" else None)
+
+
+@app.route('/incidents/trend', methods=['GET'])
+@conditional_get(daily=True)
+def incidents_trend():
+    # Trend API: JSON counts per day / week / month / quarter / year bucket
+    # from the stored bucketed counts (trends.py, migrations/014), e.g.
+    # ?grain=month&from=2015-01-01&borough=BRONX&borough=QUEENS&by=borough&yoy=1&ma=3
+    try:
+        start = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        end = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+        crime_type_ids = [int(c) for c in request.args.getlist("crime_type_id") if c]
+        moving_average = int(request.args["ma"]) if request.args.get("ma") else None
+        trend = trends.series(
+            g.conn, request.args.get("grain") or "month", start, end, crime_type_ids,
+            [b for b in request.args.getlist("borough") if b], request.args.get("by") or None,
+            year_over_year=request.args.get("yoy", "").lower() in ("1", "true", "yes"),
+            moving_average=moving_average,
+        )
+    except ValueError as e:
+        abort(400, description=str(e))
+    if request.args.get("by") == "crime_type":
+        names = {row["crime_type_id"]: row["crime_type"] for row in reference_rows(g.conn, "crime_types")}
+        for line in trend["series"]:
+            line["name"] = names.get(line["key"])
+    trend["buckets"] = [bucket.isoformat() for bucket in trend["buckets"]]
+    return jsonify(trend)
+
+
+@app.route('/incidents/crosstab', methods=['GET'])
+def incidents_crosstab():
+    # Victim x suspect demographics from the demographic_crosstab snapshot
+    # (crosstab.py, migrations/013): a matrix for one cut and, for a chosen
+    # cell, its breakdown by borough and by crime type; no victim / suspect scan.
+    victim = request.args.get('victim') or 'gender'
+    suspect = request.args.get('suspect') or 'gender'
+    if victim not in crosstab.ATTRIBUTES or suspect not in crosstab.ATTRIBUTES:
+        abort(400)
+    borough = request.args.get('borough') or None
+    try:
+        crime_type_id = int(request.args['crime_type_id']) if request.args.get('crime_type_id') else None
+    except ValueError:
+        abort(400)
+    victim_value = request.args.get('victim_value')
+    suspect_value = request.args.get('suspect_value')
+
+    matrix = crosstab.matrix(g.conn, victim, suspect, borough, crime_type_id)
+    breakdowns = {}
+    if victim_value is not None and suspect_value is not None:
+        for dimension, fixed in (("borough", borough), ("crime_type", crime_type_id)):
+            if fixed is None:
+                breakdowns[dimension] = crosstab.breakdown(g.conn, dimension, victim, suspect, victim_value,
+                                                           suspect_value, borough, crime_type_id)
+    return render_template(
+        "crosstab.html", matrix=matrix, breakdowns=breakdowns, state=crosstab.state(g.conn),
+        attributes=crosstab.ATTRIBUTES, crime_types=reference_rows(g.conn, "crime_types"),
+        victim=victim, suspect=suspect, borough=borough, crime_type_id=crime_type_id,
+        victim_value=victim_value, suspect_value=suspect_value,
     )
 
+
 # Example of adding new data to the database
 @app.route('/add', methods=['POST'])
 def add():
@@ -1393,9 +1544,12 @@ if __name__ == "__main__":
 	@click.command()
 	@click.option('--debug', is_flag=True)
 	@click.option('--threaded', is_flag=True)
+	@click.option('--profile-rate', type=float, default=None,
+	              help='Fraction of requests per route to sample with the profiler.')
+	@click.option('--warm', is_flag=True, help='Open the connection pool and load reference data before serving.')
 	@click.argument('HOST', default='0.0.0.0')
 	@click.argument('PORT', default=8111, type=int)
-	def run(debug, threaded, host, port):
+	def run(debug, threaded, profile_rate, warm, host, port):
 		"""
 		This function handles command line parameters.
 		Run the server using:
@@ -1408,8 +1562,15 @@ if __name__ == "__main__":
 
 		"""
 
+		if profile_rate is not None:
+			route_profiler.sample_rate = profile_rate
+
+		create_app()
+		boot(warm=warm or None)
+		start_cache_bus()
+		start_report_workers()
 		HOST, PORT = host, port
 		print("running on %s:%d" % (HOST, PORT))
 		app.run(host=HOST, port=PORT, debug=debug, threaded=threaded)
 
-run()
+	run()
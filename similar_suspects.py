@@ -0,0 +1,184 @@
+"""
+Similar suspects across incidents, for the /admin incident pages.
+
+Given a suspect, rank the suspects of other incidents that resemble it:
+same gender / age group / race, overlapping weapons, similar clue text.
+Pairs are never compared wholesale:
+
+  1. candidates come from indexes (route_queries.SIMILAR_CANDIDATES_SQL,
+     migrations/010): up to PER_SOURCE suspects whose clues share two rare
+     lexemes with this suspect's (GIN), up to PER_SOURCE carrying one of
+     its weapons with the same gender and age group (GIN and B-tree), and
+     the PER_DEMOGRAPHIC newest with the same demographics (B-tree);
+  2. every candidate is scored at once with NumPy, and the best LIMIT are
+     returned with their incidents.
+
+A score is the weighted mean, over the parts this suspect has data for, of:
+
+    demographics  share of gender / age group / race that are equal     weight 1
+    weapons       Jaccard similarity of the weapon sets                 weight 1
+    clues         IDF-weighted Jaccard similarity of the clue lexemes   weight 2
+
+A lexeme's IDF is log(clues / clues containing it), from ts_stat over all
+clues, run through single flight and reused for CLUE_STATS_TTL seconds.
+Lexemes found in more than COMMON_SHARE of all clues (the tip template's
+"wear", "build") are left out of the candidate query, which would
+otherwise match every clue (see clue_query); they still count, barely, in
+the score.
+
+Configuration (environment, read by server.load_config):
+    CLUE_STATS_TTL   seconds the clue lexeme statistics are reused (default 3600)
+"""
+import itertools
+import math
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from route_queries import (
+    SUSPECT_PROFILE_SQL, CLUE_LEXEME_STATS_SQL, SIMILAR_CANDIDATES_SQL, SIMILAR_INCIDENTS_SQL,
+)
+
+PER_SOURCE = 1000
+PER_DEMOGRAPHIC = 200
+LIMIT = 25
+COMMON_SHARE = 0.2
+QUERY_LEXEMES = 6
+WEIGHTS = {"demographics": 1.0, "weapons": 1.0, "clues": 2.0}
+SHARED_LEXEMES_SHOWN = 5
+
+_stats_lock = threading.Lock()
+_stats = None  # (expires_at, {lexeme: ndoc}, docs)
+
+
+def lexeme_stats(conn, flights=None, ttl=3600):
+    """({lexeme: clues containing it}, clue count), cached for ttl seconds."""
+    global _stats
+    with _stats_lock:
+        if _stats is not None and _stats[0] > time.monotonic():
+            return _stats[1], _stats[2]
+    result = flights.execute(conn, CLUE_LEXEME_STATS_SQL)() if flights else conn.execute(text(CLUE_LEXEME_STATS_SQL))
+    rows = result.fetchall()
+    ndoc = {row.word: row.ndoc for row in rows}
+    docs = rows[0].docs if rows else 0
+    with _stats_lock:
+        _stats = (time.monotonic() + ttl, ndoc, docs)
+    return ndoc, docs
+
+
+def clue_query(lexemes, ndoc, docs):
+    """tsquery text matching clues that share two of the suspect's rarest lexemes, or None.
+
+    Only lexemes in at most COMMON_SHARE of the clues count, the QUERY_LEXEMES
+    rarest of them; with a single one, clues containing it match. Requiring a
+    pair keeps the GIN match, and the ranking of it, to a few percent of the
+    clues where one shared word would match most of them.
+    """
+    rare = sorted((ndoc.get(l, 0), l) for l in lexemes if ndoc.get(l, 0) <= COMMON_SHARE * docs)
+    terms = ["'" + l.replace("\\", "\\\\").replace("'", "''") + "'" for _, l in rare[:QUERY_LEXEMES]]
+    if len(terms) < 2:
+        return terms[0] if terms else None
+    return " | ".join(f"({a} & {b})" for a, b in itertools.combinations(terms, 2))
+
+
+def _flatten(sets):
+    """(flat values, owner index per value) of a list of iterables."""
+    sets = [sorted(set(s or ())) for s in sets]
+    lengths = np.fromiter((len(s) for s in sets), dtype=np.int64, count=len(sets))
+    flat = np.array([v for s in sets for v in s], dtype=object)
+    return flat, np.repeat(np.arange(len(sets)), lengths)
+
+
+def score(target, candidates, idf, default_idf):
+    """Score every candidate against target in one vectorized pass.
+
+    target is a row with gender, age_grp, race, weapons, lexemes; candidates a
+    list of such rows. Returns (total, {part: scores}) as float arrays.
+    """
+    n = len(candidates)
+    parts = {}
+
+    attributes = [name for name in ("gender", "age_grp", "race") if getattr(target, name)]
+    if attributes:
+        equal = np.zeros(n)
+        for name in attributes:
+            values = np.array([getattr(c, name) for c in candidates], dtype=object)
+            equal += values == getattr(target, name)
+        parts["demographics"] = equal / len(attributes)
+
+    weapons = set(target.weapons or ())
+    if weapons:
+        flat, owner = _flatten(c.weapons for c in candidates)
+        hit = np.isin(flat, list(weapons)) if len(flat) else np.zeros(0, dtype=bool)
+        shared = np.bincount(owner, weights=hit, minlength=n)
+        union = np.bincount(owner, minlength=n) + len(weapons) - shared
+        parts["weapons"] = np.divide(shared, union, out=np.zeros(n), where=union > 0)
+
+    lexemes = set(target.lexemes or ())
+    if lexemes:
+        flat, owner = _flatten(c.lexemes for c in candidates)
+        if len(flat):
+            unique, inverse = np.unique(flat.astype(str), return_inverse=True)
+            w = np.array([idf.get(l, default_idf) for l in unique])[inverse]
+            hit = np.isin(unique, list(lexemes))[inverse]
+        else:
+            w, hit = np.zeros(0), np.zeros(0, dtype=bool)
+        target_weight = sum(idf.get(l, default_idf) for l in lexemes)
+        shared = np.bincount(owner, weights=w * hit, minlength=n)
+        union = np.bincount(owner, weights=w, minlength=n) + target_weight - shared
+        parts["clues"] = np.divide(shared, union, out=np.zeros(n), where=union > 0)
+
+    if not parts:
+        return np.zeros(n), parts
+    total = sum(WEIGHTS[name] * values for name, values in parts.items()) / sum(WEIGHTS[name] for name in parts)
+    return total, parts
+
+
+def find_similar(conn, incident_id, suspect_id, flights=None, stats_ttl=3600, limit=LIMIT):
+    """(suspect, ranked matches) for a suspect, or (None, []) if it does not exist.
+
+    Matches are dicts: the candidate suspect's columns, its incident's date,
+    status, place and crime types, score and per-part scores (0..1), and the
+    weapons and rarest clue lexemes it shares with the suspect.
+    """
+    target = conn.execute(text(SUSPECT_PROFILE_SQL), {"incident_id": incident_id, "suspect_id": suspect_id}).first()
+    if target is None:
+        return None, []
+    ndoc, docs = lexeme_stats(conn, flights, stats_ttl)
+    idf = {word: math.log(docs / n) for word, n in ndoc.items() if n}
+    default_idf = math.log(max(docs, 1))  # a lexeme newer than the statistics: as rare as can be
+
+    candidates = conn.execute(text(SIMILAR_CANDIDATES_SQL), {
+        "incident_id": incident_id,
+        "clue_query": clue_query(target.lexemes or (), ndoc, docs),
+        "weapons": list(target.weapons) if target.weapons else None,
+        "gender": target.gender, "age_grp": target.age_grp, "race": target.race,
+        "per_source": PER_SOURCE, "per_demographic": PER_DEMOGRAPHIC,
+    }).fetchall()
+    if not candidates:
+        return target, []
+
+    total, parts = score(target, candidates, idf, default_idf)
+    incident_ids = np.fromiter((c.incident_id for c in candidates), dtype=np.int64, count=len(candidates))
+    best = np.lexsort((-incident_ids, -total))[:limit]
+    best = [int(i) for i in best if total[i] > 0]
+
+    incidents = {row.incident_id: row for row in conn.execute(
+        text(SIMILAR_INCIDENTS_SQL), {"incident_ids": sorted({candidates[i].incident_id for i in best})})}
+    weapons = set(target.weapons or ())
+    lexemes = set(target.lexemes or ())
+    matches = []
+    for i in best:
+        c = candidates[i]
+        shared_lexemes = sorted(lexemes.intersection(c.lexemes or ()), key=lambda l: (-idf.get(l, default_idf), l))
+        matches.append({
+            **c._asdict(),
+            "incident": incidents.get(c.incident_id),
+            "score": float(total[i]),
+            "parts": {name: float(values[i]) for name, values in parts.items()},
+            "shared_weapons": sorted(weapons.intersection(c.weapons or ())),
+            "shared_lexemes": shared_lexemes[:SHARED_LEXEMES_SHOWN],
+        })
+    return target, matches
@@ -0,0 +1,347 @@
+"""
+Single-flight execution for the expensive aggregate queries.
+
+When a popular link is shared, many identical requests arrive together and
+each would run the same full-table aggregation. Here the first caller for a
+given (SQL, parameters) runs it and every caller that arrives while it is
+in flight gets the same result:
+
+  * within a process, concurrent callers wait on the leader's call and
+    share its result objects (SingleFlight for the threaded app,
+    AsyncSingleFlight for async_server.py);
+  * across processes and hosts, the leader also takes a transaction-level
+    advisory lock keyed by the query, and stores the result in
+    shared_result (migrations/006_shared_result.sql) in the same
+    transaction that releases the lock. A process that finds the lock
+    taken waits on it and reads the stored result instead of running
+    the query.
+
+A stored result is JSON data only, never pickle (anyone who can write
+shared_result would otherwise run code in every reader): the column names
+and the rows, with dates, timestamps and Decimals tagged ({"$date": ...},
+{"$datetime": ...}, {"$decimal": ...}) so they read back as the same types.
+A row that does not decode (say, one written by an older release) counts as
+no result.
+
+Results are sqlalchemy FrozenResult objects; call one to get a fresh Result
+(keys(), fetchall(), mappings()). A leader's error is raised in every caller
+that waited on it. If the leader of another process fails, its waiters find
+no result and run the query themselves.
+
+execute() takes an optional statement_timeout (ms) for the query and the
+wait. The latest result of each query is also kept as its "last good"
+answer (last_good()), in memory and, in cluster mode, in shared_result for
+a week, for routes that fall back to it when a query times out.
+
+Configuration (environment, read by server.load_config):
+    SINGLE_FLIGHT    "cluster" (default): in-process and across processes,
+                     "process": in-process only, "off": disabled
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+from sqlalchemy.exc import ProgrammingError
+
+log = logging.getLogger("single_flight")
+
+LOCK_NAMESPACE = 0x73666C74  # "sflt": first key of pg_advisory_xact_lock(int, int)
+PRUNE_PROBABILITY = 0.01
+LAST_GOOD_IN_MEMORY = 256
+
+TRY_LEAD_SQL = """
+        SELECT pg_try_advisory_xact_lock(:namespace, :lock) AS leader,
+               clock_timestamp()                            AS arrived_at,
+               set_config('statement_timeout', :timeout, true)
+"""
+SET_TIMEOUT_SQL = "SELECT set_config('statement_timeout', :timeout, true)"
+WAIT_SQL = "SELECT pg_advisory_xact_lock_shared(:namespace, :lock)"
+READ_RESULT_SQL = """
+        SELECT result FROM shared_result
+        WHERE key = :key AND finished_at >= :arrived_at
+"""
+STORE_RESULT_SQL = """
+        INSERT INTO shared_result (key, finished_at, result)
+        VALUES (:key, clock_timestamp(), :result)
+        ON CONFLICT (key) DO UPDATE
+            SET finished_at = EXCLUDED.finished_at, result = EXCLUDED.result
+"""
+LAST_GOOD_SQL = "SELECT result, finished_at FROM shared_result WHERE key = :key"
+PRUNE_SQL = "DELETE FROM shared_result WHERE finished_at < now() - interval '7 days'"
+
+
+def flight_key(sql, params):
+    """(key, lock): a digest of the query for shared_result and a 32-bit advisory lock id."""
+    digest = hashlib.sha1(repr((" ".join(sql.split()), sorted((params or {}).items()))).encode())
+    return digest.hexdigest(), int.from_bytes(digest.digest()[:4], "big", signed=True)
+
+
+def _tag(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError(f"cannot store {type(value).__name__} in shared_result")
+
+
+def _untag(obj):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag == "$datetime":
+            return datetime.fromisoformat(value)
+        if tag == "$date":
+            return date.fromisoformat(value)
+        if tag == "$decimal":
+            return Decimal(value)
+    return obj
+
+
+def encode_result(result):
+    """A FrozenResult as UTF-8 JSON for shared_result."""
+    return json.dumps({"keys": list(result.metadata.keys), "rows": result.rewrite_rows()},
+                      default=_tag, separators=(",", ":")).encode()
+
+
+def decode_result(stored):
+    """The FrozenResult encode_result stored, or None if stored does not decode."""
+    try:
+        data = json.loads(bytes(stored), object_hook=_untag)
+        rows = [tuple(row) for row in data["rows"]]
+        return IteratorResult(SimpleResultMetaData(data["keys"]), iter(rows)).freeze()
+    except (ValueError, KeyError, TypeError):
+        log.warning("ignoring a shared_result row that is not a stored result")
+        return None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _LastGood:
+    """Latest result and finish time per query key, most recent LAST_GOOD_IN_MEMORY kept."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = (result, datetime.now(timezone.utc))
+            self._results.move_to_end(key)
+            while len(self._results) > LAST_GOOD_IN_MEMORY:
+                self._results.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._results.get(key)
+
+
+def _timeout(ms):
+    return "%dms" % max(int(ms), 1) if ms else "0"
+
+
+class SingleFlight:
+    def __init__(self, mode="cluster"):
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._calls = {}            # key -> _Call in flight in this process
+        self._last_good = _LastGood()
+        self.stats = Counter()      # led / joined (in-process) / shared (from another process)
+
+    def execute(self, conn, sql, params=None, timeout_ms=None):
+        """Run sql on conn once for all concurrent identical callers; returns a FrozenResult.
+
+        timeout_ms bounds the query (and a wait for another process) with
+        statement_timeout. In cluster mode this ends conn's current
+        transaction (the advisory lock lives until commit), so call it with
+        results already fetched.
+        """
+        key, lock = flight_key(sql, params)
+        if self.mode == "off":
+            if timeout_ms:
+                conn.execute(text(SET_TIMEOUT_SQL), {"timeout": _timeout(timeout_ms)})
+            result = conn.execute(text(sql), params or {}).freeze()
+            self._last_good.put(key, result)
+            return result
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            self.stats["joined"] += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            if self.mode == "cluster":
+                call.result = self._execute_shared(conn, sql, params or {}, key, lock, timeout_ms)
+            else:
+                if timeout_ms:
+                    conn.execute(text(SET_TIMEOUT_SQL), {"timeout": _timeout(timeout_ms)})
+                call.result = conn.execute(text(sql), params or {}).freeze()
+                self.stats["led"] += 1
+            self._last_good.put(key, call.result)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def last_good(self, conn, sql, params=None):
+        """(FrozenResult, finished_at) of the latest successful run of this query, or None."""
+        key, _ = flight_key(sql, params)
+        hit = self._last_good.get(key)
+        if hit is None and self.mode == "cluster":
+            try:
+                row = conn.execute(text(LAST_GOOD_SQL), {"key": key}).first()
+            except ProgrammingError:
+                conn.rollback()
+                return None
+            result = decode_result(row.result) if row is not None else None
+            if result is not None:
+                hit = (result, row.finished_at)
+        return hit
+
+    def _execute_shared(self, conn, sql, params, key, lock, timeout_ms):
+        ids = {"namespace": LOCK_NAMESPACE, "lock": lock}
+        claim = conn.execute(text(TRY_LEAD_SQL), {**ids, "timeout": _timeout(timeout_ms)}).one()
+        if not claim.leader:
+            conn.execute(text(WAIT_SQL), ids)
+            try:
+                stored = conn.execute(text(READ_RESULT_SQL), {"key": key, "arrived_at": claim.arrived_at}).scalar()
+            except ProgrammingError:
+                stored = None
+                self._no_table(conn)
+            conn.commit()  # releases the shared lock
+            stored = decode_result(stored) if stored is not None else None
+            if stored is not None:
+                self.stats["shared"] += 1
+                return stored
+            # the other process failed; run it here without coordination
+            if timeout_ms:
+                conn.execute(text(SET_TIMEOUT_SQL), {"timeout": _timeout(timeout_ms)})
+            return conn.execute(text(sql), params).freeze()
+
+        result = conn.execute(text(sql), params).freeze()
+        self.stats["led"] += 1
+        try:
+            conn.execute(text(STORE_RESULT_SQL), {"key": key, "result": encode_result(result)})
+            if random.random() < PRUNE_PROBABILITY:
+                conn.execute(text(PRUNE_SQL))
+        except ProgrammingError:
+            self._no_table(conn)
+        conn.commit()  # publishes the result and releases the lock together
+        return result
+
+    def _no_table(self, conn):
+        conn.rollback()
+        log.warning("shared_result is missing (migrations/006); single flight is per process only")
+        self.mode = "process"
+
+
+class AsyncSingleFlight:
+    """SingleFlight for AsyncConnection; in-process waiters share one task."""
+
+    def __init__(self, mode="cluster"):
+        self.mode = mode
+        self._calls = {}            # key -> asyncio.Future
+        self._last_good = _LastGood()
+        self.stats = Counter()
+
+    async def execute(self, conn_factory, sql, params=None, timeout_ms=None):
+        """conn_factory() -> async context manager giving an AsyncConnection."""
+        key, lock = flight_key(sql, params)
+        pending = self._calls.get(key) if self.mode != "off" else None
+        if pending is not None:
+            self.stats["joined"] += 1
+            return await asyncio.shield(pending)
+        # shielded: a cancelled caller does not cancel the query for the others
+        pending = asyncio.ensure_future(self._lead(conn_factory, sql, params or {}, key, lock, timeout_ms))
+        if self.mode != "off":
+            self._calls[key] = pending
+        return await asyncio.shield(pending)
+
+    async def last_good(self, conn_factory, sql, params=None):
+        """(FrozenResult, finished_at) of the latest successful run of this query, or None."""
+        key, _ = flight_key(sql, params)
+        hit = self._last_good.get(key)
+        if hit is None and self.mode == "cluster":
+            async with conn_factory() as conn:
+                try:
+                    row = (await conn.execute(text(LAST_GOOD_SQL), {"key": key})).first()
+                except ProgrammingError:
+                    return None
+            result = decode_result(row.result) if row is not None else None
+            if result is not None:
+                hit = (result, row.finished_at)
+        return hit
+
+    async def _lead(self, conn_factory, sql, params, key, lock, timeout_ms):
+        try:
+            async with conn_factory() as conn:
+                if self.mode == "cluster":
+                    result = await self._execute_shared(conn, sql, params, key, lock, timeout_ms)
+                else:
+                    if timeout_ms:
+                        await conn.execute(text(SET_TIMEOUT_SQL), {"timeout": _timeout(timeout_ms)})
+                    result = (await conn.execute(text(sql), params)).freeze()
+                    self.stats["led"] += 1
+            self._last_good.put(key, result)
+            return result
+        finally:
+            if self._calls.get(key) is asyncio.current_task():
+                del self._calls[key]
+
+    async def _execute_shared(self, conn, sql, params, key, lock, timeout_ms):
+        ids = {"namespace": LOCK_NAMESPACE, "lock": lock}
+        claim = (await conn.execute(text(TRY_LEAD_SQL), {**ids, "timeout": _timeout(timeout_ms)})).one()
+        if not claim.leader:
+            await conn.execute(text(WAIT_SQL), ids)
+            try:
+                stored = (await conn.execute(text(READ_RESULT_SQL),
+                                             {"key": key, "arrived_at": claim.arrived_at})).scalar()
+            except ProgrammingError:
+                stored = None
+                await self._no_table(conn)
+            await conn.commit()
+            stored = decode_result(stored) if stored is not None else None
+            if stored is not None:
+                self.stats["shared"] += 1
+                return stored
+            if timeout_ms:
+                await conn.execute(text(SET_TIMEOUT_SQL), {"timeout": _timeout(timeout_ms)})
+            return (await conn.execute(text(sql), params)).freeze()
+
+        result = (await conn.execute(text(sql), params)).freeze()
+        self.stats["led"] += 1
+        try:
+            await conn.execute(text(STORE_RESULT_SQL), {"key": key, "result": encode_result(result)})
+            if random.random() < PRUNE_PROBABILITY:
+                await conn.execute(text(PRUNE_SQL))
+        except ProgrammingError:
+            await self._no_table(conn)
+        await conn.commit()
+        return result
+
+    async def _no_table(self, conn):
+        await conn.rollback()
+        log.warning("shared_result is missing (migrations/006); single flight is per process only")
+        self.mode = "process"